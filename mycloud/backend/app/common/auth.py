@@ -1,13 +1,2 @@
-from rest_framework_simplejwt.authentication import JWTAuthentication
-
-class CookieJWTAuthentication(JWTAuthentication):
-    def authenticate(self, request):
-        header = self.get_header(request)
-        if header is not None:
-            return super().authenticate(request)
-
-        raw_token = request.COOKIES.get("access_token")
-        if not raw_token:
-            return None
-        validated_token = self.get_validated_token(raw_token)
-        return (self.get_user(validated_token), validated_token)
+# исторический путь; реализация (с кэшем пользователя) — в app.users.authentication
+from app.users.authentication import CachedJWTAuthentication, CookieJWTAuthentication  # noqa: F401
@@ -0,0 +1,176 @@
+"""
+Пакетный учёт скачиваний: вместо UPDATE ... download_count = F() + 1 на каждый
+запрос хиты копятся в памяти процесса. Раз в COUNTER_FLUSH_INTERVAL секунд
+фоновый поток процесса сбрасывает их одним INSERT в общий журнал PendingHit
+(без блокировок строк File) и разбирает журнал в счётчики — одним UPDATE на
+модель (CASE по id). Горячий файл больше не держит блокировку строки на каждом
+скачивании; при гибели процесса теряется не больше одного интервала хитов.
+
+Журнал общий для всех процессов, его разбирает любой из них и команда flush_counters.
+COUNTER_FLUSH_INTERVAL = 0 — без буфера и журнала: один UPDATE ... F() + 1 на хит (как раньше).
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from django.apps import apps
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, F, IntegerField, Value, When, DateTimeField
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+BATCH = 500
+
+
+def flush_interval():
+    return getattr(settings, "COUNTER_FLUSH_INTERVAL", 0)
+
+
+class HitCounter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = defaultdict(int)
+        self._last_seen = {}
+        self._thread = None
+        self._pid = None
+
+    def hit(self, model, pk):
+        if flush_interval() <= 0:
+            updates = {"download_count": F("download_count") + 1}
+            if _has_last_downloaded(model):
+                updates["last_downloaded_at"] = timezone.now()
+            model.objects.filter(pk=pk).update(**updates)
+            return
+        key = (model, pk)
+        with self._lock:
+            self._pending[key] += 1
+            self._last_seen[key] = timezone.now()
+        self._ensure_thread()
+
+    def pending(self, model, pk):
+        return self._pending.get((model, pk), 0)
+
+    def pending_total(self):
+        with self._lock:
+            return sum(self._pending.values())
+
+    def _ensure_thread(self):
+        # после fork (gunicorn --preload) потока в дочернем процессе нет — заводим свой
+        if self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread.is_alive():
+                return
+            if self._thread is None:
+                # сброс при выходе нужен только процессу, который копит хиты в буфере
+                atexit.register(_flush_on_exit)
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="hit-counter", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(max(1, flush_interval()))
+            try:
+                self.flush()
+            except Exception:
+                logger.warning("Фоновый сброс счётчиков не удался", exc_info=True)
+            finally:
+                connection.close()
+
+    def flush(self):
+        """Буфер процесса — в журнал, журнал — в счётчики. Возвращает число обновлённых строк."""
+        self.spill()
+        return self.drain()
+
+    def spill(self):
+        """Переносит хиты из памяти процесса в журнал PendingHit; возвращает число записей."""
+        from app.files.models import PendingHit
+
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(int)
+            seen, self._last_seen = self._last_seen, {}
+        if not pending:
+            return 0
+        rows = [
+            PendingHit(model=model._meta.label, object_id=pk, count=n, last_at=seen[(model, pk)])
+            for (model, pk), n in pending.items()
+        ]
+        try:
+            PendingHit.objects.bulk_create(rows, batch_size=BATCH)
+        except Exception:
+            # не теряем хиты из-за временной ошибки БД — вернём их в буфер
+            logger.warning("Не удалось записать счётчики в журнал", exc_info=True)
+            with self._lock:
+                for key, n in pending.items():
+                    self._pending[key] += n
+                    self._last_seen.setdefault(key, seen[key])
+            return 0
+        return len(rows)
+
+    def drain(self):
+        """
+        Разбирает журнал в счётчики пачками по BATCH записей. Пачку, которую уже
+        разбирает другой процесс, пропускаем (SKIP LOCKED); при ошибке записи
+        остаются в журнале до следующего раза. Возвращает число обновлённых строк.
+        """
+        from app.files.models import PendingHit
+
+        updated = 0
+        while True:
+            try:
+                with transaction.atomic():
+                    batch = list(PendingHit.objects.select_for_update(skip_locked=True).order_by("id")[:BATCH])
+                    if not batch:
+                        return updated
+                    merged = {}
+                    for h in batch:
+                        count, last = merged.get((h.model, h.object_id), (0, h.last_at))
+                        merged[(h.model, h.object_id)] = (count + h.count, max(last, h.last_at))
+                    by_model = defaultdict(list)
+                    for (label, pk), (count, last) in merged.items():
+                        by_model[label].append((pk, count, last))
+                    for label, rows in by_model.items():
+                        self._apply(apps.get_model(label), rows)
+                    PendingHit.objects.filter(pk__in=[h.pk for h in batch]).delete()
+            except Exception:
+                logger.warning("Не удалось сбросить счётчики из журнала", exc_info=True)
+                return updated
+            updated += len(merged)
+            if len(batch) < BATCH:
+                return updated
+
+    @staticmethod
+    def _apply(model, rows):
+        updates = {
+            "download_count": F("download_count") + Case(
+                *[When(pk=pk, then=Value(n)) for pk, n, _ in rows],
+                default=Value(0), output_field=IntegerField(),
+            )
+        }
+        if _has_last_downloaded(model):
+            updates["last_downloaded_at"] = Case(
+                *[When(pk=pk, then=Value(ts)) for pk, _, ts in rows],
+                default=F("last_downloaded_at"), output_field=DateTimeField(),
+            )
+        model.objects.filter(pk__in=[pk for pk, _, _ in rows]).update(**updates)
+
+
+def _has_last_downloaded(model):
+    return any(f.name == "last_downloaded_at" for f in model._meta.fields)
+
+
+hits = HitCounter()
+
+
+def _flush_on_exit():
+    if not hits.pending_total():
+        return
+    try:
+        hits.flush()
+    except Exception:
+        logger.warning("Сброс счётчиков при выходе не удался", exc_info=True)
@@ -0,0 +1,229 @@
+"""
+Метрики процесса в текстовом формате Prometheus (/metrics).
+
+Реестр свой и живёт в памяти процесса: под gunicorn каждый воркер отдаёт
+собственные значения, Prometheus собирает их как отдельные таргеты (или через
+агрегацию по instance). Внешних зависимостей нет.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.db.backends.signals import connection_created
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)] + list(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(v):
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(n, "")) for n in self.label_names)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in sorted(items):
+            lines.extend(self._render_value(key, value))
+        return lines
+
+    def _render_value(self, key, value):
+        return [f"{self.name}{_labels(self.label_names, key)} {_number(value)}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+            state[1] += 1
+            state[2] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _render_value(self, key, state):
+        counts, total, summed = state
+        lines = []
+        for bound, count in zip(self.buckets + (float("inf"),), counts + [total]):
+            le = 'le="%s"' % _number(bound)
+            lines.append(f"{self.name}_bucket{_labels(self.label_names, key, [le])} {count}")
+        lines.append(f"{self.name}_count{_labels(self.label_names, key)} {total}")
+        lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {_number(summed)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _add(self, cls, name, *args, **kwargs):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = cls(name, *args, **kwargs)
+            return self._metrics[name]
+
+    def counter(self, name, help, labels=()):
+        return self._add(Counter, name, help, labels)
+
+    def gauge(self, name, help, labels=()):
+        return self._add(Gauge, name, help, labels)
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram, name, help, labels, buckets=buckets)
+
+    def collector(self, fn):
+        """fn() -> [(имя, тип, help, значение)] — значения, которые считаются в момент опроса."""
+        self._collectors.append(fn)
+        return fn
+
+    def render(self):
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        for fn in self._collectors:
+            for name, kind, help, value in fn():
+                lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}", f"{name} {_number(value)}"]
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+REQUEST_LATENCY = registry.histogram(
+    "mycloud_http_request_duration_seconds", "Время до отдачи заголовков ответа", ("view", "method"))
+REQUESTS = registry.counter("mycloud_http_requests_total", "Запросы по статусу", ("view", "method", "status"))
+REQUEST_BYTES = registry.counter("mycloud_http_request_bytes_total", "Принято байт тела запроса", ("view",))
+RESPONSE_BYTES = registry.counter("mycloud_http_response_bytes_total", "Отдано байт тела ответа", ("view",))
+REQUEST_QUERIES = registry.histogram(
+    "mycloud_http_request_db_queries", "SQL-запросов на HTTP-запрос", ("view",), buckets=COUNT_BUCKETS)
+STREAMS_IN_FLIGHT = registry.gauge("mycloud_http_streams_in_flight", "Отдаваемые сейчас потоковые ответы", ("view",))
+STREAM_DURATION = registry.histogram(
+    "mycloud_http_stream_duration_seconds", "Длительность потоковой отдачи целиком", ("view",))
+
+STORAGE_SECONDS = registry.counter(
+    "mycloud_storage_seconds_total", "Время в хранилище: encrypt/decrypt — крипто, read/write — ввод-вывод", ("op",))
+STORAGE_BYTES = registry.counter("mycloud_storage_bytes_total", "Байт прочитано/записано в хранилище", ("op",))
+
+
+@contextmanager
+def storage_timer(op, nbytes=None):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STORAGE_SECONDS.inc(time.perf_counter() - start, op=op)
+        if nbytes is not None:
+            STORAGE_BYTES.inc(nbytes, op=op)
+
+
+# счётчик SQL текущего запроса: contextvar доходит и до потоков sync_to_async
+_queries = ContextVar("metrics_queries", default=None)
+
+
+def _count_query(execute, sql, params, many, context):
+    box = _queries.get()
+    if box is not None:
+        box[0] += 1
+    return execute(sql, params, many, context)
+
+
+def install_query_counter(sender=None, connection=None, **kwargs):
+    """Обработчик connection_created: счётчик висит на каждом соединении постоянно."""
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+connection_created.connect(install_query_counter, dispatch_uid="metrics-queries")
+
+
+@contextmanager
+def count_queries():
+    box = [0]
+    token = _queries.set(box)
+    try:
+        yield box
+    finally:
+        _queries.reset(token)
+
+
+@registry.collector
+def _process_stats():
+    from app.common.counters import hits
+    from app.core import readcache
+    out = [("mycloud_download_hits_pending", "gauge", "Скачивания, ещё не сброшенные в БД", hits.pending_total())]
+    cache = readcache.stats()
+    if cache.get("enabled", True):
+        out += [
+            ("mycloud_read_cache_hits_total", "counter", "Попадания в кэш сегментов", cache["hits"]),
+            ("mycloud_read_cache_misses_total", "counter", "Промахи кэша сегментов", cache["misses"]),
+            ("mycloud_read_cache_evictions_total", "counter", "Вытеснения из кэша сегментов", cache["evictions"]),
+            ("mycloud_read_cache_bytes", "gauge", "Занято кэшем сегментов, байт", cache["bytes"]),
+        ]
+    return out
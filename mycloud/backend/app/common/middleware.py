@@ -1,10 +1,139 @@
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.db import connections
+
+from . import metrics
+
+
 class NoStoreForAuth:
-    def __init__(self, get_response): self.get_response = get_response
+    """
+    Ответы API авторизованным пользователям не кэшируются (no-store). Вьюха может
+    выставить свою политику (скачивания с ETag): resp.keep_cache_control = True.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
     def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self._acall(request)
         resp = self.get_response(request)
-        if request.path.startswith("/api/"):
-            resp["Vary"] = (resp.get("Vary", "") + ", Authorization, Cookie").strip(", ")
-            if getattr(request, "user", None) and request.user.is_authenticated:
-                resp["Cache-Control"] = "no-store, no-cache, must-revalidate, max-age=0"
-                resp["Pragma"] = "no-cache"
+        if self._applies(request, resp) and self._authenticated(request):
+            self._no_store(resp)
         return resp
+
+    async def _acall(self, request):
+        resp = await self.get_response(request)
+        # request.user может быть ленивым и идти в БД — только вне event loop
+        if self._applies(request, resp) and await sync_to_async(self._authenticated)(request):
+            self._no_store(resp)
+        return resp
+
+    @staticmethod
+    def _applies(request, resp):
+        if not request.path.startswith("/api/"):
+            return False
+        resp["Vary"] = (resp.get("Vary", "") + ", Authorization, Cookie").strip(", ")
+        return not getattr(resp, "keep_cache_control", False)
+
+    @staticmethod
+    def _authenticated(request):
+        user = getattr(request, "user", None)
+        return bool(user and user.is_authenticated)
+
+    @staticmethod
+    def _no_store(resp):
+        resp["Cache-Control"] = "no-store, no-cache, must-revalidate, max-age=0"
+        resp["Pragma"] = "no-cache"
+
+
+class MetricsMiddleware:
+    """
+    Метрики запроса для /metrics (app.common.metrics): латентность до заголовков
+    по имени маршрута, байты тела в обе стороны, число SQL внутри вьюхи. Потоковый
+    ответ учитывается до закрытия: пока он отдаётся, он в streams_in_flight.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        for conn in connections.all(initialized_only=True):
+            metrics.install_query_counter(connection=conn)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self._acall(request)
+        start = time.perf_counter()
+        with metrics.count_queries() as queries:
+            response = self.get_response(request)
+        return self._record(request, response, start, queries[0])
+
+    async def _acall(self, request):
+        start = time.perf_counter()
+        with metrics.count_queries() as queries:
+            response = await self.get_response(request)
+        return self._record(request, response, start, queries[0])
+
+    @staticmethod
+    def _view(request):
+        match = getattr(request, "resolver_match", None)
+        # только имя маршрута: сырой путь с id раздул бы число рядов метрики
+        return (match.view_name or match._func_path) if match else "unmatched"
+
+    def _record(self, request, response, start, queries):
+        view = self._view(request)
+        metrics.REQUEST_LATENCY.observe(time.perf_counter() - start, view=view, method=request.method)
+        metrics.REQUESTS.inc(view=view, method=request.method, status=response.status_code)
+        metrics.REQUEST_QUERIES.observe(queries, view=view)
+        try:
+            length = int(request.META.get("CONTENT_LENGTH") or 0)
+        except ValueError:
+            length = 0
+        if length:
+            metrics.REQUEST_BYTES.inc(length, view=view)
+        if response.streaming:
+            self._track_stream(response, view)
+        else:
+            metrics.RESPONSE_BYTES.inc(len(response.content), view=view)
+        return response
+
+    @staticmethod
+    def _track_stream(response, view):
+        # учёт в самой обёртке: её finally срабатывает и в конце потока, и при закрытии
+        # недочитанного (оборванного) ответа — Django закрывает streaming_content вместе с ним
+        content = response.streaming_content
+
+        def opened():
+            metrics.STREAMS_IN_FLIGHT.inc(view=view)
+            return time.perf_counter()
+
+        def closed(started):
+            metrics.STREAMS_IN_FLIGHT.dec(view=view)
+            metrics.STREAM_DURATION.observe(time.perf_counter() - started, view=view)
+
+        if response.is_async:
+            async def counted():
+                started = opened()
+                try:
+                    async for chunk in content:
+                        metrics.RESPONSE_BYTES.inc(len(chunk), view=view)
+                        yield chunk
+                finally:
+                    closed(started)
+        else:
+            def counted():
+                started = opened()
+                try:
+                    for chunk in content:
+                        metrics.RESPONSE_BYTES.inc(len(chunk), view=view)
+                        yield chunk
+                finally:
+                    closed(started)
+        response.streaming_content = counted()
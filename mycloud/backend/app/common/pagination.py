@@ -0,0 +1,78 @@
+import base64
+import json
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset-пагинация по (поле сортировки, id): страница берётся условием
+    (field, id) < (last_field, last_id), без OFFSET, поэтому стоимость не растёт
+    с номером страницы. Включается параметром limit или cursor; без них список
+    отдаётся целиком, как раньше. Поле сортировки берётся из view.keyset_ordering.
+    """
+    limit_query_param = "limit"
+    cursor_query_param = "cursor"
+    default_limit = 100
+    max_limit = 1000
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if self.limit_query_param not in params and self.cursor_query_param not in params:
+            return None
+        try:
+            limit = int(params.get(self.limit_query_param) or self.default_limit)
+        except ValueError:
+            raise ValidationError({self.limit_query_param: "Ожидается целое число"})
+        limit = max(1, min(limit, self.max_limit))
+
+        ordering = getattr(view, "keyset_ordering", "-uploaded_at")
+        desc = ordering.startswith("-")
+        name = ordering.lstrip("-")
+        field = queryset.model._meta.get_field(name)
+        queryset = queryset.order_by(ordering, "-id" if desc else "id")
+
+        cursor = params.get(self.cursor_query_param)
+        if cursor:
+            value, last_id = self._decode(cursor, field)
+            op = "lt" if desc else "gt"
+            queryset = queryset.filter(
+                Q(**{f"{name}__{op}": value}) | Q(**{name: value, f"id__{op}": last_id})
+            )
+
+        page = list(queryset[:limit + 1])
+        self.request = request
+        self.next_cursor = None
+        if len(page) > limit:
+            page = page[:limit]
+            last = page[-1]
+            self.next_cursor = self._encode(field.value_to_string(last), last.pk)
+        return page
+
+    def get_paginated_response(self, data):
+        next_url = None
+        if self.next_cursor:
+            next_url = replace_query_param(
+                self.request.build_absolute_uri(), self.cursor_query_param, self.next_cursor
+            )
+        return Response({"next": next_url, "results": data})
+
+    @staticmethod
+    def _encode(value, pk):
+        raw = json.dumps([value, pk], separators=(",", ":")).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+    def _decode(self, cursor, field):
+        try:
+            raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+            value, pk = json.loads(raw)
+            # значение из курсора приводится к типу поля здесь же: мусор — 400, а не 500
+            value = field.to_python(value)
+            if value is None:
+                raise ValueError(cursor)
+            return value, int(pk)
+        except Exception:
+            raise ValidationError({self.cursor_query_param: "Некорректный курсор"})
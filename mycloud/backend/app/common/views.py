@@ -0,0 +1,43 @@
+"""
+Служебные эндпоинты вне /api/: /healthz для HEALTHCHECK контейнера и /metrics
+для Prometheus. Простые Django-вьюхи — без DRF-аутентификации и троттлинга.
+"""
+import hmac
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse, JsonResponse
+from django.views.decorators.http import require_GET
+
+from app.files.models import efs
+from . import metrics
+
+PROBE_NAME = ".healthz"
+
+
+@require_GET
+def healthz(request):
+    """200, если отвечают БД и хранилище; иначе 503 с причиной по каждой проверке."""
+    checks = {}
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        checks["database"] = "ok"
+    except Exception as e:
+        checks["database"] = f"error: {e.__class__.__name__}"
+    try:
+        efs.exists(PROBE_NAME)  # stat на диске / HEAD в S3 — без листинга
+        checks["storage"] = "ok"
+    except Exception as e:
+        checks["storage"] = f"error: {e.__class__.__name__}"
+    healthy = all(v == "ok" for v in checks.values())
+    return JsonResponse({"status": "ok" if healthy else "error", **checks}, status=200 if healthy else 503)
+
+
+@require_GET
+def metrics_view(request):
+    token = getattr(settings, "METRICS_TOKEN", "")
+    if token:
+        given = request.headers.get("Authorization", "").removeprefix("Bearer ")
+        if not hmac.compare_digest(given.encode(), token.encode()):
+            return HttpResponse(status=401)
+    return HttpResponse(metrics.registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
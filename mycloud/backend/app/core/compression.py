@@ -0,0 +1,86 @@
+"""
+Сжатие открытого текста перед шифрованием (формат сегментов v2, см. app.core.storage).
+
+Каждый сегмент сжимается независимо, чтобы сохранить произвольный доступ.
+zstd — если установлен пакет zstandard, иначе zlib. Уже сжатые данные
+(по MIME-типу или по пробному сжатию начала файла) пишутся без сжатия.
+"""
+import mimetypes
+import zlib
+from django.conf import settings
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - без zstandard остаётся zlib
+    zstandard = None
+
+NONE, ZLIB, ZSTD = 0, 2, 3  # совпадает с версией формата в заголовке файла
+
+# форматы, которые внутри уже сжаты
+PRECOMPRESSED_PREFIXES = ("image/", "video/", "audio/")
+PRECOMPRESSED_TYPES = {
+    "application/zip", "application/gzip", "application/x-gzip", "application/x-bzip2",
+    "application/x-xz", "application/x-7z-compressed", "application/x-rar-compressed",
+    "application/vnd.rar", "application/zstd", "application/pdf", "application/java-archive",
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "application/vnd.openxmlformats-officedocument.presentationml.presentation",
+}
+COMPRESSIBLE_IMAGES = {"image/svg+xml", "image/bmp", "image/x-ms-bmp", "image/tiff"}
+
+SAMPLE_SIZE = 64 * 1024
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 3
+
+
+def preferred():
+    mode = getattr(settings, "STORAGE_COMPRESSION", "auto")
+    if mode == "off":
+        return NONE
+    if mode == "zlib" or zstandard is None:
+        return ZLIB
+    return ZSTD
+
+
+def content_type(content):
+    ctype = getattr(content, "content_type", None)
+    if not ctype:
+        ctype = mimetypes.guess_type(getattr(content, "name", None) or "")[0]
+    return (ctype or "").split(";")[0].strip().lower()
+
+
+def precompressed(ctype):
+    if ctype in COMPRESSIBLE_IMAGES:
+        return False
+    return ctype in PRECOMPRESSED_TYPES or ctype.startswith(PRECOMPRESSED_PREFIXES)
+
+
+def choose(content, sample):
+    """Кодек для файла: по MIME-типу и по тому, насколько сжимается начало содержимого."""
+    codec = preferred()
+    if codec == NONE or precompressed(content_type(content)):
+        return NONE
+    if sample:
+        ratio = getattr(settings, "STORAGE_COMPRESSION_MIN_RATIO", 0.9)
+        if len(zlib.compress(sample[:SAMPLE_SIZE], 1)) > ratio * len(sample[:SAMPLE_SIZE]):
+            return NONE
+    return codec
+
+
+def compress(codec, data):
+    if codec == ZSTD:
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return zlib.compress(data, ZLIB_LEVEL)
+
+
+def decompress(codec, data, limit):
+    """limit — размер сегмента: больше распаковывать нечего (защита от «zip-бомбы»)."""
+    if codec == ZSTD:
+        if zstandard is None:
+            raise IOError("Файл сжат zstd, но пакет zstandard не установлен")
+        return zstandard.ZstdDecompressor().decompress(data, max_output_size=limit)
+    d = zlib.decompressobj()
+    out = d.decompress(data, limit)
+    if d.unconsumed_tail:
+        raise ValueError("Распакованный сегмент больше размера сегмента")
+    return out
@@ -0,0 +1,109 @@
+"""
+Кэш расшифрованных сегментов в памяти процесса (READ_CACHE_MB > 0).
+
+Ключ — (имя, соль файла, номер сегмента): соль из заголовка уникальна для
+каждой записи файла, поэтому перезаписанный объект никогда не получит чужие
+сегменты. Вытеснение — LRU по бюджету в байтах; файлы крупнее READ_CACHE_MAX_FILE_MB
+не кэшируются, чтобы одно скачивание большого файла не вымывало горячие.
+"""
+import threading
+from collections import OrderedDict
+from django.conf import settings
+
+
+class SegmentCache:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+        self._by_name = {}
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            data = self._data.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.bytes -= len(old)
+            self._data[key] = data
+            self._by_name.setdefault(key[0], set()).add(key)
+            self.bytes += len(data)
+            while self.bytes > self.max_bytes:
+                evicted, value = self._data.popitem(last=False)
+                self._forget_key(evicted)
+                self.bytes -= len(value)
+                self.evictions += 1
+
+    def _forget_key(self, key):
+        keys = self._by_name.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_name[key[0]]
+
+    def invalidate(self, name):
+        with self._lock:
+            for key in self._by_name.pop(name, ()):
+                self.bytes -= len(self._data.pop(key))
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._by_name.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._data),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Кэш процесса или None, если он выключен (READ_CACHE_MB=0)."""
+    global _cache
+    budget = getattr(settings, "READ_CACHE_BYTES", 0)
+    if budget <= 0:
+        return None
+    if _cache is None or _cache.max_bytes != budget:
+        with _cache_lock:
+            if _cache is None or _cache.max_bytes != budget:
+                _cache = SegmentCache(budget)
+    return _cache
+
+
+def cacheable(plain_size):
+    return plain_size <= getattr(settings, "READ_CACHE_MAX_FILE", 0)
+
+
+def invalidate(name):
+    if _cache is not None:
+        _cache.invalidate(name)
+
+
+def stats():
+    cache = get_cache()
+    return cache.stats() if cache is not None else {"enabled": False}
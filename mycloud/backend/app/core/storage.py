@@ -1,53 +1,727 @@
-# app/core/storage.py
 import os
+import io
 import base64
+import struct
+import hmac
 import hashlib
-from django.core.files.storage import FileSystemStorage
-from django.core.files.base import ContentFile
+import itertools
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from django.core.files.storage import FileSystemStorage, Storage
+from django.core.files.base import ContentFile, File
 from django.conf import settings
+from django.utils.deconstruct import deconstructible
 from cryptography.fernet import Fernet, InvalidToken
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 
-class EncryptedFileSystemStorage(FileSystemStorage):
-    def __init__(self, *args, **kwargs):
-        location = kwargs.pop("location", settings.MEDIA_ROOT)
-        super().__init__(location=location, *args, **kwargs)
+from app.common.metrics import STORAGE_BYTES, STORAGE_SECONDS, storage_timer
+from . import compression, readcache
+
+# Сегментированный формат на диске:
+#   заголовок: MAGIC | версия | размер сегмента | соль файла (16 байт)
+#   далее сегменты: AES-256-GCM(plaintext[i*size:(i+1)*size]) + тег 16 байт.
+# Ключ файла выводится из ENCRYPTION_KEY и соли, nonce = (признак последнего, номер),
+# поэтому перестановка, подмена и обрезка сегментов ловятся при расшифровке.
+#
+# Версии 2 (zlib) и 3 (zstd) — сегмент сжимается перед шифрованием: внутри
+# шифртекста байт-признак (сжат/нет) и данные, длины сегментов разные. В конце
+# файла зашифрованный индекс (размер открытого текста и длины сегментов, nonce с
+# признаком 2) и 4 байта его длины — по индексу seek остаётся дешёвым.
+MAGIC = b"\x89MCE"
+FORMAT_VERSION = 1
+HEADER = struct.Struct(">4sBI16s")
+TAG_SIZE = 16
+DEFAULT_SEGMENT_SIZE = 64 * 1024
+INDEX_HEAD = struct.Struct(">QI")
+INDEX_TRAILER = struct.Struct(">I")
+INDEX_MARK = 2
+
+
+class CorruptedFileError(IOError):
+    """Сегмент не прошёл проверку подлинности (файл повреждён или подменён)."""
+
+
+# Пул для шифрования/расшифровки независимых сегментов одного файла.
+# ENCRYPTION_WORKERS <= 1 — всё inline в потоке запроса. ENCRYPTION_POOL=thread
+# опирается на то, что AES-GCM выполняется в OpenSSL; process — на случай,
+# если сборка cryptography держит GIL (сегменты копируются в дочерние процессы).
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def crypto_pool():
+    global _pool
+    workers = getattr(settings, "ENCRYPTION_WORKERS", 1)
+    if workers <= 1:
+        return None
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                kind = getattr(settings, "ENCRYPTION_POOL", "thread")
+                executor = ProcessPoolExecutor if kind == "process" else ThreadPoolExecutor
+                _pool = executor(max_workers=workers)
+    return _pool
+
+
+def ordered_map(fn, items):
+    """
+    map с сохранением порядка: в полёте не больше 2 * ENCRYPTION_WORKERS задач,
+    поэтому поток остаётся потоком и память ограничена окном сегментов.
+    """
+    pool = crypto_pool()
+    if pool is None:
+        for args in items:
+            yield fn(*args)
+        return
+    depth = 2 * getattr(settings, "ENCRYPTION_WORKERS", 1)
+    pending = deque()
+    for args in items:
+        pending.append(pool.submit(fn, *args))
+        if len(pending) >= depth:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def _nonce(index: int, last: bool) -> bytes:
+    return struct.pack(">IQ", int(last), index)
+
+
+# Время encrypt/decrypt (вместе со сжатием) считается там, где выполняется сегмент:
+# с ENCRYPTION_POOL=process оно остаётся в дочерних процессах и в /metrics не видно.
+def seal_segment(key: bytes, header: bytes, index: int, data: bytes, last: bool, codec: int = 0) -> bytes:
+    with storage_timer("encrypt", len(data)):
+        if codec:
+            packed = compression.compress(codec, data)
+            data = b"\x01" + packed if len(packed) < len(data) else b"\x00" + data
+        return AESGCM(key).encrypt(_nonce(index, last), data, header)
+
+
+def open_segment(key: bytes, header: bytes, index: int, data: bytes, last: bool, codec: int = 0) -> bytes:
+    with storage_timer("decrypt", len(data)):
+        try:
+            plain = AESGCM(key).decrypt(_nonce(index, last), data, header)
+        except InvalidTag:
+            raise CorruptedFileError(f"Сегмент {index} не прошёл проверку подлинности")
+        if not codec:
+            return plain
+        if plain[:1] != b"\x01":
+            return plain[1:]
+        try:
+            return compression.decompress(codec, plain[1:], HEADER.unpack(header)[2])
+        except Exception as e:
+            raise CorruptedFileError(f"Сегмент {index} не распаковывается: {e}")
+
+
+def _timed_writes(chunks):
+    """Время, пока потребитель (backend.save) пишет очередной кусок, — это запись в хранилище."""
+    for chunk in chunks:
+        start = time.perf_counter()
+        yield chunk
+        STORAGE_SECONDS.inc(time.perf_counter() - start, op="write")
+        STORAGE_BYTES.inc(len(chunk), op="write")
+
+
+class SegmentCipher:
+    def __init__(self, master_key: bytes, salt: bytes, segment_size: int, codec: int = compression.NONE):
+        self.salt = salt
+        self.segment_size = segment_size
+        self.codec = codec
+        self.header = HEADER.pack(MAGIC, codec or FORMAT_VERSION, segment_size, salt)
+        self.key = HKDF(
+            algorithm=hashes.SHA256(), length=32, salt=salt, info=b"mycloud-segments-v1"
+        ).derive(master_key)
+
+    def seal(self, index: int, data: bytes, last: bool) -> bytes:
+        return seal_segment(self.key, self.header, index, data, last, self.codec)
+
+    def open(self, index: int, data: bytes, last: bool) -> bytes:
+        return open_segment(self.key, self.header, index, data, last, self.codec)
+
+    def open_many(self, items):
+        """Расшифровка нескольких сегментов [(index, data, last)] через пул, в исходном порядке."""
+        return list(ordered_map(open_segment, ((self.key, self.header, *item, self.codec) for item in items)))
+
+    @property
+    def stored_segment_size(self) -> int:
+        return self.segment_size + TAG_SIZE
+
+    def segment_count(self, stored_size: int) -> int:
+        body = stored_size - HEADER.size
+        return max(1, -(-body // self.stored_segment_size))
+
+    def plain_size(self, stored_size: int) -> int:
+        body = stored_size - HEADER.size
+        return body - self.segment_count(stored_size) * TAG_SIZE
+
+    def read_index(self, fh, stored_size: int):
+        """Индекс сжатого файла: (размер открытого текста, смещения начала сегментов + конец)."""
+        if stored_size < HEADER.size + INDEX_TRAILER.size:
+            raise CorruptedFileError("Файл обрезан: нет индекса сегментов")
+        fh.seek(stored_size - INDEX_TRAILER.size)
+        (length,) = INDEX_TRAILER.unpack(fh.read(INDEX_TRAILER.size))
+        start = stored_size - INDEX_TRAILER.size - length
+        if start < HEADER.size:
+            raise CorruptedFileError("Повреждён индекс сегментов")
+        fh.seek(start)
+        try:
+            index = AESGCM(self.key).decrypt(_nonce(0, INDEX_MARK), fh.read(length), self.header)
+        except InvalidTag:
+            raise CorruptedFileError("Индекс сегментов не прошёл проверку подлинности")
+        plain_size, count = INDEX_HEAD.unpack_from(index)
+        lengths = struct.unpack_from(f">{count}I", index, INDEX_HEAD.size)
+        offsets = [HEADER.size]
+        for n in lengths:
+            offsets.append(offsets[-1] + n)
+        if offsets[-1] != start:
+            raise CorruptedFileError("Индекс сегментов не совпадает с файлом")
+        return plain_size, offsets
+
+    def _split(self, chunks):
+        buf = bytearray()
+        index = 0
+        size = self.segment_size
+        for chunk in chunks:
+            buf += chunk
+            while len(buf) > size:
+                yield self.key, self.header, index, bytes(buf[:size]), False, self.codec
+                del buf[:size]
+                index += 1
+        yield self.key, self.header, index, bytes(buf), True, self.codec
+
+    def encrypt_chunks(self, chunks):
+        """
+        Шифрует поток кусков произвольной длины. В памяти держим входной кусок
+        и окно сегментов пула (один сегмент без пула); последний сегмент (возможно
+        пустой) помечается флагом, чтобы обрезку файла нельзя было выдать за конец.
+        """
+        yield self.header
+        if not self.codec:
+            yield from ordered_map(seal_segment, self._split(chunks))
+            return
+        plain_size = 0
+
+        def counted(chunks):
+            nonlocal plain_size
+            for chunk in chunks:
+                plain_size += len(chunk)
+                yield chunk
+
+        lengths = []
+        for sealed in ordered_map(seal_segment, self._split(counted(chunks))):
+            lengths.append(len(sealed))
+            yield sealed
+        index = INDEX_HEAD.pack(plain_size, len(lengths)) + struct.pack(f">{len(lengths)}I", *lengths)
+        sealed = AESGCM(self.key).encrypt(_nonce(0, INDEX_MARK), index, self.header)
+        yield sealed + INDEX_TRAILER.pack(len(sealed))
+
+
+class EncryptingFile(File):
+    """Обёртка над загружаемым содержимым: chunks() отдаёт уже зашифрованные байты."""
+
+    def __init__(self, content, cipher: SegmentCipher):
+        super().__init__(None, name=getattr(content, "name", None))
+        self.content = content
+        self.cipher = cipher
+
+    def chunks(self, chunk_size=None):
+        return _timed_writes(self.cipher.encrypt_chunks(self.content.chunks()))
+
+
+class DecryptedFile(io.RawIOBase):
+    """
+    Файловый объект только на чтение поверх сегментированного файла.
+    Расшифровывает сегменты по требованию, в памяти держит один сегмент,
+    поддерживает seek — читать можно с любого места. С cache_name сегменты
+    берутся из кэша процесса (app.core.readcache) и кладутся в него.
+    """
+
+    def __init__(self, fh, cipher: SegmentCipher, stored_size: int, name=None, cache_name=None):
+        super().__init__()
+        self.fh = fh
+        self.cipher = cipher
+        self.name = name
+        if cipher.codec:
+            self.size, self._offsets = cipher.read_index(fh, stored_size)
+            self._count = len(self._offsets) - 1
+        else:
+            self.size, self._offsets = cipher.plain_size(stored_size), None
+            self._count = cipher.segment_count(stored_size)
+        self._stored_size = stored_size
+        self._cache = readcache.get_cache() if cache_name and readcache.cacheable(self.size) else None
+        self._cache_name = cache_name
+        self._pos = 0
+        self._index = -1
+        self._window = {}
+        self._pool_depth = 2 * getattr(settings, "ENCRYPTION_WORKERS", 1) if crypto_pool() else 1
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError("negative seek position")
+        self._pos = offset
+        return self._pos
+
+    def _offset(self, index: int) -> int:
+        """Начало сегмента index в хранилище (для index == count — конец данных)."""
+        if self._offsets is not None:
+            return self._offsets[index]
+        return min(HEADER.size + index * self.cipher.stored_segment_size, self._stored_size)
+
+    def _load(self, index: int) -> bytes:
+        if index in self._window:
+            return self._window[index]
+        if self._cache is not None:
+            data = self._cache.get((self._cache_name, self.cipher.salt, index))
+            if data is not None:
+                self._index = index
+                return data
+        # последовательное чтение — читаем окно сегментов одним вызовом и
+        # расшифровываем параллельно; произвольный доступ — ровно один сегмент
+        batch = 1
+        if self._pool_depth > 1 and index == self._index + 1:
+            batch = min(self._pool_depth, self._count - index)
+        start = self._offset(index)
+        with storage_timer("read"):
+            self.fh.seek(start)
+            raw = self.fh.read(self._offset(index + batch) - start)
+        STORAGE_BYTES.inc(len(raw), op="read")
+        items = [
+            (i, raw[self._offset(i) - start:self._offset(i + 1) - start], i == self._count - 1)
+            for i in range(index, index + batch)
+        ]
+        plain = self.cipher.open_many(items) if batch > 1 else [self.cipher.open(*items[0])]
+        self._window = dict(zip(range(index, index + batch), plain))
+        self._index = index + batch - 1
+        if self._cache is not None:
+            for i, data in self._window.items():
+                self._cache.put((self._cache_name, self.cipher.salt, i), data)
+        return self._window[index]
+
+    def read(self, size=-1):
+        if self._pos >= self.size:
+            return b""
+        if size is None or size < 0:
+            size = self.size - self._pos
+        size = min(size, self.size - self._pos)
+        out = []
+        seg_size = self.cipher.segment_size
+        while size > 0:
+            index, offset = divmod(self._pos, seg_size)
+            part = self._load(index)[offset:offset + size]
+            out.append(part)
+            self._pos += len(part)
+            size -= len(part)
+        return b"".join(out)
+
+    def readinto(self, b):
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+    def chunks(self, chunk_size=None):
+        chunk_size = chunk_size or self.cipher.segment_size
+        self.seek(0)
+        while True:
+            data = self.read(chunk_size)
+            if not data:
+                break
+            yield data
+
+    def close(self):
+        try:
+            self.fh.close()
+        finally:
+            super().close()
+
+
+def default_backend():
+    """Хранилище зашифрованных байтов по STORAGE_BACKEND: local (MEDIA_ROOT) или s3."""
+    if getattr(settings, "STORAGE_BACKEND", "local") == "s3":
+        from .s3 import S3Storage
+        return S3Storage()
+    return FileSystemStorage()
+
+
+class IterFile(File):
+    """Содержимое из готового итератора кусков: backend.save пишет его потоком."""
+
+    def __init__(self, iterable, name=None):
+        super().__init__(None, name=name)
+        self.iterable = iterable
+
+    def chunks(self, chunk_size=None):
+        return iter(self.iterable)
+
+
+class StreamWriter:
+    """
+    Запись «проталкиванием»: write() по мере поступления данных (upload handler),
+    close() — конец файла. Сам save() идёт в отдельном потоке и забирает куски из
+    очереди на depth элементов, поэтому backend (диск или S3 multipart) и формат
+    те же, что у save(), а в памяти не больше depth кусков. Если поток записи
+    упал или данных нет дольше stall_timeout, недописанный файл удаляется.
+    """
+    _END = object()
+    _ABORT = object()
+
+    def __init__(self, storage, name, content_type=None, depth=8, stall_timeout=300):
+        self.storage = storage
+        # имя выбираем заранее: save() оставит свободное имя как есть, и при сбое
+        # удаляется именно недописанный файл, а не чужой под запрошенным именем
+        self.name = storage.get_available_name(name)
+        self.size = 0
+        self.stall_timeout = stall_timeout
+        self._queue = queue.Queue(maxsize=depth)
+        self._error = None
+        source = IterFile(self._feed(), name=name)
+        source.content_type = content_type  # для выбора сжатия по MIME-типу
+        self._thread = threading.Thread(target=self._run, args=(source,), name="storage-writer", daemon=True)
+        self._thread.start()
+
+    def _feed(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=self.stall_timeout)
+            except queue.Empty:
+                raise IOError(f"Нет данных для {self.name} дольше {self.stall_timeout} с")
+            if item is self._END:
+                return
+            if item is self._ABORT:
+                raise IOError(f"Запись {self.name} прервана")
+            yield item
+
+    def _run(self, source):
+        try:
+            self.name = self.storage.save(self.name, source)
+        except BaseException as e:
+            self._error = e
+            try:
+                if self.storage.exists(self.name):
+                    self.storage.delete(self.name)
+            except Exception:
+                pass
+
+    def _put(self, item):
+        while True:
+            if self._error is not None:
+                raise self._error
+            try:
+                self._queue.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                if not self._thread.is_alive():
+                    raise self._error or IOError(f"Запись {self.name} остановилась")
+
+    def write(self, data):
+        self._put(bytes(data))
+        self.size += len(data)
+
+    def close(self):
+        """Дописывает хвост (последний сегмент, индекс) и возвращает итоговое имя."""
+        self._put(self._END)
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+        return self.name
+
+    def abort(self):
+        if self._thread.is_alive():
+            try:
+                self._put(self._ABORT)
+            except Exception:
+                pass
+            self._thread.join()
+
+
+@deconstructible
+class EncryptedStorage(Storage):
+    """
+    Шифрующая обёртка над любым Django Storage: в backend попадают только
+    зашифрованные байты, имена, проверки и удаление делегируются ему.
+    Без аргумента backend выбирается по STORAGE_BACKEND.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend if backend is not None else default_backend()
 
         key = getattr(settings, "ENCRYPTION_KEY", None)
         if not key:
             key = "dev-secret-key"
         try:
             self.fernet = Fernet(key)
+            self.master_key = base64.urlsafe_b64decode(key)
         except Exception:
             k = hashlib.sha256(key.encode()).digest()
             self.fernet = Fernet(base64.urlsafe_b64encode(k))
+            self.master_key = k
+        self.segment_size = getattr(settings, "ENCRYPTION_SEGMENT_SIZE", DEFAULT_SEGMENT_SIZE)
+
+    def _open(self, name, mode="rb"):
+        return self.backend.open(name, mode)
+
+    def exists(self, name):
+        return self.backend.exists(name)
+
+    def delete(self, name):
+        readcache.invalidate(name)
+        self.backend.delete(name)
+
+    def size(self, name):
+        return self.backend.size(name)
+
+    def listdir(self, path):
+        return self.backend.listdir(path)
+
+    def path(self, name):
+        return self.backend.path(name)
+
+    def url(self, name):
+        return self.backend.url(name)
+
+    def get_modified_time(self, name):
+        return self.backend.get_modified_time(name)
+
+    def get_available_name(self, name, max_length=None):
+        return self.backend.get_available_name(name, max_length=max_length)
+
+    def walk(self, path=""):
+        """Имена всех объектов под path (рекурсивно через listdir backend'а)."""
+        try:
+            dirs, files = self.listdir(path)
+        except FileNotFoundError:
+            return
+        for fn in files:
+            yield f"{path}/{fn}" if path else fn
+        for d in dirs:
+            yield from self.walk(f"{path}/{d}" if path else d)
+
+    def content_hasher(self):
+        """
+        HMAC-SHA256 от открытого текста на ключе, выведенном из ENCRYPTION_KEY:
+        одинаковые файлы дают одинаковый дайджест, но по БД нельзя проверить,
+        лежит ли у нас известный файл.
+        """
+        key = HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=b"mycloud-digest-v1").derive(self.master_key)
+        return hmac.new(key, digestmod=hashlib.sha256)
+
+    def new_cipher(self, codec=compression.NONE) -> SegmentCipher:
+        return SegmentCipher(self.master_key, os.urandom(16), self.segment_size, codec)
+
+    def cipher_from_header(self, header: bytes):
+        """Возвращает SegmentCipher по заголовку или None для старого формата (целый Fernet-токен)."""
+        if len(header) < HEADER.size:
+            return None
+        magic, version, segment_size, salt = HEADER.unpack(header[:HEADER.size])
+        if magic != MAGIC or version not in (FORMAT_VERSION, compression.ZLIB, compression.ZSTD):
+            return None
+        codec = compression.NONE if version == FORMAT_VERSION else version
+        return SegmentCipher(self.master_key, salt, segment_size, codec)
 
     def _save(self, name, content):
-        name = self.get_available_name(name)
-        full_path = self.path(name)
-        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        chunks, sample = _peek(content.chunks(), compression.SAMPLE_SIZE)
+        codec = compression.choose(content, sample)
+        return self.backend.save(name, EncryptingFile(IterFile(chunks, name=content.name), self.new_cipher(codec)))
+
+    def open_writer(self, name, content_type=None):
+        """Потоковая запись без готового содержимого на руках, см. StreamWriter."""
+        return StreamWriter(self, name, content_type)
+
+    def _random_access(self):
+        """Локальный диск умеет писать в середину файла, объектные хранилища — нет."""
         try:
-            content.seek(0)
-        except Exception:
-            pass
-        data = content.read()
-        token = self.fernet.encrypt(data)
+            self.backend.path("")
+        except NotImplementedError:
+            return False
+        return True
+
+    @staticmethod
+    def _parts_dir(name):
+        return f"{name}.parts"
+
+    def begin_upload(self, name):
+        """
+        Создаёт файл-заготовку (только заголовок) для поэтапной загрузки.
+        Возвращает итоговое имя в хранилище. Такие файлы не сжимаются: куски
+        пишутся по фиксированным смещениям сегментов.
+        """
+        return self.backend.save(name, ContentFile(self.new_cipher().header))
+
+    def write_chunk(self, name, offset, stream, length, total_size):
+        """
+        Шифрует length байт из stream и пишет их на место сегментов, начиная с offset.
+        offset должен быть кратен размеру сегмента; итоговый размер файла нужен,
+        чтобы пометить последний сегмент. Куски можно писать в любом порядке.
+        На backend'ах без записи в середину кусок ложится отдельным объектом
+        в <name>.parts/, склейка — в finish_upload.
+        """
+        with self.backend.open(name, "rb") as fh:
+            cipher = self.cipher_from_header(fh.read(HEADER.size))
+        if cipher is None or cipher.codec:
+            raise ValueError("Файл не является заготовкой поэтапной загрузки")
+        seg = cipher.segment_size
+        if offset % seg or offset + length > total_size:
+            raise ValueError("Смещение или длина куска не совпадают с сегментами")
+        last = max(0, -(-total_size // seg) - 1)
+        index = offset // seg
+
+        def pieces(index=index, remaining=length):
+            while True:
+                n = min(seg, remaining)
+                data = _read_exact(stream, n)
+                if len(data) != n:
+                    raise ValueError("Получено меньше данных, чем заявлено")
+                yield cipher.key, cipher.header, index, data, index == last
+                index += 1
+                remaining -= n
+                if remaining <= 0:
+                    break
+
+        sealed = ordered_map(seal_segment, pieces())
+        if self._random_access():
+            with open(self.backend.path(name), "r+b") as fh:
+                fh.seek(HEADER.size + index * cipher.stored_segment_size)
+                for data in sealed:
+                    with storage_timer("write", len(data)):
+                        fh.write(data)
+            return
+        part = f"{self._parts_dir(name)}/{index:010d}"
+        if self.backend.exists(part):
+            self.backend.delete(part)
+        head = [cipher.header] if index == 0 else []
+        self.backend.save(part, IterFile(_timed_writes(itertools.chain(head, sealed))))
+
+    def finish_upload(self, name):
+        """Склеивает куски поэтапной загрузки в итоговый объект (на локальном диске — ничего не делает)."""
+        if self._random_access():
+            return
+        parts_dir = self._parts_dir(name)
+        _dirs, files = self.backend.listdir(parts_dir)
+        parts = [f"{parts_dir}/{fn}" for fn in sorted(files)]
+        compose = getattr(self.backend, "compose", None)
+        if compose is not None:
+            compose(name, parts)
+        else:
+            self.backend.delete(name)
+            chunks = itertools.chain.from_iterable(self.backend.open(p, "rb").chunks() for p in parts)
+            if self.backend.save(name, IterFile(chunks)) != name:
+                raise IOError(f"Хранилище сохранило {name} под другим именем")
+        readcache.invalidate(name)
+        for part in parts:
+            self.backend.delete(part)
 
-        enc = ContentFile(token)
-        return super()._save(name, enc)
+    def abort_upload(self, name):
+        if not self._random_access():
+            try:
+                _dirs, files = self.backend.listdir(self._parts_dir(name))
+            except FileNotFoundError:
+                files = []
+            for fn in files:
+                self.backend.delete(f"{self._parts_dir(name)}/{fn}")
+        if self.backend.exists(name):
+            self.backend.delete(name)
+
+    def _open_raw(self, name):
+        try:
+            fh = self.backend.open(name, "rb")
+        except FileNotFoundError:
+            return None, None
+        return fh, self.cipher_from_header(fh.read(HEADER.size))
+
+    def verify(self, name):
+        """
+        Полная проверка подлинности: расшифровывает все сегменты (или Fernet-токен
+        старого формата). Бросает CorruptedFileError, если содержимое повреждено.
+        """
+        fh, cipher = self._open_raw(name)
+        if fh is None:
+            raise FileNotFoundError(name)
+        with fh:
+            if cipher is None:
+                fh.seek(0)
+                try:
+                    self.fernet.decrypt(fh.read())
+                except InvalidToken:
+                    raise CorruptedFileError("Fernet-токен не прошёл проверку подлинности")
+                return
+            for _ in DecryptedFile(fh, cipher, fh.size).chunks():
+                pass
 
     def open_decrypted(self, name):
         """
-        Открываем файл, читаем, расшифровываем и возвращаем ContentFile (file-like).
+        Открываем файл на чтение с расшифровкой и возвращаем file-like.
+        Сегментированный формат читается потоково (DecryptedFile),
+        старый формат (один Fernet-токен) — целиком в ContentFile.
         Если файла нет — возвращаем None (пусть вьюха отдаст 404).
         """
-        full_path = self.path(name)
-        if not os.path.exists(full_path):
+        if not self.backend.exists(name):
+            return None
+        fh, cipher = self._open_raw(name)
+        if fh is None:
             return None
+        if cipher is not None:
+            return DecryptedFile(fh, cipher, fh.size, name=os.path.basename(name), cache_name=name)
 
-        with super().open(name, mode="rb") as f:
-            token = f.read()
+        with fh:
+            fh.seek(0)
+            token = fh.read()
         try:
             data = self.fernet.decrypt(token)
         except InvalidToken:
             data = token
         return ContentFile(data, name=os.path.basename(name))
+
+
+@deconstructible
+class EncryptedFileSystemStorage(EncryptedStorage):
+    """EncryptedStorage поверх локального каталога (по умолчанию MEDIA_ROOT)."""
+
+    def __init__(self, location=None, **kwargs):
+        super().__init__(FileSystemStorage(location=location, **kwargs))
+
+    @property
+    def location(self):
+        return self.backend.location
+
+
+def _peek(chunks, size):
+    """Читает из потока кусков не меньше size байт для пробы и возвращает (весь поток, проба)."""
+    chunks = iter(chunks)
+    head = []
+    got = 0
+    for chunk in chunks:
+        head.append(chunk)
+        got += len(chunk)
+        if got >= size:
+            break
+    sample = b"".join(head)
+    return itertools.chain([sample], chunks), sample[:size]
+
+
+def _read_exact(stream, n):
+    parts = []
+    while n > 0:
+        data = stream.read(n)
+        if not data:
+            break
+        parts.append(data)
+        n -= len(data)
+    return b"".join(parts)
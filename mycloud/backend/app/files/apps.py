@@ -5,3 +5,6 @@ class FilesConfig(AppConfig):
     name = "app.files"
     def ready(self):
         import app.files.signals
+        from django.db.models.signals import post_migrate
+        from app.files.search import install_indexes
+        post_migrate.connect(install_indexes, sender=self, dispatch_uid="files-search-indexes")
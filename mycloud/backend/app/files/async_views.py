@@ -0,0 +1,65 @@
+"""
+Асинхронные варианты скачивания для ASGI (ASYNC_DOWNLOADS=True).
+
+Медленный клиент держит корутину, а не поток воркера: чтение и расшифровка
+идут кусками в пуле потоков (downloads.aiterate), запросы к БД — через async ORM.
+Права те же, что у синхронных вьюх: владелец в /files/, staff в /admin/files/.
+"""
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from app.common.counters import hits
+from .downloads import file_response, counts_as_download
+from .models import File
+
+NOT_FOUND = "Файл не найден на диске"
+
+
+def _resolve_user(request):
+    """Аутентификация теми же классами DRF, что и у синхронного API (JWT, сессия)."""
+    drf_request = Request(request, authenticators=[cls() for cls in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+    return drf_request.user
+
+
+async def _authenticate(request):
+    try:
+        return await sync_to_async(_resolve_user)(request), None
+    except APIException as e:
+        return None, JsonResponse({"detail": str(e.detail)}, status=e.status_code)
+
+
+async def _serve(request, file_obj):
+    resp = await sync_to_async(file_response)(request, file_obj, asynchronous=True)
+    if resp is None:
+        return JsonResponse({"detail": NOT_FOUND}, status=404)
+    if counts_as_download(resp):
+        await sync_to_async(hits.hit)(File, file_obj.pk)
+    return resp
+
+
+async def download(request, pk):
+    user, error = await _authenticate(request)
+    if error is not None:
+        return error
+    if not user.is_authenticated:
+        return JsonResponse({"detail": "Учетные данные не были предоставлены."}, status=401)
+    file_obj = await File.objects.filter(pk=pk, user_id=user.pk).afirst()
+    if file_obj is None:
+        return JsonResponse({"detail": "Не найдено."}, status=404)
+    return await _serve(request, file_obj)
+
+
+async def admin_download(request, pk):
+    user, error = await _authenticate(request)
+    if error is not None:
+        return error
+    if not (user.is_authenticated and user.is_staff):
+        return JsonResponse({"detail": "У вас недостаточно прав для выполнения данного действия."}, status=403)
+    file_obj = await File.objects.filter(pk=pk).afirst()
+    if file_obj is None:
+        return JsonResponse({"detail": "Не найдено."}, status=404)
+    return await _serve(request, file_obj)
+
@@ -0,0 +1,130 @@
+"""
+Дедупликация содержимого: одинаковые файлы хранятся одним зашифрованным блобом
+с отдельным ключом (солью в заголовке), File ссылается на Blob, блоб удаляется
+вместе с последней ссылкой.
+"""
+from django.conf import settings
+from django.core.files import File as DjangoFile
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+
+from .models import Blob, efs
+from .tasks import delete_stored
+
+
+def dedup_enabled():
+    return getattr(settings, "DEDUP_ENABLED", False)
+
+
+def content_digest(chunks):
+    h = efs.content_hasher()
+    for chunk in chunks:
+        h.update(chunk)
+    return h.hexdigest()
+
+
+def stored_digest(storage_name):
+    """Дайджест уже записанного файла (читает и расшифровывает его целиком)."""
+    fobj = efs.open_decrypted(storage_name)
+    try:
+        return content_digest(fobj.chunks())
+    finally:
+        fobj.close()
+
+
+class DigestingFile(DjangoFile):
+    """Загружаемое содержимое, дайджест которого считается попутно с записью в хранилище."""
+
+    def __init__(self, content):
+        super().__init__(content, name=content.name)
+        self.hasher = efs.content_hasher()
+
+    def chunks(self, chunk_size=None):
+        for chunk in self.file.chunks(chunk_size):
+            self.hasher.update(chunk)
+            yield chunk
+
+    def hexdigest(self):
+        return self.hasher.hexdigest()
+
+
+def blob_path(digest):
+    return f"blobs/{digest[:2]}/{digest[2:4]}/{digest}"
+
+
+def _acquire(digest):
+    with transaction.atomic():
+        blob = Blob.objects.select_for_update().filter(digest=digest).first()
+        if blob is not None:
+            Blob.objects.filter(pk=blob.pk).update(refcount=F("refcount") + 1)
+        return blob
+
+
+def _register(digest, storage_name, size):
+    """Создаёт Blob для уже записанного файла; если такой дайджест успели занять — берём его."""
+    try:
+        with transaction.atomic():
+            return Blob.objects.create(digest=digest, storage_name=storage_name, size=size, refcount=1)
+    except IntegrityError:
+        delete_stored.delay([storage_name])
+        return _acquire(digest)
+
+
+def store(content):
+    """
+    Сначала считаем дайджест (чтение), и только если такого содержимого ещё нет —
+    шифруем и пишем. Повторная загрузка того же файла ничего не пишет на диск.
+    """
+    digest = content_digest(content.chunks())
+    blob = _acquire(digest)
+    if blob is not None:
+        return blob
+    name = efs.save(blob_path(digest), content)
+    return _register(digest, name, content.size)
+
+
+def adopt(storage_name, size, digest=None):
+    """
+    Подхватывает уже записанный файл (поэтапная или потоковая загрузка); дубликат
+    удаляется. digest, если известен, избавляет от повторного чтения файла.
+    """
+    digest = digest or stored_digest(storage_name)
+    blob = _acquire(digest)
+    if blob is not None:
+        delete_stored.delay([storage_name])
+        return blob
+    return _register(digest, storage_name, size)
+
+
+def release(blob_id):
+    """Снимает одну ссылку; последний владелец ставит удаление блоба в очередь задач."""
+    with transaction.atomic():
+        blob = Blob.objects.select_for_update().filter(pk=blob_id).first()
+        if blob is None:
+            return
+        if blob.refcount > 1:
+            Blob.objects.filter(pk=blob.pk).update(refcount=F("refcount") - 1)
+            return
+        blob.delete()
+        delete_stored.delay([blob.storage_name])
+
+
+def release_many(counts):
+    """
+    Групповой release: counts — {blob_id: сколько ссылок снять}. Один SELECT FOR UPDATE,
+    один UPDATE для выживших и один DELETE для освободившихся блобов.
+    """
+    if not counts:
+        return
+    with transaction.atomic():
+        locked = list(Blob.objects.select_for_update().filter(pk__in=list(counts)))
+        alive = [b for b in locked if b.refcount > counts[b.pk]]
+        dead = [b for b in locked if b.refcount <= counts[b.pk]]
+        if alive:
+            Blob.objects.filter(pk__in=[b.pk for b in alive]).update(refcount=F("refcount") - Case(
+                *[When(pk=b.pk, then=Value(counts[b.pk])) for b in alive],
+                default=Value(0), output_field=IntegerField(),
+            ))
+        Blob.objects.filter(pk__in=[b.pk for b in dead]).delete()
+        if dead:
+            delete_stored.delay([b.storage_name for b in dead])
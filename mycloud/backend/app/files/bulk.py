@@ -0,0 +1,105 @@
+"""
+Групповые операции над файлами: удаление выборки и ZIP-архив «на лету».
+
+Архив пишется в несикабельный приёмник, поэтому zipfile сам ставит data
+descriptor после каждого файла; в памяти держится один кусок расшифрованных
+данных, временного файла нет.
+"""
+import zipfile
+from collections import Counter, defaultdict
+from django.db import transaction
+from django.utils import timezone
+
+from app.common.counters import hits
+from .models import File
+from . import blobs
+from .downloads import CHUNK
+from .signals import bulk_delete, _bump_usage
+from .tasks import delete_stored
+
+
+def delete_files(qs):
+    """
+    Удаляет выборку в одной транзакции: строки File (и каскадом ссылки) — одним
+    queryset.delete(), счётчики — одним UPDATE на пользователя, блобы — через
+    blobs.release_many, физические файлы — одной фоновой задачей. Возвращает число удалённых.
+    """
+    with transaction.atomic():
+        rows = list(qs.select_for_update().values_list("pk", "user_id", "size", "blob_id", "file"))
+        if not rows:
+            return 0
+        with bulk_delete():
+            File.objects.filter(pk__in=[pk for pk, *_ in rows]).delete()
+
+        usage = defaultdict(lambda: [0, 0])
+        for _pk, user_id, size, _blob_id, _name in rows:
+            usage[user_id][0] -= 1
+            usage[user_id][1] -= size
+        for user_id, (count, size) in usage.items():
+            _bump_usage(user_id, count, size)
+
+        blobs.release_many(Counter(blob_id for _pk, _u, _s, blob_id, _n in rows if blob_id))
+        names = [name for _pk, _u, _s, blob_id, name in rows if not blob_id and name]
+        if names:
+            delete_stored.delay(names)
+    return len(rows)
+
+
+class _Sink:
+    """Приёмник без seek/tell: zipfile пишет в него, генератор забирает накопленное."""
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b"".join(self.parts)
+        self.parts.clear()
+        return data
+
+
+def _unique_name(name, used):
+    base, dot, ext = name.rpartition(".")
+    if not dot:
+        base, ext = name, ""
+    candidate, n = name, 1
+    while candidate in used:
+        candidate = f"{base} ({n}).{ext}" if dot else f"{base} ({n})"
+        n += 1
+    used.add(candidate)
+    return candidate
+
+
+def zip_stream(files, chunk_size=CHUNK):
+    """
+    Генератор ZIP-архива (без сжатия: расшифровка и так основная работа) из
+    списка File. Файлы, которых нет в хранилище, пропускаются. Каждый файл
+    архива считается скачиванием.
+    """
+    sink = _Sink()
+    used = set()
+    with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_STORED, allowZip64=True) as zf:
+        for file_obj in files:
+            fobj = file_obj.file.storage.open_decrypted(file_obj.file.name)
+            if fobj is None:
+                continue
+            info = zipfile.ZipInfo(
+                _unique_name(file_obj.original_name, used),
+                date_time=timezone.localtime(file_obj.uploaded_at).timetuple()[:6],
+            )
+            info.file_size = file_obj.size  # по нему zipfile решает, нужен ли zip64
+            with fobj, zf.open(info, mode="w") as dst:
+                for chunk in fobj.chunks(chunk_size):
+                    dst.write(chunk)
+                    data = sink.take()
+                    if data:
+                        yield data
+            yield sink.take()
+            hits.hit(File, file_obj.pk)
+    yield sink.take()
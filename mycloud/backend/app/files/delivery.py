@@ -0,0 +1,235 @@
+"""
+Отдача файлов фронт-прокси (nginx X-Accel-Redirect / X-Sendfile).
+
+Прокси не умеет расшифровывать, поэтому отдаёт расшифрованную копию из
+DOWNLOAD_CACHE_ROOT — каталога, который прокси читает как internal-location.
+Если копия есть, воркер только проверяет права, считает скачивание и ставит
+заголовки, а байты (включая Range) отдаёт nginx. Промах не задерживает ответ:
+файл отдаётся обычным потоком, а поток попутно пишется в кэш (tee) — по одному
+писателю на файл, остальные промахи просто стримят.
+
+Кэш ограничен DOWNLOAD_CACHE_MAX_BYTES, старые копии вытесняются по времени
+последнего доступа. Размеры берутся из индекса в памяти процесса; полный
+обход каталога — раз в DOWNLOAD_CACHE_RESCAN секунд (он же подхватывает копии
+соседних процессов и убирает брошенные .part-файлы). В кэше лежит открытый
+текст — каталог не должен быть доступен никому, кроме прокси.
+"""
+import hashlib
+import logging
+import mimetypes
+import os
+import threading
+import time
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.http import content_disposition_header
+
+logger = logging.getLogger(__name__)
+
+MODES = ("stream", "x-accel", "x-sendfile")
+PART_PREFIX = ".part-"
+# .part-файл, в который столько секунд никто не писал, брошен (писатель упал или клиент завис)
+PART_STALE_SECONDS = 600
+
+
+def delivery_mode():
+    mode = getattr(settings, "DOWNLOAD_DELIVERY", "stream")
+    return mode if mode in MODES else "stream"
+
+
+def offload_enabled():
+    return delivery_mode() != "stream"
+
+
+def _cache_root():
+    return str(getattr(settings, "DOWNLOAD_CACHE_ROOT"))
+
+
+def _budget():
+    return getattr(settings, "DOWNLOAD_CACHE_MAX_BYTES", 0)
+
+
+def cache_relpath(storage_name):
+    key = hashlib.sha256(storage_name.encode()).hexdigest()
+    return f"{key[:2]}/{key}"
+
+
+def _part_path(rel):
+    head, key = os.path.split(rel)
+    return os.path.join(_cache_root(), head, PART_PREFIX + key)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class CacheIndex:
+    """rel -> [время доступа, размер] для копий в кэше и их суммарный размер."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._total = 0
+        self._root = None
+        self._scanned = 0.0
+
+    def _scan(self):
+        entries = {}
+        now = time.time()
+        for dirpath, _dirs, files in os.walk(self._root):
+            for fn in files:
+                path = os.path.join(dirpath, fn)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                if fn.startswith(PART_PREFIX):
+                    if now - st.st_mtime > PART_STALE_SECONDS:
+                        _remove(path)
+                    continue
+                entries[os.path.relpath(path, self._root)] = [st.st_mtime, st.st_size]
+        self._entries = entries
+        self._total = sum(size for _, size in entries.values())
+        self._scanned = time.monotonic()
+
+    def _fresh(self):
+        root = _cache_root()
+        rescan = getattr(settings, "DOWNLOAD_CACHE_RESCAN", 300)
+        if root != self._root or time.monotonic() - self._scanned > rescan:
+            self._root = root
+            self._scan()
+
+    def touch(self, rel, size):
+        with self._lock:
+            self._fresh()
+            entry = self._entries.get(rel)
+            if entry is None:
+                self._entries[rel] = [time.time(), size]
+                self._total += size
+            else:
+                entry[0] = time.time()
+
+    def discard(self, rel):
+        with self._lock:
+            entry = self._entries.pop(rel, None)
+            if entry is not None:
+                self._total -= entry[1]
+
+    def evict(self, keep=None):
+        """Вытесняет самые давние копии сверх бюджета; keep (только что отданную) не трогает."""
+        budget = _budget()
+        if not budget:
+            return
+        with self._lock:
+            if self._total <= budget:
+                return
+            for rel, (_atime, size) in sorted(self._entries.items(), key=lambda item: item[1][0]):
+                if self._total <= budget:
+                    break
+                if rel == keep:
+                    continue
+                _remove(os.path.join(self._root, rel))
+                del self._entries[rel]
+                self._total -= size
+
+    def clear(self):
+        with self._lock:
+            self._entries, self._total, self._root = {}, 0, None
+
+
+index = CacheIndex()
+
+
+def cached(file_obj):
+    """Путь копии относительно DOWNLOAD_CACHE_ROOT или None, если её ещё нет."""
+    rel = cache_relpath(file_obj.file.name)
+    full = os.path.join(_cache_root(), rel)
+    try:
+        os.utime(full)
+    except FileNotFoundError:
+        index.discard(rel)
+        return None
+    index.touch(rel, file_obj.size)
+    return rel
+
+
+def tee(chunks, file_obj):
+    """
+    Отдаёт chunks дальше и попутно пишет их в кэш. Писатель на файл один:
+    .part-файл создаётся с O_EXCL, кто не успел — просто отдаёт поток. Копия
+    появляется только целиком (rename после последнего байта); обрыв клиента
+    или ошибка чтения удаляют .part. Файлы больше бюджета кэша не пишутся.
+    """
+    budget = _budget()
+    if budget and file_obj.size > budget:
+        yield from chunks
+        return
+    rel = cache_relpath(file_obj.file.name)
+    part = _part_path(rel)
+    os.makedirs(os.path.dirname(part), exist_ok=True)
+    try:
+        if time.time() - os.stat(part).st_mtime > PART_STALE_SECONDS:
+            _remove(part)
+    except FileNotFoundError:
+        pass
+    try:
+        fd = os.open(part, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)  # читает воркер nginx
+    except FileExistsError:
+        yield from chunks
+        return
+
+    out = os.fdopen(fd, "wb")
+    written = 0
+    done = False
+    try:
+        for chunk in chunks:
+            out.write(chunk)
+            written += len(chunk)
+            yield chunk
+        out.close()
+        if written == file_obj.size:
+            os.replace(part, os.path.join(_cache_root(), rel))
+            done = True
+            index.touch(rel, written)
+            index.evict(keep=rel)
+    finally:
+        if not done:
+            out.close()
+            _remove(part)
+
+
+def forget(storage_name):
+    """Убирает расшифрованную копию (удаление файла или блоба)."""
+    if not storage_name:
+        return
+    rel = cache_relpath(storage_name)
+    index.discard(rel)
+    path = os.path.join(_cache_root(), rel)
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError:
+        logger.warning("Не удалось удалить копию из кэша отдачи: %s", path, exc_info=True)
+
+
+def offload_response(request, file_obj):
+    """Ответ с передачей отдачи прокси; None — копии в кэше нет, отдавать потоком через tee."""
+    rel = cached(file_obj)
+    if rel is None:
+        return None
+    ctype = mimetypes.guess_type(file_obj.original_name)[0] or "application/octet-stream"
+    resp = HttpResponse(content_type=ctype)
+    if delivery_mode() == "x-accel":
+        prefix = getattr(settings, "DOWNLOAD_ACCEL_PREFIX", "/protected/")
+        resp["X-Accel-Redirect"] = prefix.rstrip("/") + "/" + rel
+    else:
+        resp["X-Sendfile"] = os.path.join(_cache_root(), rel)
+    resp["Content-Disposition"] = content_disposition_header(True, file_obj.original_name)
+    # диапазоны обслуживает прокси; докачку не считаем новым скачиванием
+    range_header = request.headers.get("Range", "")
+    resp.full_download = not range_header or range_header.replace(" ", "").startswith("bytes=0-")
+    return resp
@@ -0,0 +1,326 @@
+import mimetypes
+import queue
+import secrets
+import threading
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+
+from . import delivery
+
+CHUNK = 64 * 1024
+MAX_RANGES = 16
+# личные скачивания: браузер может хранить копию, но обязан перепроверять её по ETag
+PRIVATE_CACHE_CONTROL = "private, no-cache"
+# что можно показывать в браузере (inline): эти типы не исполняют скриптов;
+# SVG — XML со скриптами, поэтому картинки берутся без него
+INLINE_TYPES = ("image/", "video/", "audio/", "application/pdf")
+INLINE_DENY = {"image/svg+xml"}
+
+
+def iter_file(fobj, start=0, length=None, chunk_size=CHUNK, close=True):
+    """
+    Читает файл кусками начиная с start. Для сегментированного хранилища seek
+    дешёвый: расшифровываются только сегменты, попавшие в диапазон.
+    """
+    try:
+        if start:
+            fobj.seek(start)
+        while length is None or length > 0:
+            n = chunk_size if length is None else min(chunk_size, length)
+            chunk = fobj.read(n)
+            if not chunk:
+                break
+            if length is not None:
+                length -= len(chunk)
+            yield chunk
+    finally:
+        if close:
+            try:
+                fobj.close()
+            except Exception:
+                pass
+
+
+class _Failed:
+    def __init__(self, error):
+        self.error = error
+
+
+_END = object()
+
+
+def read_ahead(iterator, depth):
+    """
+    Конвейер отдачи: фоновый поток читает и расшифровывает до depth кусков
+    вперёд, пока текущий уходит в сокет, — диск, CPU и сеть заняты одновременно.
+    Память на поток — depth кусков. Ошибка чтения всплывает у потребителя на
+    своём месте; закрытие (обрыв клиента) останавливает поток и закрывает iterator.
+    """
+    buf = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                buf.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        last = _END
+        try:
+            for chunk in iterator:
+                if not put(chunk):
+                    break
+        except BaseException as e:
+            last = _Failed(e)
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                try:
+                    close()
+                except Exception:
+                    pass
+        put(last)
+
+    threading.Thread(target=produce, name="read-ahead", daemon=True).start()
+    try:
+        while True:
+            item = buf.get()
+            if item is _END:
+                return
+            if isinstance(item, _Failed):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+
+
+def _pipeline(iterator, size):
+    """Файлы не длиннее одного буфера отдаются без лишнего потока."""
+    depth = getattr(settings, "DOWNLOAD_READ_AHEAD", 0)
+    if depth <= 0 or size <= _buffer_size():
+        return iterator
+    return read_ahead(iterator, depth)
+
+
+def _buffer_size():
+    return getattr(settings, "DOWNLOAD_BUFFER_SIZE", CHUNK)
+
+
+async def aiterate(iterator):
+    """
+    Асинхронная обёртка над синхронным итератором чтения: каждый кусок читается
+    и расшифровывается в пуле потоков, event loop не блокируется. Под ASGI
+    StreamingHttpResponse с синхронным итератором вычитал бы файл целиком в память.
+    """
+    next_chunk = sync_to_async(next, thread_sensitive=False)
+    done = object()
+    try:
+        while True:
+            chunk = await next_chunk(iterator, done)
+            if chunk is done:
+                break
+            yield chunk
+    finally:
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            await sync_to_async(close, thread_sensitive=False)()
+
+
+def under_asgi(request):
+    return isinstance(getattr(request, "_request", request), ASGIRequest)
+
+
+def streaming_body(request, iterator):
+    """Тело StreamingHttpResponse: под ASGI — через aiterate, иначе синхронный итератор как есть."""
+    return aiterate(iterator) if under_asgi(request) else iterator
+
+
+def parse_range(header, size):
+    """
+    Разбирает заголовок Range (RFC 9110). Возвращает:
+      None — заголовок отсутствует/некорректен, отдаём файл целиком;
+      []   — ни один диапазон не удовлетворим (416);
+      [(start, end), ...] — включительные границы.
+    """
+    if not header:
+        return None
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or not spec:
+        return None
+    ranges = []
+    for part in spec.split(","):
+        first, sep, last = part.strip().partition("-")
+        if not sep:
+            return None
+        try:
+            if first:
+                start = int(first)
+                end = int(last) if last else size - 1
+                if last and end < start:
+                    return None
+            else:
+                suffix = int(last)
+                if suffix <= 0:
+                    continue
+                start, end = max(size - suffix, 0), size - 1
+        except ValueError:
+            return None
+        if start >= size:
+            continue
+        ranges.append((start, min(end, size - 1)))
+    if len(ranges) > MAX_RANGES:
+        return None
+    return ranges
+
+
+def last_modified(file_obj):
+    return http_date(file_obj.uploaded_at.timestamp())
+
+
+def if_range_matches(request, file_obj):
+    value = request.headers.get("If-Range")
+    if not value:
+        return True
+    if value.startswith("W/"):
+        return False  # слабый валидатор не годится для склейки диапазонов
+    if value.startswith('"'):
+        return value == file_obj.etag
+    date = parse_http_date_safe(value)
+    return date is not None and date == int(file_obj.uploaded_at.timestamp())
+
+
+def set_validators(resp, file_obj, cache_control=PRIVATE_CACHE_CONTROL):
+    resp["ETag"] = file_obj.etag
+    resp["Last-Modified"] = last_modified(file_obj)
+    resp["Cache-Control"] = cache_control
+    resp.keep_cache_control = True  # см. app.common.middleware.NoStoreForAuth
+    return resp
+
+
+def not_modified(request, file_obj, cache_control=PRIVATE_CACHE_CONTROL):
+    """
+    304/412 по If-None-Match / If-Modified-Since / If-Match / If-Unmodified-Since
+    только по метаданным File, без обращения к хранилищу. None — отдаём тело.
+    """
+    resp = get_conditional_response(
+        request, etag=file_obj.etag, last_modified=int(file_obj.uploaded_at.timestamp()),
+    )
+    return set_validators(resp, file_obj, cache_control) if resp is not None else None
+
+
+def content_type(file_obj, inline=False):
+    """
+    MIME-тип по имени файла. Для показа в браузере — только INLINE_TYPES:
+    загруженный пользователем HTML или SVG, открытый с нашего origin, исполнился бы
+    как скрипт с доступом к его cookie. Прочее отдаётся как application/octet-stream.
+    """
+    ctype = mimetypes.guess_type(file_obj.original_name)[0] or "application/octet-stream"
+    if inline and (ctype in INLINE_DENY or not ctype.startswith(INLINE_TYPES)):
+        return "application/octet-stream"
+    return ctype
+
+
+def protect(resp):
+    """Содержимое пользователей: без угадывания типа браузером и в песочнице без origin и скриптов."""
+    resp["X-Content-Type-Options"] = "nosniff"
+    resp["Content-Security-Policy"] = "sandbox"
+    return resp
+
+
+def counts_as_download(resp):
+    """Докачка и перемотка не считаются новым скачиванием."""
+    if hasattr(resp, "full_download"):
+        return resp.full_download
+    return resp.status_code == 200 or resp.get("Content-Range", "").startswith("bytes 0-")
+
+
+def file_response(request, file_obj, asynchronous=False, cache_control=PRIVATE_CACHE_CONTROL, inline=False):
+    """
+    Ответ на скачивание с поддержкой Range/If-Range: 200 целиком,
+    206 для одного или нескольких диапазонов (multipart/byteranges), 416 если мимо,
+    304 по условным заголовкам. asynchronous=True — тело отдаётся асинхронным
+    итератором (ASGI); inline=True — Content-Disposition: inline (встраивание,
+    только для безопасных типов, см. content_type).
+    Возвращает None, если содержимого нет в хранилище.
+    """
+    conditional = not_modified(request, file_obj, cache_control)
+    if conditional is not None:
+        return conditional
+    wrap = aiterate if asynchronous else (lambda it: it)
+    buffer_size = _buffer_size()
+    storage = file_obj.file.storage
+    name = file_obj.file.name
+    if not name or not storage.exists(name):
+        return None
+    offload = delivery.offload_enabled()
+    if offload:
+        resp = delivery.offload_response(request, file_obj)
+        if resp is not None:
+            return protect(set_validators(resp, file_obj, cache_control))
+
+    size = file_obj.size
+    ctype = content_type(file_obj, inline)
+    ranges = None
+    if if_range_matches(request, file_obj):
+        ranges = parse_range(request.headers.get("Range"), size)
+
+    if ranges == []:
+        resp = HttpResponse(status=416)
+        resp["Content-Range"] = f"bytes */{size}"
+    else:
+        fobj = storage.open_decrypted(name)
+        if fobj is None:
+            return None
+        if ranges is None:
+            body = _pipeline(iter_file(fobj, chunk_size=buffer_size), size)
+            if offload:
+                # промах кэша прокси: отдаём сами и заодно наполняем кэш
+                body = delivery.tee(body, file_obj)
+            resp = StreamingHttpResponse(wrap(body), content_type=ctype)
+            resp["Content-Length"] = str(size)
+        elif len(ranges) == 1:
+            start, end = ranges[0]
+            body = _pipeline(iter_file(fobj, start, end - start + 1, buffer_size), end - start + 1)
+            resp = StreamingHttpResponse(wrap(body), status=206, content_type=ctype)
+            resp["Content-Range"] = f"bytes {start}-{end}/{size}"
+            resp["Content-Length"] = str(end - start + 1)
+        else:
+            boundary = secrets.token_hex(16)
+            body, length = _multipart(fobj, ranges, size, ctype, boundary, buffer_size)
+            resp = StreamingHttpResponse(wrap(_pipeline(body, length)), status=206,
+                                         content_type=f"multipart/byteranges; boundary={boundary}")
+            resp["Content-Length"] = str(length)
+
+    resp["Accept-Ranges"] = "bytes"
+    set_validators(resp, file_obj, cache_control)
+    resp["Content-Disposition"] = content_disposition_header(not inline, file_obj.original_name)
+    return protect(resp)
+
+
+def _multipart(fobj, ranges, size, ctype, boundary, chunk_size=CHUNK):
+    heads = [
+        (f"\r\n--{boundary}\r\nContent-Type: {ctype}\r\n"
+         f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n").encode()
+        for start, end in ranges
+    ]
+    tail = f"\r\n--{boundary}--\r\n".encode()
+    length = sum(len(h) for h in heads) + sum(e - s + 1 for s, e in ranges) + len(tail)
+
+    def body():
+        try:
+            for head, (start, end) in zip(heads, ranges):
+                yield head
+                yield from iter_file(fobj, start, end - start + 1, chunk_size, close=False)
+            yield tail
+        finally:
+            fobj.close()
+
+    return body(), length
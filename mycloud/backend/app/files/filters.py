@@ -0,0 +1,65 @@
+from datetime import datetime, time, timedelta
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+
+ORDERING_FIELDS = ("uploaded_at", "size", "original_name")
+DEFAULT_ORDERING = "-uploaded_at"
+
+
+def _int(params, key):
+    raw = params.get(key)
+    if raw in (None, ""):
+        return None
+    try:
+        return int(raw)
+    except ValueError:
+        raise ValidationError({key: "Ожидается целое число"})
+
+
+def _moment(params, key, end_of_day=False):
+    """Дата без времени — граница суток, чтобы сравнение шло по индексу uploaded_at."""
+    raw = params.get(key)
+    if not raw:
+        return None
+    value = parse_datetime(raw)
+    if value is None:
+        day = parse_date(raw)
+        if day is None:
+            raise ValidationError({key: "Ожидается дата (YYYY-MM-DD) или дата-время ISO 8601"})
+        value = datetime.combine(day + timedelta(days=1) if end_of_day else day, time.min)
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return value
+
+
+def apply_file_filters(qs, params):
+    """
+    Фильтры списка файлов: name (подстрока), name_prefix, size_min/size_max,
+    uploaded_after/uploaded_before, ordering. Каждому сочетанию «user + поле»
+    соответствует индекс в File.Meta.indexes. Возвращает (queryset, ordering).
+    """
+    name = params.get("name")
+    if name:
+        qs = qs.filter(original_name__icontains=name)
+    prefix = params.get("name_prefix")
+    if prefix:
+        qs = qs.filter(original_name__startswith=prefix)
+
+    size_min, size_max = _int(params, "size_min"), _int(params, "size_max")
+    if size_min is not None:
+        qs = qs.filter(size__gte=size_min)
+    if size_max is not None:
+        qs = qs.filter(size__lte=size_max)
+
+    after = _moment(params, "uploaded_after")
+    before = _moment(params, "uploaded_before", end_of_day=True)
+    if after is not None:
+        qs = qs.filter(uploaded_at__gte=after)
+    if before is not None:
+        qs = qs.filter(uploaded_at__lt=before)
+
+    ordering = params.get("ordering") or DEFAULT_ORDERING
+    if ordering.lstrip("-") not in ORDERING_FIELDS:
+        raise ValidationError({"ordering": f"Допустимо: {', '.join(ORDERING_FIELDS)} (с '-' для убывания)"})
+    return qs.order_by(ordering, "-id" if ordering.startswith("-") else "id"), ordering
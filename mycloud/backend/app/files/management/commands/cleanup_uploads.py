@@ -0,0 +1,30 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from app.files.models import UploadSession
+
+class Command(BaseCommand):
+    help = "Удалить брошенные сессии поэтапной загрузки вместе с недокачанными файлами"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hours", type=int, default=getattr(settings, "UPLOAD_SESSION_TTL_HOURS", 24),
+                            help="Сессии без активности дольше этого срока считаются брошенными")
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **opts):
+        cutoff = timezone.now() - timedelta(hours=opts["hours"])
+        removed = 0
+        for pk in UploadSession.objects.filter(updated_at__lt=cutoff).values_list("pk", flat=True).iterator():
+            with transaction.atomic():
+                # сессии под блокировкой другого запроса и сессии в commit не трогаем
+                session = (UploadSession.objects.select_for_update(skip_locked=True)
+                           .filter(pk=pk, committing=False, updated_at__lt=cutoff).first())
+                if session is None:
+                    continue
+                self.stdout.write(f"Stale: {session.id} {session.storage_name}")
+                if not opts["dry_run"]:
+                    session.abort()
+            removed += 1
+        self.stdout.write(self.style.SUCCESS(f"Done. Stale sessions: {removed}"))
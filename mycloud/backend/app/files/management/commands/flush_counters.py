@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from app.common.counters import hits
+
+class Command(BaseCommand):
+    help = "Перенести журнал скачиваний (PendingHit) из всех процессов в счётчики File и Link"
+
+    def handle(self, *args, **opts):
+        flushed = hits.flush()
+        self.stdout.write(self.style.SUCCESS(f"Done. Flushed counters: {flushed}"))
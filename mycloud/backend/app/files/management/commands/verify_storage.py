@@ -1,15 +1,113 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from django.core.management.base import BaseCommand
-from app.files.models import File
-from app.core.storage import EncryptedFileSystemStorage
+from app.core.storage import CorruptedFileError
+from app.files.models import File, Blob, UploadSession, efs
 
 class Command(BaseCommand):
-    help = "Проверить соответствие БД и хранилища"
+    help = "Проверить соответствие БД и хранилища: пропавшие, повреждённые и осиротевшие файлы"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=4, help="Потоков на проверку файлов")
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--decrypt", action="store_true",
+                            help="Расшифровать каждый файл целиком и проверить подлинность сегментов")
+        parser.add_argument("--orphans", action="store_true",
+                            help="Пройти хранилище и найти файлы без записи в БД")
+        parser.add_argument("--delete-orphans", action="store_true")
+        parser.add_argument("--grace-minutes", type=int, default=60,
+                            help="Не считать сиротами файлы моложе (идущие загрузки)")
+        parser.add_argument("--checkpoint", help="JSON-файл прогресса; при повторном запуске продолжаем с него")
 
     def handle(self, *args, **opts):
-        efs = EncryptedFileSystemStorage()
-        missing = 0
-        for f in File.objects.all():
-            if not efs.exists(f.file.name):
-                self.stdout.write(self.style.WARNING(f"Missing: {f.id} {f.file.name}"))
-                missing += 1
-        self.stdout.write(self.style.SUCCESS(f"Done. Missing: {missing}"))
+        self.opts = opts
+        state = self._load_checkpoint()
+        with ThreadPoolExecutor(max_workers=max(1, opts["workers"])) as pool:
+            self._scan_rows(pool, state)
+            if opts["orphans"] or opts["delete_orphans"]:
+                self._scan_orphans(state)
+        if opts["checkpoint"] and os.path.exists(opts["checkpoint"]):
+            # проход завершён — следующий запуск начнётся заново
+            os.remove(opts["checkpoint"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Done. Checked: {state['checked']} Missing: {state['missing']} "
+            f"Corrupt: {state['corrupt']} Orphans: {state['orphans']}"
+        ))
+
+    def _check(self, row):
+        pk, name = row
+        if not name or not efs.exists(name):
+            return pk, name, "missing"
+        if self.opts["decrypt"]:
+            try:
+                efs.verify(name)
+            except (CorruptedFileError, OSError):
+                return pk, name, "corrupt"
+        return pk, name, None
+
+    def _scan_rows(self, pool, state):
+        # keyset-батчи по id: без долгоживущего курсора, и есть точка для возобновления
+        while True:
+            rows = list(
+                File.objects.filter(id__gt=state["last_id"]).order_by("id").values_list("id", "file")[:self.opts["batch_size"]]
+            )
+            if not rows:
+                break
+            for pk, name, problem in pool.map(self._check, rows):
+                if problem:
+                    state[problem] += 1
+                    self.stdout.write(self.style.WARNING(f"{problem.capitalize()}: {pk} {name}"))
+            state["checked"] += len(rows)
+            state["last_id"] = rows[-1][0]
+            self._save_checkpoint(state)
+
+    def _scan_orphans(self, state):
+        cutoff = time.time() - self.opts["grace_minutes"] * 60
+        batch = []
+        for name in efs.walk():
+            if efs.get_modified_time(name).timestamp() > cutoff:
+                continue
+            batch.append(name)
+            if len(batch) >= self.opts["batch_size"]:
+                self._handle_orphans(batch, state)
+                batch = []
+        if batch:
+            self._handle_orphans(batch, state)
+
+    def _handle_orphans(self, names, state):
+        # куски поэтапной загрузки на объектных хранилищах лежат в <storage_name>.parts/
+        owners = {name: name.rsplit(".parts/", 1)[0] for name in names}
+        candidates = set(owners.values())
+        known = set(File.objects.filter(file__in=candidates).values_list("file", flat=True))
+        known |= set(Blob.objects.filter(storage_name__in=candidates).values_list("storage_name", flat=True))
+        known |= set(UploadSession.objects.filter(storage_name__in=candidates).values_list("storage_name", flat=True))
+        for name in names:
+            if owners[name] in known:
+                continue
+            state["orphans"] += 1
+            if self.opts["delete_orphans"]:
+                efs.delete(name)
+                self.stdout.write(self.style.WARNING(f"Orphan deleted: {name}"))
+            else:
+                self.stdout.write(self.style.WARNING(f"Orphan: {name}"))
+
+    def _load_checkpoint(self):
+        state = {"last_id": 0, "checked": 0, "missing": 0, "corrupt": 0, "orphans": 0}
+        path = self.opts["checkpoint"]
+        if path and os.path.exists(path):
+            with open(path) as fh:
+                state.update(json.load(fh))
+            state["orphans"] = 0
+            self.stdout.write(f"Resuming after id {state['last_id']}")
+        return state
+
+    def _save_checkpoint(self, state):
+        path = self.opts["checkpoint"]
+        if not path:
+            return
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as fh:
+            json.dump(state, fh)
+        os.replace(tmp, path)
@@ -1,45 +1,121 @@
+import uuid
 from django.db import models
 from django.conf import settings
-from django.db.models.signals import post_delete
-from django.dispatch import receiver
 from django.utils import timezone
-from app.core.storage import EncryptedFileSystemStorage
+from app.core.storage import EncryptedStorage
 
-efs = EncryptedFileSystemStorage()
+# backend (локальный диск или S3) выбирается по STORAGE_BACKEND
+efs = EncryptedStorage()
 
 def upload_path(instance, filename):
     from uuid import uuid4
     today = timezone.localdate()
     return f"{instance.user_id}/{today:%Y/%m/%d}/{uuid4().hex}"
 
+class Blob(models.Model):
+    """Общее зашифрованное содержимое для одинаковых файлов (DEDUP_ENABLED)."""
+    digest = models.CharField(max_length=64, unique=True)
+    storage_name = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    refcount = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.digest[:12]} x{self.refcount}"
+
 class File(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="files")
     original_name = models.CharField(max_length=255)
     file = models.FileField(upload_to=upload_path, storage=efs)
+    blob = models.ForeignKey(Blob, on_delete=models.PROTECT, null=True, blank=True, related_name="files")
     size = models.BigIntegerField()
+    # сколько занимает в хранилище после сжатия и шифрования (None — не измерялось)
+    stored_size = models.BigIntegerField(blank=True, null=True)
+    # HMAC-дайджест открытого текста (efs.content_hasher), основа ETag; пустой у старых файлов
+    digest = models.CharField(max_length=64, blank=True, default="")
     uploaded_at = models.DateTimeField(auto_now_add=True)
     description = models.TextField(blank=True, null=True)
 
     last_downloaded_at = models.DateTimeField(blank=True, null=True)
     download_count = models.PositiveIntegerField(default=0)
+    # эпоха подписанных ссылок (app.links.signing): +1 отзывает все выданные на файл
+    link_epoch = models.PositiveIntegerField(default=0)
 
     class Meta:
         ordering = ["-uploaded_at"]
+        # под keyset-пагинацию и фильтры списка (app.files.filters): (user, поле, id)
+        indexes = [
+            models.Index(fields=["user", "-uploaded_at", "-id"], name="file_user_uploaded_idx"),
+            models.Index(fields=["user", "size", "id"], name="file_user_size_idx"),
+            models.Index(fields=["user", "original_name", "id"], name="file_user_name_idx"),
+            models.Index(fields=["-uploaded_at", "-id"], name="file_uploaded_idx"),
+            models.Index(fields=["original_name"], name="file_name_prefix_idx", opclasses=["varchar_pattern_ops"]),
+        ]
 
     def __str__(self):
         return f"{self.original_name} ({self.user_id})"
 
-def delete_content_file(sender, instance, **kwargs):
-    try:
-        name = getattr(instance, "file").name if getattr(instance, "file") else None
-    except Exception:
-        name = None
-    if name and efs.exists(name):
-        try:
-            efs.delete(name)
-        except Exception:
-            pass
-
-@receiver(post_delete, sender=File)
-def on_file_row_deleted(sender, instance, **kwargs):
-    delete_content_file(sender, instance, **kwargs)
\ No newline at end of file
+    @property
+    def etag(self):
+        # содержимое File не меняется после загрузки, поэтому валидатор можно брать из метаданных
+        if self.digest:
+            return f'"{self.digest}"'
+        return f'W/"{self.pk}-{self.size}-{int(self.uploaded_at.timestamp())}"'
+
+class PendingHit(models.Model):
+    """
+    Скачивания, уже снятые с буфера процесса, но ещё не внесённые в счётчики
+    (app.common.counters): общий для всех процессов журнал, его разбирает любой
+    из них или manage.py flush_counters.
+    """
+    model = models.CharField(max_length=100)  # app_label.ModelName
+    object_id = models.BigIntegerField()
+    count = models.PositiveIntegerField()
+    last_at = models.DateTimeField()
+
+class SearchTerm(models.Model):
+    """Инвертированный индекс для поиска без Postgres (app.files.search); на Postgres пуст."""
+    term = models.CharField(max_length=64, db_index=True)
+    file = models.ForeignKey(File, on_delete=models.CASCADE, related_name="search_terms")
+
+class UploadSession(models.Model):
+    """
+    Поэтапная загрузка: куски шифруются и пишутся сразу в итоговый файл хранилища,
+    запись File создаётся только при commit.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="upload_sessions")
+    original_name = models.CharField(max_length=255)
+    description = models.TextField(blank=True, null=True)
+    size = models.BigIntegerField()
+    chunk_size = models.PositiveIntegerField()
+    storage_name = models.CharField(max_length=255)
+    received = models.JSONField(default=list)
+    # куски, которые сейчас пишутся: номер занят, пока запрос не закончит запись
+    pending = models.JSONField(default=list)
+    # commit начался: куски больше не принимаются, размер уже зарезервирован в квоте
+    committing = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+
+    @property
+    def chunk_count(self):
+        return max(1, -(-self.size // self.chunk_size))
+
+    def missing_chunks(self):
+        got = set(self.received)
+        return [i for i in range(self.chunk_count) if i not in got]
+
+    def chunk_length(self, index):
+        return min(self.chunk_size, self.size - index * self.chunk_size)
+
+    def abort(self):
+        if self.storage_name:
+            try:
+                efs.abort_upload(self.storage_name)
+            except Exception:
+                pass
+        self.delete()
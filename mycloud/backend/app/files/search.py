@@ -0,0 +1,115 @@
+"""
+Поиск файлов по имени и описанию.
+
+Postgres: полнотекстовый поиск (to_tsvector / to_tsquery, конфигурация simple —
+без стемминга, имена бывают на любом языке) плюс нечёткое совпадение по
+триграммам имени (pg_trgm, word_similarity — опечатки и куски слов).
+Оба условия обслуживают GIN-индексы по выражениям; их и расширение pg_trgm
+создаёт install_indexes после migrate — миграции в репозитории не хранятся,
+а SQLite такие индексы не поймёт. Индекс по выражению работает, только если
+запрос использует то же выражение, поэтому оно собирается в одном месте (_vector).
+
+Прочие БД (SQLite в тестах и разработке): инвертированный индекс SearchTerm
+(слово -> файл), его ведут сигналы File; ранг — число совпавших слов.
+
+Семантика у обоих одна: слова запроса (tokenize) через ИЛИ, каждое — по началу
+слова (в Postgres — префиксный терм "слово:*"), и слова текста режутся так же,
+как в tokenize (в Postgres — regexp_replace по не-буквам и не-цифрам до разбора).
+"""
+import re
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.db.models import BooleanField, Count, FloatField, Q
+from django.db.models.expressions import RawSQL
+
+from .models import File, SearchTerm
+
+CONFIG = "simple"
+MAX_TERMS = 8
+_WORD = re.compile(r"[^\W_]+")
+
+
+def tokenize(text):
+    """Уникальные слова в нижнем регистре, в порядке появления."""
+    return list(dict.fromkeys(_WORD.findall((text or "").lower())))
+
+
+def uses_postgres(using=DEFAULT_DB_ALIAS):
+    return connections[using].vendor == "postgresql"
+
+
+def _columns():
+    quote = connection.ops.quote_name
+    table = quote(File._meta.db_table)
+    return f"{table}.{quote('original_name')}", f"{table}.{quote('description')}"
+
+
+def _vector(name, description):
+    text = f"coalesce({name}, '') || ' ' || coalesce({description}, '')"
+    return f"to_tsvector('{CONFIG}'::regconfig, regexp_replace({text}, '[^[:alnum:]]+', ' ', 'g'))"
+
+
+def prefix_query(query):
+    """Текст для to_tsquery: слова запроса как префиксы через ИЛИ; пусто — искать нечего."""
+    return " | ".join(f"{term}:*" for term in tokenize(query)[:MAX_TERMS])
+
+
+def search(qs, query, limit):
+    """До limit файлов из qs, подходящих под query, от лучшего совпадения к худшему."""
+    if uses_postgres(qs.db):
+        return list(_search_postgres(qs, query)[:limit])
+    return list(_search_index(qs, query)[:limit])
+
+
+def _search_postgres(qs, query):
+    terms = prefix_query(query)
+    if not terms:
+        return qs.none()
+    name, description = _columns()
+    vector = _vector(name, description)
+    tsquery = f"to_tsquery('{CONFIG}'::regconfig, %s)"
+    match = RawSQL(f"({vector} @@ {tsquery} OR %s <%% {name})", (terms, query), output_field=BooleanField())
+    rank = RawSQL(f"ts_rank({vector}, {tsquery}) + word_similarity(%s, {name})", (terms, query),
+                  output_field=FloatField())
+    return qs.filter(match).annotate(rank=rank).order_by("-rank", "-id")
+
+
+def _search_index(qs, query):
+    terms = tokenize(query)[:MAX_TERMS]
+    if not terms:
+        return qs.none()
+    match = Q()
+    for term in terms:
+        match |= Q(search_terms__term__startswith=term)
+    rank = Count("search_terms", filter=match, distinct=True)
+    return qs.annotate(rank=rank).filter(rank__gt=0).order_by("-rank", "-id")
+
+
+def index_file(file_obj):
+    """Переписывает слова файла в SearchTerm (только без Postgres)."""
+    SearchTerm.objects.filter(file=file_obj).delete()
+    terms = tokenize(f"{file_obj.original_name} {file_obj.description or ''}")
+    SearchTerm.objects.bulk_create([SearchTerm(file=file_obj, term=t[:64]) for t in terms])
+
+
+def install_indexes(using=DEFAULT_DB_ALIAS, verbosity=1, **kwargs):
+    """
+    Обработчик post_migrate. Postgres — pg_trgm и GIN-индексы (IF NOT EXISTS,
+    повторный migrate ничего не делает); иначе — дозаполняет SearchTerm для
+    файлов, загруженных до появления индекса.
+    """
+    conn = connections[using]
+    if conn.vendor != "postgresql":
+        missing = File.objects.using(using).filter(search_terms__isnull=True)
+        for file_obj in missing.iterator():
+            index_file(file_obj)
+        return
+    table = conn.ops.quote_name(File._meta.db_table)
+    name, description = conn.ops.quote_name("original_name"), conn.ops.quote_name("description")
+    with conn.cursor() as cursor:
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        # прежний индекс был по другому выражению (без regexp_replace) — запросы его не используют
+        cursor.execute("DROP INDEX IF EXISTS file_search_fts_idx")
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS file_search_fts_v2_idx ON {table} "
+                       f"USING gin (({_vector(name, description)}))")
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS file_search_trgm_idx ON {table} "
+                       f"USING gin ({name} gin_trgm_ops)")
@@ -1,6 +1,6 @@
 from rest_framework import serializers
 from django.conf import settings
-from .models import File
+from .models import File, UploadSession
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
@@ -15,27 +15,102 @@ class FileSerializer(serializers.ModelSerializer):
     user = UserBriefSerializer(read_only=True)
     class Meta:
         model = File
-        fields = ("id", "original_name", "size", "uploaded_at", "description", "user")
-        read_only_fields = ("id", "size", "uploaded_at", "original_name", "user")
+        fields = ("id", "original_name", "size", "stored_size", "uploaded_at", "description", "user")
+        read_only_fields = ("id", "size", "stored_size", "uploaded_at", "original_name", "user")
+
+def check_quota(user, size):
+    """Проверка лимита по счётчикам пользователя — без агрегации по таблице файлов."""
+    if user is None or not user.is_authenticated:
+        return
+    quota = user.quota_bytes()
+    if quota and user.files_total_size + size > quota:
+        raise serializers.ValidationError(
+            f"Превышен лимит хранилища: занято {user.files_total_size} из {quota} байт"
+        )
+
+
+def check_upload_size(f):
+    max_size = getattr(settings, "MAX_UPLOAD_SIZE", 100*1024*1024)
+    if f.size > max_size:
+        raise serializers.ValidationError(f"Размер файла {f.name} превышает лимит {max_size} байт")
+
 
 class FileUploadSerializer(serializers.Serializer):
     file = serializers.FileField()
     description = serializers.CharField(required=False, allow_blank=True, allow_null=True)
 
     def validate_file(self, f):
-        max_size = getattr(settings, "MAX_UPLOAD_SIZE", 100*1024*1024)
-        if f.size > max_size:
-            raise serializers.ValidationError(f"Размер файла превышает лимит {max_size} байт")
+        check_upload_size(f)
+        request = self.context.get("request")
+        check_quota(getattr(request, "user", None), f.size)
         return f
 
 
+def bulk_limit():
+    return getattr(settings, "BULK_MAX_FILES", 1000)
+
+
+class BulkUploadSerializer(serializers.Serializer):
+    files = serializers.ListField(child=serializers.FileField(), allow_empty=False)
+    description = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+
+    def validate_files(self, files):
+        if len(files) > bulk_limit():
+            raise serializers.ValidationError(f"Не больше {bulk_limit()} файлов за запрос")
+        for f in files:
+            check_upload_size(f)
+        request = self.context.get("request")
+        check_quota(getattr(request, "user", None), sum(f.size for f in files))
+        return files
+
+
+class SearchQuerySerializer(serializers.Serializer):
+    q = serializers.CharField(min_length=2, max_length=200, help_text="Слова из имени или описания; допустимы опечатки")
+    limit = serializers.IntegerField(required=False, default=50, min_value=1, max_value=200)
+
+
+class FileIdsSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False)
+
+    def validate_ids(self, ids):
+        if len(ids) > bulk_limit():
+            raise serializers.ValidationError(f"Не больше {bulk_limit()} файлов за запрос")
+        return list(dict.fromkeys(ids))
+
+
 class FileAdminSerializer(serializers.ModelSerializer):
     user = serializers.SerializerMethodField()
 
     class Meta:
         model = File
-        fields = ("id", "original_name", "size", "uploaded_at", "description", "user")
+        fields = ("id", "original_name", "size", "stored_size", "uploaded_at", "description", "user")
 
     def get_user(self, obj):
         u = obj.user
         return {"id": u.id, "username": u.username, "email": u.email}
+
+
+class UploadSessionCreateSerializer(serializers.Serializer):
+    name = serializers.CharField(max_length=255)
+    size = serializers.IntegerField(min_value=0)
+    description = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+
+    def validate_size(self, v):
+        max_size = getattr(settings, "MAX_UPLOAD_SESSION_SIZE", 10 * 1024 * 1024 * 1024)
+        if v > max_size:
+            raise serializers.ValidationError(f"Размер файла превышает лимит {max_size} байт")
+        request = self.context.get("request")
+        check_quota(getattr(request, "user", None), v)
+        return v
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    chunk_count = serializers.IntegerField(read_only=True)
+    missing = serializers.SerializerMethodField()
+
+    class Meta:
+        model = UploadSession
+        fields = ("id", "original_name", "size", "chunk_size", "chunk_count", "received", "missing", "created_at")
+
+    def get_missing(self, obj):
+        return obj.missing_chunks()
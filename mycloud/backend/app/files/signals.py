@@ -1,23 +1,75 @@
-from django.db.models.signals import post_delete
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.contrib.auth import get_user_model
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
 from app.files.models import File
+from app.files import blobs, delivery, search
+from app.files.tasks import delete_stored
+
+
+# групповое удаление (app.files.bulk) само пересчитывает счётчики и освобождает блобы пачкой
+_bulk_delete = ContextVar("files_bulk_delete", default=False)
+
+
+@contextmanager
+def bulk_delete():
+    token = _bulk_delete.set(True)
+    try:
+        yield
+    finally:
+        _bulk_delete.reset(token)
+
+
+def _bump_usage(user_id, count, size):
+    get_user_model().objects.filter(pk=user_id).update(
+        files_count=F("files_count") + count,
+        files_total_size=F("files_total_size") + size,
+    )
+
+
+@receiver(post_save, sender=File)
+def count_created_file(sender, instance: File, created, **kwargs):
+    if created:
+        _bump_usage(instance.user_id, 1, instance.size)
+
+
+@receiver(post_save, sender=File)
+def index_saved_file(sender, instance: File, created, update_fields=None, **kwargs):
+    """Без Postgres поиск идёт по SearchTerm — переписываем слова при создании и переименовании."""
+    if search.uses_postgres(kwargs.get("using", "default")):
+        return
+    if created or update_fields is None or {"original_name", "description"} & set(update_fields):
+        search.index_file(instance)
+
+
+@receiver(post_delete, sender=File)
+def count_deleted_file(sender, instance: File, **kwargs):
+    if _bulk_delete.get():
+        return
+    _bump_usage(instance.user_id, -1, -instance.size)
 
 
 @receiver(post_delete, sender=File)
 def delete_content_file(sender, instance: File, **kwargs):
     """
-    При удалении записи удаляем и физический файл
-    через тот же storage, что привязан к FileField.
+    При удалении записи удаляем и физический файл — фоновой задачей, чтобы
+    запрос не ждал хранилище. Общий блоб (дедупликация) удаляется только
+    вместе с последней ссылкой.
     """
+    if _bulk_delete.get():
+        return
+    if instance.blob_id:
+        blobs.release(instance.blob_id)
+        return
     f = getattr(instance, "file", None)
     if not f:
         return
     name = f.name
-    storage = f.storage
-    if name and storage.exists(name):
-        try:
-            storage.delete(name)
-        except Exception:
-            # намеренно не роняем удаление записи
-            pass
+    if name:
+        # локальная копия для nginx — сразу, чтобы удалённый файл больше не отдавался
+        delivery.forget(name)
+        delete_stored.delay([name])
@@ -0,0 +1,69 @@
+import logging
+from django.conf import settings
+from django.db import transaction
+from app.core.storage import CorruptedFileError
+from app.tasks.queue import task
+from .models import File, efs
+from . import delivery
+
+logger = logging.getLogger(__name__)
+
+
+@task
+def delete_stored(names):
+    """Удаляет файлы из хранилища и кэша отдачи; повтор безопасен — отсутствующие пропускаются."""
+    for name in names:
+        delivery.forget(name)
+        if efs.exists(name):
+            efs.delete(name)
+
+
+@task(max_attempts=2)
+def verify_upload(file_id):
+    """Проверка только что загруженного файла полной расшифровкой (VERIFY_UPLOADS)."""
+    obj = File.objects.filter(pk=file_id).only("file").first()
+    if obj is None:
+        return
+    try:
+        efs.verify(obj.file.name)
+    except CorruptedFileError:
+        logger.error("Загруженный файл %s (%s) не прошёл проверку целостности", file_id, obj.file.name)
+
+
+@task
+def digest_upload(file_id):
+    """
+    Дайджест файла поэтапной загрузки (до него ETag слабый, из метаданных) и
+    переход на общий Blob (DEDUP_ENABLED). Дайджест требует прочитать и
+    расшифровать файл целиком, поэтому считается здесь, а не в commit, и без
+    блокировок; под блокировкой строки File — только смена ссылки на содержимое.
+    """
+    from app.links import cache as link_cache
+    from . import blobs
+
+    obj = File.objects.filter(pk=file_id, digest="").only("file", "size").first()
+    if obj is None:
+        return
+    name = obj.file.name
+    digest = blobs.stored_digest(name)
+    if not blobs.dedup_enabled():
+        File.objects.filter(pk=file_id, digest="", file=name).update(digest=digest)
+        # update() не шлёт post_save — кэш ссылок сбрасываем сами
+        link_cache.invalidate_file(file_id)
+        return
+    with transaction.atomic():
+        if not File.objects.select_for_update().filter(pk=file_id, digest="", file=name).exists():
+            return  # файл удалили, пока считался дайджест
+        blob = blobs.adopt(name, obj.size, digest=digest)
+        File.objects.filter(pk=file_id).update(
+            blob=blob, file=blob.storage_name, digest=digest, stored_size=efs.size(blob.storage_name),
+        )
+        transaction.on_commit(lambda: link_cache.invalidate_file(file_id))
+
+
+def after_upload(file_obj):
+    """Постобработка новой загрузки — задачами в очереди, а не в запросе."""
+    if not file_obj.digest:
+        digest_upload.delay(file_obj.pk)
+    if getattr(settings, "VERIFY_UPLOADS", False):
+        verify_upload.delay(file_obj.pk)
@@ -0,0 +1,105 @@
+"""
+Загрузка без промежуточного временного файла: EncryptingUploadHandler шифрует
+куски multipart по мере их прихода и пишет сразу в итоговый файл хранилища
+(efs.open_writer), попутно считая дайджест. Размер файла и квота проверяются
+на лету — при превышении запись обрывается, не дочитав тело. Вьюхе остаётся
+сохранить метаданные: в request.FILES лежат EncryptedUpload.
+"""
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+from rest_framework.exceptions import ValidationError
+
+from .models import File, efs, upload_path
+from .tasks import delete_stored
+
+RAW_SLACK = 64 * 1024  # заголовки multipart и текстовые поля сверх содержимого файлов
+
+
+class EncryptedUpload(UploadedFile):
+    """
+    Файл, уже записанный в хранилище под storage_name. Если к концу запроса он
+    так и не попал в File (ошибка валидации, исключение), close() его удаляет.
+    """
+
+    def __init__(self, name, content_type, size, charset, storage_name, digest):
+        super().__init__(None, name, content_type, size, charset)
+        self.storage_name = storage_name
+        self.digest = digest
+        self.committed = False
+
+    def open(self, mode=None):
+        raise ValueError("Содержимое уже зашифровано и записано в хранилище")
+
+    def chunks(self, chunk_size=None):
+        raise ValueError("Содержимое уже зашифровано и записано в хранилище")
+
+    @property
+    def closed(self):
+        return self.storage_name is None
+
+    def close(self):
+        if self.storage_name and not self.committed:
+            delete_stored.delay([self.storage_name])
+        self.storage_name = None
+
+
+def quota_left(user):
+    """Сколько байт пользователь ещё может загрузить; None — без лимита."""
+    if user is None or not user.is_authenticated:
+        return None
+    quota = user.quota_bytes()
+    return quota - user.files_total_size if quota else None
+
+
+class EncryptingUploadHandler(FileUploadHandler):
+    chunk_size = 1024 * 1024  # кратно сегменту шифрования
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.max_size = getattr(settings, "MAX_UPLOAD_SIZE", 100 * 1024 * 1024)
+        self.quota_left = None
+        self.received = 0
+        self.writer = None
+
+    def _fail(self, message):
+        if self.writer is not None:
+            self.writer.abort()
+            self.writer = None
+        raise ValidationError({self.field_name or "file": [message]})
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        self.quota_left = quota_left(getattr(self.request, "user", None))
+        if self.quota_left is not None and content_length > self.quota_left + RAW_SLACK:
+            self._fail(f"Превышен лимит хранилища: доступно {max(self.quota_left, 0)} байт")
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+        if content_length and content_length > self.max_size:
+            self._fail(f"Размер файла {file_name} превышает лимит {self.max_size} байт")
+        owner = File(user=self.request.user)
+        self.writer = efs.open_writer(upload_path(owner, file_name), content_type)
+        self.hasher = efs.content_hasher()
+        self.size = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.size += len(raw_data)
+        self.received += len(raw_data)
+        if self.size > self.max_size:
+            self._fail(f"Размер файла {self.file_name} превышает лимит {self.max_size} байт")
+        if self.quota_left is not None and self.received > self.quota_left:
+            self._fail(f"Превышен лимит хранилища: доступно {max(self.quota_left, 0)} байт")
+        self.hasher.update(raw_data)
+        self.writer.write(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        name = self.writer.close()
+        self.writer = None
+        return EncryptedUpload(self.file_name, self.content_type, file_size, self.charset,
+                               name, self.hasher.hexdigest())
+
+    def upload_interrupted(self):
+        if self.writer is not None:
+            self.writer.abort()
+            self.writer = None
@@ -1,8 +1,19 @@
+from django.conf import settings
+from django.urls import path
 from rest_framework.routers import DefaultRouter
-from .views import FileViewSet, AdminFileViewSet
+from . import async_views
+from .views import FileViewSet, AdminFileViewSet, UploadSessionViewSet
 
 router = DefaultRouter()
 router.register(r"files", FileViewSet, basename="files")
 router.register(r"admin/files", AdminFileViewSet, basename="admin-files")
+router.register(r"uploads", UploadSessionViewSet, basename="uploads")
 
 urlpatterns = router.urls
+
+if getattr(settings, "ASYNC_DOWNLOADS", False):
+    # под ASGI скачивание обслуживают async-вьюхи; маршруты раньше роутера DRF
+    urlpatterns = [
+        path("files/<int:pk>/download/", async_views.download, name="files-download"),
+        path("admin/files/<int:pk>/download/", async_views.admin_download, name="admin-files-admin-download"),
+    ] + urlpatterns
@@ -1,41 +1,59 @@
-import mimetypes
-from django.http import StreamingHttpResponse
-from rest_framework import viewsets, status
+from rest_framework import viewsets, mixins, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
-from django.db.models import F
-from django.utils import timezone
-from .models import File
-from .serializers import FileSerializer, FileUploadSerializer, FileAdminSerializer
+from rest_framework.exceptions import NotFound
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Sum
+from django.http import StreamingHttpResponse
+from django.utils.http import content_disposition_header
+from .models import File, UploadSession, efs, upload_path
+from . import blobs, bulk
+from .search import search as search_files
+from .tasks import after_upload
+from .uploads import EncryptingUploadHandler, EncryptedUpload
+from .serializers import (
+    FileSerializer,
+    FileUploadSerializer,
+    BulkUploadSerializer,
+    FileIdsSerializer,
+    FileAdminSerializer,
+    UploadSessionCreateSerializer,
+    UploadSessionSerializer,
+    SearchQuerySerializer,
+    check_quota,
+)
 from app.common.permissions import IsOwnerOrAdmin
-from app.core.storage import EncryptedFileSystemStorage
+from app.common.pagination import KeysetPagination
+from app.common.counters import hits
+from app.core import readcache
+from .filters import apply_file_filters, DEFAULT_ORDERING
+from .downloads import file_response, counts_as_download, streaming_body
 from drf_spectacular.utils import extend_schema, OpenApiResponse
 from drf_spectacular.types import OpenApiTypes
 
-CHUNK = 64 * 1024
-
-def _iter_file(fobj, chunk_size=CHUNK):
-    try:
-        while True:
-            chunk = fobj.read(chunk_size)
-            if not chunk:
-                break
-            yield chunk
-    finally:
-        try:
-            fobj.close()
-        except Exception:
-            pass
-
-efs = EncryptedFileSystemStorage()
+User = get_user_model()
 
 class FileViewSet(viewsets.ModelViewSet):
     serializer_class = FileSerializer
     permission_classes = [IsAuthenticated, IsOwnerOrAdmin]
+    pagination_class = KeysetPagination
+    keyset_ordering = DEFAULT_ORDERING
+
+    def initialize_request(self, request, *args, **kwargs):
+        drf_request = super().initialize_request(request, *args, **kwargs)
+        if self.action in ("create", "bulk_upload"):
+            # файлы шифруются прямо в хранилище по мере приёма, без временного файла
+            request.upload_handlers = [EncryptingUploadHandler(request)]
+        return drf_request
 
     def get_queryset(self):
-        return File.objects.filter(user=self.request.user)
+        qs = File.objects.select_related("user").filter(user=self.request.user)
+        if self.action == "list":
+            qs, self.keyset_ordering = apply_file_filters(qs, self.request.query_params)
+        return qs
 
     @extend_schema(
         request=FileUploadSerializer,
@@ -43,40 +61,100 @@ class FileViewSet(viewsets.ModelViewSet):
         description="Загрузка файла (multipart/form-data)"
     )
     def create(self, request, *args, **kwargs):
-        serializer = FileUploadSerializer(data=request.data)
+        serializer = FileUploadSerializer(data=request.data, context={"request": request})
         serializer.is_valid(raise_exception=True)
         f = serializer.validated_data["file"]
         description = serializer.validated_data.get("description", "")
-        obj = File.objects.create(
-            user=request.user,
-            original_name=f.name,
-            file=f,
-            size=f.size,
-            description=description,
-        )
+        with transaction.atomic():
+            obj = self._store(f, description)
         return Response(FileSerializer(obj).data, status=status.HTTP_201_CREATED)
 
+    def _store(self, f, description):
+        obj = File(user=self.request.user, original_name=f.name, size=f.size, description=description)
+        if isinstance(f, EncryptedUpload):
+            # содержимое уже записано upload handler'ом — остаются только метаданные
+            if blobs.dedup_enabled():
+                obj.blob = blobs.adopt(f.storage_name, f.size, digest=f.digest)
+                obj.file, obj.digest = obj.blob.storage_name, obj.blob.digest
+            else:
+                obj.file.name, obj.digest = f.storage_name, f.digest
+            # при откате транзакции файл удалит f.close() в конце запроса
+            transaction.on_commit(lambda: setattr(f, "committed", True))
+        elif blobs.dedup_enabled():
+            obj.blob = blobs.store(f)
+            obj.file, obj.digest = obj.blob.storage_name, obj.blob.digest
+        else:
+            content = blobs.DigestingFile(f)
+            obj.file.save(f.name, content, save=False)
+            obj.digest = content.hexdigest()
+        obj.stored_size = efs.size(obj.file.name)
+        obj.save()
+        after_upload(obj)
+        return obj
+
     @extend_schema(
-        responses={200: OpenApiResponse(description="Файл (binary)", response=OpenApiTypes.BINARY)}
+        request=BulkUploadSerializer,
+        responses={201: FileSerializer(many=True)},
+        description="Загрузка нескольких файлов одним запросом (поле files повторяется)"
+    )
+    @action(detail=False, methods=["post"], url_path="bulk-upload")
+    def bulk_upload(self, request):
+        serializer = BulkUploadSerializer(data=request.data, context={"request": request})
+        serializer.is_valid(raise_exception=True)
+        description = serializer.validated_data.get("description", "")
+        with transaction.atomic():
+            objs = [self._store(f, description) for f in serializer.validated_data["files"]]
+        return Response(FileSerializer(objs, many=True).data, status=status.HTTP_201_CREATED)
+
+    @extend_schema(request=FileIdsSerializer, responses={200: OpenApiTypes.OBJECT})
+    @action(detail=False, methods=["post"], url_path="bulk-delete")
+    def bulk_delete(self, request):
+        serializer = FileIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        deleted = bulk.delete_files(File.objects.filter(user=request.user, pk__in=serializer.validated_data["ids"]))
+        return Response({"deleted": deleted})
+
+    @extend_schema(parameters=[SearchQuerySerializer], responses={200: FileSerializer(many=True)},
+                   description="Поиск по имени и описанию, лучшие совпадения первыми")
+    @action(detail=False, methods=["get"], url_path="search")
+    def search(self, request):
+        params = SearchQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        files = search_files(self.get_queryset(), params.validated_data["q"], params.validated_data["limit"])
+        return Response(FileSerializer(files, many=True).data)
+
+    @extend_schema(
+        request=FileIdsSerializer,
+        responses={200: OpenApiResponse(description="ZIP-архив", response=OpenApiTypes.BINARY)},
+    )
+    @action(detail=False, methods=["post"], url_path="archive")
+    def archive(self, request):
+        serializer = FileIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        files = list(File.objects.filter(user=request.user, pk__in=serializer.validated_data["ids"])
+                     .order_by("original_name", "id"))
+        if not files:
+            return Response({"detail": "Файлы не найдены"}, status=status.HTTP_404_NOT_FOUND)
+        # под ASGI синхронный итератор Django вычитал бы в память целиком — архив собирался бы там
+        resp = StreamingHttpResponse(streaming_body(request, bulk.zip_stream(files)), content_type="application/zip")
+        resp["Content-Disposition"] = content_disposition_header(True, "files.zip")
+        return resp
+
+    @extend_schema(
+        responses={
+            200: OpenApiResponse(description="Файл (binary)", response=OpenApiTypes.BINARY),
+            206: OpenApiResponse(description="Часть файла (Range)", response=OpenApiTypes.BINARY),
+        }
     )
     @action(detail=True, methods=["get"], url_path="download")
     def download(self, request, pk=None):
         file_obj = self.get_object()
-        name = file_obj.file.name
-        if not efs.exists(name):
+        resp = file_response(request, file_obj)
+        if resp is None:
             return Response({"detail": "Файл не найден на диске"}, status=status.HTTP_404_NOT_FOUND)
 
-        fobj = efs.open_decrypted(name)
-        ctype = mimetypes.guess_type(file_obj.original_name)[0] or "application/octet-stream"
-
-        resp = StreamingHttpResponse(_iter_file(fobj), content_type=ctype)
-        resp["Content-Disposition"] = f'attachment; filename="{file_obj.original_name}"'
-        resp["Content-Length"] = str(file_obj.size)
-
-        File.objects.filter(pk=file_obj.pk).update(
-            last_downloaded_at=timezone.now(),
-            download_count=F("download_count") + 1,
-        )
+        if counts_as_download(resp):
+            hits.hit(File, file_obj.pk)
         return resp
 
 
@@ -84,33 +162,170 @@ class AdminFileViewSet(viewsets.ModelViewSet):
     queryset = File.objects.select_related("user").all()
     serializer_class = FileAdminSerializer
     permission_classes = [IsAdminUser]
+    pagination_class = KeysetPagination
+    keyset_ordering = DEFAULT_ORDERING
 
     def get_queryset(self):
         qs = super().get_queryset()
         user_id = self.request.query_params.get("user") or self.request.query_params.get("user_id")
         if user_id:
             qs = qs.filter(user_id=user_id)
+        if self.action == "list":
+            qs, self.keyset_ordering = apply_file_filters(qs, self.request.query_params)
         return qs
 
+    @extend_schema(parameters=[SearchQuerySerializer], responses={200: FileAdminSerializer(many=True)},
+                   description="Поиск по всем файлам (или файлам пользователя ?user=)")
+    @action(detail=False, methods=["get"], url_path="search")
+    def search(self, request):
+        params = SearchQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        files = search_files(self.get_queryset(), params.validated_data["q"], params.validated_data["limit"])
+        return Response(FileAdminSerializer(files, many=True).data)
+
+    @extend_schema(responses={200: OpenApiTypes.OBJECT}, description="Статистика кэша расшифрованных сегментов этого процесса")
+    @action(detail=False, methods=["get"], url_path="read-cache")
+    def read_cache(self, request):
+        return Response(readcache.stats())
+
     @extend_schema(
-        responses={200: OpenApiResponse(description="Файл (binary)", response=OpenApiTypes.BINARY)}
+        responses={
+            200: OpenApiResponse(description="Файл (binary)", response=OpenApiTypes.BINARY),
+            206: OpenApiResponse(description="Часть файла (Range)", response=OpenApiTypes.BINARY),
+        }
     )
     @action(detail=True, methods=["get"], url_path="download")
     def admin_download(self, request, pk=None):
         file_obj = self.get_object()
-        name = file_obj.file.name
-        if not efs.exists(name):
+        resp = file_response(request, file_obj)
+        if resp is None:
             return Response({"detail": "Файл не найден на диске"}, status=status.HTTP_404_NOT_FOUND)
 
-        fobj = efs.open_decrypted(name)
-        ctype = mimetypes.guess_type(file_obj.original_name)[0] or "application/octet-stream"
+        if counts_as_download(resp):
+            hits.hit(File, file_obj.pk)
+        return resp
+
 
-        resp = StreamingHttpResponse(_iter_file(fobj), content_type=ctype)
-        resp["Content-Disposition"] = f'attachment; filename="{file_obj.original_name}"'
-        resp["Content-Length"] = str(file_obj.size)
+class UploadSessionViewSet(mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    """
+    Возобновляемая загрузка: POST — создать сессию, PUT chunks/<n>/ — тело куска,
+    GET — статус (какие куски ещё нужны), POST commit/ — создать File, DELETE — отменить.
+    """
+    serializer_class = UploadSessionSerializer
+    permission_classes = [IsAuthenticated, IsOwnerOrAdmin]
+
+    def get_queryset(self):
+        return UploadSession.objects.filter(user=self.request.user)
 
-        File.objects.filter(pk=file_obj.pk).update(
-            last_downloaded_at=timezone.now(),
-            download_count=F("download_count") + 1,
+    @extend_schema(request=UploadSessionCreateSerializer, responses={201: UploadSessionSerializer})
+    def create(self, request, *args, **kwargs):
+        serializer = UploadSessionCreateSerializer(data=request.data, context={"request": request})
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        seg = efs.segment_size
+        chunk_size = max(1, getattr(settings, "UPLOAD_CHUNK_SIZE", 8 * 1024 * 1024) // seg) * seg
+        session = UploadSession(
+            user=request.user,
+            original_name=data["name"],
+            description=data.get("description", ""),
+            size=data["size"],
+            chunk_size=chunk_size,
         )
-        return resp
+        session.storage_name = efs.begin_upload(upload_path(session, data["name"]))
+        session.save()
+        return Response(UploadSessionSerializer(session).data, status=status.HTTP_201_CREATED)
+
+    @extend_schema(
+        request={"application/octet-stream": OpenApiTypes.BINARY},
+        responses={200: UploadSessionSerializer},
+        description="Тело запроса — байты куска; все куски, кроме последнего, ровно chunk_size",
+    )
+    @action(detail=True, methods=["put"], url_path=r"chunks/(?P<index>\d+)")
+    def chunk(self, request, pk=None, index=None):
+        session = self.get_object()
+        index = int(index)
+        if index >= session.chunk_count:
+            return Response({"detail": "Номер куска вне диапазона"}, status=status.HTTP_400_BAD_REQUEST)
+        length = session.chunk_length(index)
+        if int(request.META.get("CONTENT_LENGTH") or 0) != length:
+            return Response({"detail": f"Ожидается кусок длиной {length} байт"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # под блокировкой только занимаем номер куска: запись идёт без транзакции,
+        # и параллельные куски одной сессии не ждут друг друга
+        with transaction.atomic():
+            session = self._lock(session)
+            if index in session.received:
+                # повторная запись зашифровала бы другие данные тем же ключом и nonce сегмента
+                return Response({"detail": "Кусок уже загружен"}, status=status.HTTP_409_CONFLICT)
+            if index in session.pending:
+                return Response({"detail": "Кусок уже загружается"}, status=status.HTTP_409_CONFLICT)
+            session.pending = session.pending + [index]
+            session.save(update_fields=["pending", "updated_at"])
+        written = False
+        try:
+            efs.write_chunk(session.storage_name, index * session.chunk_size, request.stream, length, session.size)
+            written = True
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        finally:
+            with transaction.atomic():
+                session = self._lock(session)
+                session.pending = [i for i in session.pending if i != index]
+                if written:
+                    session.received = sorted(session.received + [index])
+                session.save(update_fields=["pending", "received", "updated_at"])
+        return Response(UploadSessionSerializer(session).data)
+
+    @extend_schema(request=None, responses={201: FileSerializer})
+    @action(detail=True, methods=["post"])
+    def commit(self, request, pk=None):
+        # под блокировками — только проверки и метаданные: склейка кусков идёт без них,
+        # дайджест (ETag) и дедупликация — задачей digest_upload после коммита
+        with transaction.atomic():
+            session = self._lock(self.get_object())
+            if session.pending:
+                return Response({"detail": "Куски ещё загружаются", "pending": session.pending},
+                                status=status.HTTP_409_CONFLICT)
+            missing = session.missing_chunks()
+            if missing:
+                return Response({"detail": "Загружены не все куски", "missing": missing},
+                                status=status.HTTP_409_CONFLICT)
+            # квота проверялась при создании сессии; параллельные сессии могли её с тех пор выбрать
+            owner = User.objects.select_for_update().get(pk=session.user_id)
+            reserved = UploadSession.objects.filter(user=owner, committing=True).aggregate(n=Sum("size"))["n"]
+            check_quota(owner, (reserved or 0) + session.size)
+            session.committing = True
+            session.save(update_fields=["committing", "updated_at"])
+        try:
+            efs.finish_upload(session.storage_name)
+        except Exception:
+            UploadSession.objects.filter(pk=session.pk).update(committing=False)
+            raise
+        with transaction.atomic():
+            obj = File.objects.create(
+                user=owner,
+                original_name=session.original_name,
+                file=session.storage_name,
+                size=session.size,
+                stored_size=efs.size(session.storage_name),
+                description=session.description,
+            )
+            session.delete()
+            after_upload(obj)
+        return Response(FileSerializer(obj).data, status=status.HTTP_201_CREATED)
+
+    def destroy(self, request, pk=None):
+        with transaction.atomic():
+            self._lock(self.get_object()).abort()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @staticmethod
+    def _lock(session):
+        """
+        Строка сессии под select_for_update (внутри transaction.atomic);
+        404 — её уже удалили или по ней начался commit.
+        """
+        session = UploadSession.objects.select_for_update().filter(pk=session.pk, committing=False).first()
+        if session is None:
+            raise NotFound()
+        return session
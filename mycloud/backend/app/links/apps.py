@@ -3,3 +3,5 @@ from django.apps import AppConfig
 class LinksConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "app.links"
+    def ready(self):
+        import app.links.signals
@@ -0,0 +1,41 @@
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+
+from app.common.counters import hits
+from app.files.downloads import file_response, counts_as_download
+from app.files.models import File
+from . import cache
+from .views import unavailable_reason, account_download, cache_control, signed_target, EXHAUSTED, NOT_FOUND
+
+
+async def public_download(request, token: str):
+    """Асинхронный вариант links.views.public_download для ASGI (ASYNC_DOWNLOADS=True)."""
+    link = await sync_to_async(cache.resolve)(token)
+    if not link:
+        return JsonResponse({"detail": NOT_FOUND}, status=404)
+    reason = unavailable_reason(link)
+    if reason:
+        return JsonResponse({"detail": reason}, status=410)
+    resp = await sync_to_async(file_response)(
+        request, link.file, asynchronous=True, cache_control=cache_control(link),
+    )
+    if resp is None:
+        return JsonResponse({"detail": "Файл не найден на диске."}, status=404)
+    if not await sync_to_async(account_download)(link, resp):
+        return JsonResponse({"detail": EXHAUSTED}, status=410)
+    return resp
+
+
+async def signed_download(request, token: str):
+    """Асинхронный вариант links.views.signed_download."""
+    file_obj, link, error = await sync_to_async(signed_target)(token)
+    if error:
+        return JsonResponse({"detail": error[1]}, status=error[0])
+    resp = await sync_to_async(file_response)(
+        request, file_obj, asynchronous=True, cache_control=cache_control(link), inline=link.inline,
+    )
+    if resp is None:
+        return JsonResponse({"detail": "Файл не найден на диске."}, status=404)
+    if counts_as_download(resp):
+        await sync_to_async(hits.hit)(File, file_obj.pk)
+    return resp
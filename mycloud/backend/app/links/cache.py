@@ -0,0 +1,80 @@
+"""
+Кэш разрешения публичных токенов: токен -> Link (вместе с File) или «нет такой ссылки»;
+для подписанных ссылок (app.links.signing) — id файла -> File.
+
+Два уровня: LRU с коротким TTL внутри процесса и, если задан LINK_CACHE_BACKEND,
+общий Django-кэш (Redis/Memcached) для всех воркеров. Сигналы Link/File
+сбрасывают записи; в соседних процессах локальная копия живёт не дольше
+LINK_CACHE_TTL, поэтому он короткий.
+"""
+from django.conf import settings
+from django.core.cache import caches
+
+from app.common.cache import TTLCache
+from app.files.models import File
+from .models import Link
+
+NEGATIVE = "-"
+
+_local = TTLCache(
+    maxsize=getattr(settings, "LINK_CACHE_SIZE", 10000),
+    ttl=getattr(settings, "LINK_CACHE_TTL", 30),
+)
+
+
+def _shared():
+    alias = getattr(settings, "LINK_CACHE_BACKEND", "")
+    return caches[alias] if alias else None
+
+
+def _key(token):
+    return f"link:{token}"
+
+
+def _file_key(file_id):
+    return f"file:{file_id}"
+
+
+def _cached(key, load):
+    value = _local.get(key)
+    if value is None:
+        shared = _shared()
+        if shared is not None:
+            value = shared.get(key)
+        if value is None:
+            value = load() or NEGATIVE
+            if shared is not None:
+                shared.set(key, value, getattr(settings, "LINK_CACHE_SHARED_TTL", 300))
+        _local.set(key, value)
+    return None if value == NEGATIVE else value
+
+
+def resolve(token):
+    """Link с подгруженным file или None. Отрицательный результат тоже кэшируется."""
+    return _cached(_key(token), lambda: Link.objects.select_related("file").filter(token=token).first())
+
+
+def resolve_file(file_id):
+    """File для подписанной ссылки или None."""
+    return _cached(_file_key(file_id), lambda: File.objects.filter(pk=file_id).first())
+
+
+def _drop(keys):
+    shared = _shared()
+    for key in keys:
+        _local.delete(key)
+        if shared is not None:
+            shared.delete(key)
+
+
+def invalidate(*tokens):
+    _drop([_key(token) for token in tokens])
+
+
+def invalidate_file(file_id):
+    tokens = Link.objects.filter(file_id=file_id).values_list("token", flat=True)
+    _drop([_file_key(file_id)] + [_key(token) for token in tokens])
+
+
+def clear():
+    _local.clear()
@@ -1,16 +1,41 @@
 from django.db import models
 from django.conf import settings
+from django.db.models import F
 from django.utils import timezone
 
+from app.common.counters import hits
+
 class Link(models.Model):
     file = models.ForeignKey("files.File", on_delete=models.CASCADE, related_name="links")
     token = models.CharField(max_length=64, unique=True, db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
     expires_at = models.DateTimeField(blank=True, null=True)
     created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    # None — без ограничения числа скачиваний
+    max_downloads = models.PositiveIntegerField(blank=True, null=True)
+    download_count = models.PositiveIntegerField(default=0)
+    last_downloaded_at = models.DateTimeField(blank=True, null=True)
 
     class Meta:
         ordering = ["-created_at"]
 
     def is_expired(self):
-        return self.expires_at is not None and self.expires_at < timezone.now()
\ No newline at end of file
+        return self.expires_at is not None and self.expires_at < timezone.now()
+
+    def is_exhausted(self):
+        # download_count только растёт, поэтому устаревший снимок из кэша не даст ложного отказа
+        return self.max_downloads is not None and self.download_count >= self.max_downloads
+
+    def take_download(self):
+        """
+        Учитывает скачивание. Без лимита — пакетным счётчиком; с лимитом —
+        условным UPDATE, чтобы параллельные запросы не превысили max_downloads.
+        False — лимит исчерпан.
+        """
+        if self.max_downloads is None:
+            hits.hit(Link, self.pk)
+            return True
+        return bool(Link.objects.filter(pk=self.pk, download_count__lt=F("max_downloads")).update(
+            download_count=F("download_count") + 1,
+            last_downloaded_at=timezone.now(),
+        ))
@@ -1,5 +1,8 @@
+from datetime import timedelta
 from rest_framework import serializers
+from django.conf import settings
 from django.urls import reverse
+from django.utils import timezone
 from .models import Link
 
 class LinkSerializer(serializers.ModelSerializer):
@@ -7,7 +10,48 @@ class LinkSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Link
-        fields = ["id", "token", "url", "created_at"]
+        fields = ["id", "token", "url", "created_at", "expires_at", "max_downloads", "download_count"]
 
     def get_url(self, obj):
         return reverse("public-download", kwargs={"token": obj.token})
+
+
+class LinkCreateSerializer(serializers.Serializer):
+    file_id = serializers.IntegerField()
+    expires_at = serializers.DateTimeField(required=False, allow_null=True)
+    expires_in = serializers.IntegerField(required=False, min_value=1, help_text="Срок жизни в секундах")
+    max_downloads = serializers.IntegerField(required=False, allow_null=True, min_value=1)
+
+    def validate(self, attrs):
+        if attrs.get("expires_in") and attrs.get("expires_at"):
+            raise serializers.ValidationError("Укажите либо expires_at, либо expires_in.")
+        if "expires_in" in attrs:
+            attrs["expires_at"] = timezone.now() + timedelta(seconds=attrs.pop("expires_in"))
+        elif attrs.get("expires_at") and attrs["expires_at"] <= timezone.now():
+            raise serializers.ValidationError({"expires_at": "Дата должна быть в будущем."})
+        return attrs
+
+
+def signed_link_max_ttl():
+    return getattr(settings, "SIGNED_LINK_MAX_TTL", 7 * 24 * 3600)
+
+
+class SignedLinkCreateSerializer(serializers.Serializer):
+    file_id = serializers.IntegerField()
+    expires_in = serializers.IntegerField(required=False, min_value=1,
+                                          help_text="Срок жизни в секундах; по умолчанию час")
+    inline = serializers.BooleanField(required=False, default=False, help_text="Отдавать для показа в браузере (картинки кроме SVG, PDF, видео, аудио; "
+                                             "остальное — как application/octet-stream)")
+
+    def validate_expires_in(self, value):
+        if value > signed_link_max_ttl():
+            raise serializers.ValidationError(f"Не больше {signed_link_max_ttl()} секунд.")
+        return value
+
+    def validate(self, attrs):
+        attrs.setdefault("expires_in", min(3600, signed_link_max_ttl()))
+        return attrs
+
+
+class FileIdSerializer(serializers.Serializer):
+    file_id = serializers.IntegerField()
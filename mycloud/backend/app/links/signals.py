@@ -0,0 +1,24 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from app.files.models import File
+from app.links import cache
+from app.links.models import Link
+
+
+@receiver(post_save, sender=Link)
+@receiver(post_delete, sender=Link)
+def drop_cached_link(sender, instance: Link, **kwargs):
+    cache.invalidate(instance.token)
+
+
+@receiver(post_save, sender=File)
+def drop_cached_file_links(sender, instance: File, created, **kwargs):
+    """Ссылки кэшируются вместе с File; при удалении файла каскад удалит и их (сигнал выше)."""
+    if not created:
+        cache.invalidate_file(instance.pk)
+
+
+@receiver(post_delete, sender=File)
+def drop_cached_file(sender, instance: File, **kwargs):
+    cache.invalidate_file(instance.pk)
@@ -0,0 +1,74 @@
+"""
+Подписанные ссылки: всё нужное для проверки лежит в самом токене — id файла,
+срок действия, эпоха отзыва и флаги, плюс усечённый HMAC. Строк Link нет,
+проверка подписи и срока не ходит в БД; File для отдачи берётся из кэша ссылок.
+
+Отзыв — File.link_epoch: увеличение эпохи делает недействительными все
+выданные на файл подписанные ссылки (в соседних процессах — через LINK_CACHE_TTL).
+"""
+import base64
+import binascii
+import hmac
+import struct
+import time
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+from django.utils.crypto import salted_hmac
+
+# id файла, срок (unix-время), эпоха, флаги
+PAYLOAD = struct.Struct(">QIIB")
+MAC_SIZE = 16
+SALT = "mycloud.links.signed"
+
+INLINE = 1  # показывать в браузере (встраивание), а не скачивать
+
+
+class BadToken(Exception):
+    pass
+
+
+class SignedLink:
+    __slots__ = ("file_id", "expires", "epoch", "flags")
+    max_downloads = None  # лимита нет: учёт скачиваний потребовал бы записи на каждое
+
+    def __init__(self, file_id, expires, epoch, flags):
+        self.file_id = file_id
+        self.expires = expires
+        self.epoch = epoch
+        self.flags = flags
+
+    @property
+    def inline(self):
+        return bool(self.flags & INLINE)
+
+    @property
+    def expires_at(self):
+        return datetime.fromtimestamp(self.expires, dt_timezone.utc)
+
+    def is_expired(self, now=None):
+        return self.expires <= (now or time.time())
+
+
+def _mac(payload):
+    secret = getattr(settings, "LINK_SIGNING_KEY", "") or settings.SECRET_KEY
+    return salted_hmac(SALT, payload, secret=secret, algorithm="sha256").digest()[:MAC_SIZE]
+
+
+def sign(file_obj, expires_at, inline=False):
+    """Токен для file_obj до expires_at (datetime) с текущей эпохой файла."""
+    payload = PAYLOAD.pack(file_obj.pk, int(expires_at.timestamp()), file_obj.link_epoch, INLINE if inline else 0)
+    return base64.urlsafe_b64encode(payload + _mac(payload)).rstrip(b"=").decode()
+
+
+def verify(token):
+    """SignedLink по токену; BadToken — токен повреждён или подпись не сходится. Срок не проверяется."""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+    except (binascii.Error, ValueError):
+        raise BadToken(token)
+    if len(raw) != PAYLOAD.size + MAC_SIZE:
+        raise BadToken(token)
+    payload, mac = raw[:PAYLOAD.size], raw[PAYLOAD.size:]
+    if not hmac.compare_digest(mac, _mac(payload)):
+        raise BadToken(token)
+    return SignedLink(*PAYLOAD.unpack(payload))
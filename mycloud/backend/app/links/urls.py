@@ -1,12 +1,23 @@
+from django.conf import settings
 from django.urls import path
 from rest_framework.routers import DefaultRouter
-from .views import LinkViewSet, public_download
+from .views import LinkViewSet, public_download, signed_download
+from . import async_views
 
 router = DefaultRouter()
 router.register(r"links", LinkViewSet, basename="links")
 
 urlpatterns = [
-    path("public/<str:token>/", public_download, name="public-download"),
+    path(
+        "public/<str:token>/",
+        async_views.public_download if getattr(settings, "ASYNC_DOWNLOADS", False) else public_download,
+        name="public-download",
+    ),
+    path(
+        "public/s/<str:token>/",
+        async_views.signed_download if getattr(settings, "ASYNC_DOWNLOADS", False) else signed_download,
+        name="signed-download",
+    ),
 ]
 
 urlpatterns += router.urls
\ No newline at end of file
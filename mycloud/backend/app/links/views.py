@@ -1,34 +1,23 @@
-import mimetypes
+from datetime import timedelta
+from django.db.models import F
 from django.shortcuts import get_object_or_404
-from django.http import FileResponse
+from django.urls import reverse
 from rest_framework import viewsets, status, permissions
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.exceptions import PermissionDenied
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 
-from app.core.storage import EncryptedFileSystemStorage
 from app.files.models import File
+from django.conf import settings
+from django.utils import timezone
+from app.files.downloads import file_response, counts_as_download, PRIVATE_CACHE_CONTROL
 from .models import Link
-from .serializers import LinkSerializer
+from . import cache, signing
+from app.common.counters import hits
+from .serializers import LinkSerializer, LinkCreateSerializer, SignedLinkCreateSerializer, FileIdSerializer
 from .utils import generate_token
 
-efs = EncryptedFileSystemStorage()
-
-CHUNK = 64 * 1024
-
-def _iter_file(fobj, chunk=CHUNK):
-    try:
-        while True:
-            data = fobj.read(chunk)
-            if not data:
-                break
-            yield data
-    finally:
-        try:
-            fobj.close()
-        except Exception:
-            pass
-
 class LinkViewSet(viewsets.ViewSet):
     permission_classes = [permissions.IsAuthenticated]
 
@@ -37,36 +26,135 @@ class LinkViewSet(viewsets.ViewSet):
         return Response(LinkSerializer(qs, many=True, context={"request": request}).data)
 
     def create(self, request):
-        file_id = request.data.get("file_id")
-        file_obj = get_object_or_404(File, id=file_id)
-
-        if not (request.user.is_staff or file_obj.user_id == request.user.id):
-            return Response({"detail": "Недостаточно прав."}, status=status.HTTP_403_FORBIDDEN)
+        ser = LinkCreateSerializer(data=request.data)
+        ser.is_valid(raise_exception=True)
+        file_obj = self._own_file(request, ser.validated_data["file_id"])
 
         token = generate_token()
         while Link.objects.filter(token=token).exists():
             token = generate_token()
 
-        link = Link.objects.create(file=file_obj, token=token, created_by=request.user)
+        link = Link.objects.create(
+            file=file_obj, token=token, created_by=request.user,
+            expires_at=ser.validated_data.get("expires_at"),
+            max_downloads=ser.validated_data.get("max_downloads"),
+        )
         return Response(LinkSerializer(link, context={"request": request}).data,
                         status=status.HTTP_201_CREATED)
 
+    def _own_file(self, request, file_id):
+        file_obj = get_object_or_404(File, id=file_id)
+        if not (request.user.is_staff or file_obj.user_id == request.user.id):
+            raise PermissionDenied("Недостаточно прав.")
+        return file_obj
+
+    @action(detail=False, methods=["post"], url_path="signed")
+    def signed(self, request):
+        """Подписанная ссылка: строка в БД не создаётся, отзыв — через signed/revoke для всего файла."""
+        ser = SignedLinkCreateSerializer(data=request.data)
+        ser.is_valid(raise_exception=True)
+        file_obj = self._own_file(request, ser.validated_data["file_id"])
+        expires_at = (timezone.now() + timedelta(seconds=ser.validated_data["expires_in"])).replace(microsecond=0)
+        token = signing.sign(file_obj, expires_at, inline=ser.validated_data["inline"])
+        return Response(
+            {"token": token, "url": reverse("signed-download", kwargs={"token": token}), "expires_at": expires_at},
+            status=status.HTTP_201_CREATED,
+        )
+
+    @action(detail=False, methods=["post"], url_path="signed/revoke")
+    def revoke_signed(self, request):
+        """Отзывает все подписанные ссылки на файл (обычные ссылки не затрагиваются)."""
+        ser = FileIdSerializer(data=request.data)
+        ser.is_valid(raise_exception=True)
+        file_obj = self._own_file(request, ser.validated_data["file_id"])
+        File.objects.filter(pk=file_obj.pk).update(link_epoch=F("link_epoch") + 1)
+        cache.invalidate_file(file_obj.pk)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+NOT_FOUND = "Ссылка не найдена (token)."
+EXPIRED = "Срок действия ссылки истёк."
+EXHAUSTED = "Лимит скачиваний по ссылке исчерпан."
+REVOKED = "Ссылка отозвана."
+
+
+def unavailable_reason(link):
+    if link.is_expired():
+        return EXPIRED
+    if link.is_exhausted():
+        return EXHAUSTED
+    return None
+
+
+def signed_target(token):
+    """
+    Проверка подписанной ссылки: подпись и срок — без БД, File — из кэша ссылок.
+    Возвращает (file, link, None) или (None, None, (статус, текст)).
+    """
+    try:
+        link = signing.verify(token)
+    except signing.BadToken:
+        return None, None, (404, NOT_FOUND)
+    if link.is_expired():
+        return None, None, (410, EXPIRED)
+    file_obj = cache.resolve_file(link.file_id)
+    if file_obj is None:
+        return None, None, (404, NOT_FOUND)
+    if file_obj.link_epoch != link.epoch:
+        return None, None, (410, REVOKED)
+    return file_obj, link, None
+
+
+def cache_control(link):
+    """
+    Ссылки без лимита можно кэшировать и на промежуточных прокси, но не дольше
+    срока жизни ссылки; ссылку с лимитом скачиваний — только у клиента с перепроверкой.
+    """
+    max_age = getattr(settings, "PUBLIC_LINK_MAX_AGE", 0)
+    if link.expires_at is not None:
+        max_age = min(max_age, int((link.expires_at - timezone.now()).total_seconds()))
+    if link.max_downloads is not None or max_age <= 0:
+        return PRIVATE_CACHE_CONTROL
+    return f"public, max-age={max_age}"
+
+
+def account_download(link, resp):
+    """Учитывает скачивание по ссылке и файла; False — лимит исчерпан, ответ закрыт."""
+    if not counts_as_download(resp):
+        return True
+    if not link.take_download():
+        resp.close()
+        return False
+    hits.hit(File, link.file_id)
+    return True
+
+
 @api_view(["GET"])
 @permission_classes([AllowAny])
 def public_download(request, token: str):
-    link = Link.objects.select_related("file").filter(token=token).first()
+    link = cache.resolve(token)
     if not link:
-        return Response({"detail": "Ссылка не найдена (token)."}, status=404)
-
-    file_obj = link.file
-    name = file_obj.file.name
+        return Response({"detail": NOT_FOUND}, status=404)
+    reason = unavailable_reason(link)
+    if reason:
+        return Response({"detail": reason}, status=status.HTTP_410_GONE)
 
-    if not efs.exists(name):
+    resp = file_response(request, link.file, cache_control=cache_control(link))
+    if resp is None:
         return Response({"detail": "Файл не найден на диске."}, status=404)
+    if not account_download(link, resp):
+        return Response({"detail": EXHAUSTED}, status=status.HTTP_410_GONE)
+    return resp
 
-    fobj = efs.open_decrypted(name)
 
-    ctype = mimetypes.guess_type(file_obj.original_name)[0] or "application/octet-stream"
-    resp = FileResponse(fobj, as_attachment=True, filename=file_obj.original_name, content_type=ctype)
-    resp["Content-Length"] = str(file_obj.size)
-    return resp
\ No newline at end of file
+@api_view(["GET"])
+@permission_classes([AllowAny])
+def signed_download(request, token: str):
+    file_obj, link, error = signed_target(token)
+    if error:
+        return Response({"detail": error[1]}, status=error[0])
+    resp = file_response(request, file_obj, cache_control=cache_control(link), inline=link.inline)
+    if resp is None:
+        return Response({"detail": "Файл не найден на диске."}, status=404)
+    if counts_as_download(resp):
+        hits.hit(File, file_obj.pk)
+    return resp
@@ -66,10 +66,12 @@ INSTALLED_APPS = [
     "app.users.apps.UsersConfig",
     "app.files.apps.FilesConfig",
     "app.links.apps.LinksConfig",
+    "app.tasks.apps.TasksConfig",
 ]
 
 
 MIDDLEWARE = [
+    "app.common.middleware.MetricsMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -78,6 +80,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "app.common.middleware.NoStoreForAuth",
 ]
 
 ROOT_URLCONF = "app.urls"
@@ -99,6 +102,10 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = "app.wsgi.application"
+ASGI_APPLICATION = "app.asgi.application"
+# SERVER_MODE=asgi: uvicorn-воркеры и async-вьюхи скачивания (app.files.async_views)
+SERVER_MODE = os.getenv("SERVER_MODE", "wsgi").lower()
+ASYNC_DOWNLOADS = _env_bool("ASYNC_DOWNLOADS", SERVER_MODE == "asgi")
 
 DATABASES = {
     "default": {
@@ -115,7 +122,7 @@ AUTH_USER_MODEL = "users.User"
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "app.users.authentication.CachedJWTAuthentication",
         "rest_framework.authentication.SessionAuthentication",
     ),
     "EXCEPTION_HANDLER": "app.common.exceptions.exception_handler",
@@ -134,6 +141,13 @@ SIMPLE_JWT = {
     "REFRESH_TOKEN_LIFETIME": timedelta(days=int(os.getenv("JWT_REFRESH_DAYS", "7"))),
     "AUTH_HEADER_TYPES": ("Bearer",),
 }
+# JWT-запросы берут пользователя из кэша процесса (сек; 0 — SELECT на каждый запрос);
+# сохранение пользователя сбрасывает запись здесь, в соседних процессах — через TTL
+AUTH_USER_CACHE_TTL = int(os.getenv("AUTH_USER_CACHE_TTL", "30"))
+AUTH_USER_CACHE_SIZE = int(os.getenv("AUTH_USER_CACHE_SIZE", "10000"))
+# доверять username/is_staff/is_superuser из access-токена без обращения к БД;
+# смена роли и блокировка тогда действуют с новым access-токеном (до JWT_ACCESS_MIN)
+AUTH_TRUST_TOKEN_CLAIMS = _env_bool("AUTH_TRUST_TOKEN_CLAIMS", False)
 
 CORS_ALLOW_ALL_ORIGINS = DEBUG
 
@@ -145,15 +159,96 @@ USE_TZ = True
 STATIC_URL = "/static/"
 STATIC_ROOT = BASE_DIR / "staticfiles"
 
-DEFAULT_FILE_STORAGE = "app.core.storage.EncryptedFileSystemStorage"
+DEFAULT_FILE_STORAGE = "app.core.storage.EncryptedStorage"
 MEDIA_ROOT = os.getenv("STORAGE_PATH", str(BASE_DIR / "storage"))
 MEDIA_URL = "/media/"
 
+# где лежат зашифрованные файлы: local — MEDIA_ROOT; s3 — S3-совместимое хранилище (нужен boto3),
+# тогда несколько бэкенд-нод могут работать поверх общего бакета
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local").lower()
+S3_BUCKET = os.getenv("S3_BUCKET", "")
+S3_PREFIX = os.getenv("S3_PREFIX", "")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL", "")  # MinIO/Ceph; пусто — AWS
+S3_REGION = os.getenv("S3_REGION", "")
+S3_ACCESS_KEY_ID = os.getenv("S3_ACCESS_KEY_ID", "")
+S3_SECRET_ACCESS_KEY = os.getenv("S3_SECRET_ACCESS_KEY", "")
+S3_MAX_POOL_CONNECTIONS = int(os.getenv("S3_MAX_POOL_CONNECTIONS", "32"))
+S3_PART_SIZE = int(os.getenv("S3_PART_SIZE_MB", "8")) * 1024 * 1024
+S3_TRANSFER_WORKERS = int(os.getenv("S3_TRANSFER_WORKERS", "4"))
+S3_READ_AHEAD = int(os.getenv("S3_READ_AHEAD_KB", "1024")) * 1024
+
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
+# отдача скачиваний: stream — через воркер; x-accel/x-sendfile — прокси читает
+# расшифрованную копию из DOWNLOAD_CACHE_ROOT (открытый текст! только для прокси)
+DOWNLOAD_DELIVERY = os.getenv("DOWNLOAD_DELIVERY", "stream").lower()
+DOWNLOAD_CACHE_ROOT = os.getenv("DOWNLOAD_CACHE_ROOT", str(BASE_DIR / "download_cache"))
+DOWNLOAD_CACHE_MAX_BYTES = int(os.getenv("DOWNLOAD_CACHE_MAX_MB", "2048")) * 1024 * 1024
+# как часто процесс заново обходит кэш отдачи (копии соседних процессов, брошенные .part), сек
+DOWNLOAD_CACHE_RESCAN = int(os.getenv("DOWNLOAD_CACHE_RESCAN", "300"))
+DOWNLOAD_ACCEL_PREFIX = os.getenv("DOWNLOAD_ACCEL_PREFIX", "/protected/")
+# упреждающее чтение при потоковой отдаче: фоновый поток держит до DOWNLOAD_READ_AHEAD
+# прочитанных и расшифрованных буферов по DOWNLOAD_BUFFER_KB (0 — читать по мере отправки)
+DOWNLOAD_READ_AHEAD = int(os.getenv("DOWNLOAD_READ_AHEAD", "4"))
+DOWNLOAD_BUFFER_SIZE = int(os.getenv("DOWNLOAD_BUFFER_KB", "256")) * 1024
+
+# кэш разрешения публичных токенов: LRU в процессе + опционально общий кэш (alias из CACHES)
+LINK_CACHE_SIZE = int(os.getenv("LINK_CACHE_SIZE", "10000"))
+LINK_CACHE_TTL = int(os.getenv("LINK_CACHE_TTL", "30"))
+LINK_CACHE_BACKEND = os.getenv("LINK_CACHE_BACKEND", "")
+LINK_CACHE_SHARED_TTL = int(os.getenv("LINK_CACHE_SHARED_TTL", "300"))
+# Cache-Control: public, max-age для публичных ссылок без лимита скачиваний (0 — не кэшировать);
+# удалённая ссылка может ещё столько секунд отдаваться из промежуточных кэшей
+PUBLIC_LINK_MAX_AGE = int(os.getenv("PUBLIC_LINK_MAX_AGE", "300"))
+# подписанные ссылки без строки в БД (/api/public/s/<токен>/): ключ HMAC (пусто — SECRET_KEY;
+# смена ключа отзывает все выданные) и предельный срок жизни в секундах
+LINK_SIGNING_KEY = os.getenv("LINK_SIGNING_KEY", "")
+SIGNED_LINK_MAX_TTL = int(os.getenv("SIGNED_LINK_MAX_TTL", str(7 * 24 * 3600)))
+
+# счётчики скачиваний копятся в памяти и пишутся в БД пачкой раз в N секунд (0 — сразу);
+# при гибели процесса теряется не больше N секунд хитов
+COUNTER_FLUSH_INTERVAL = int(os.getenv("COUNTER_FLUSH_SECONDS", "10"))
+# фоновые задачи (app.tasks): воркер manage.py run_tasks; TASKS_EAGER — выполнять в процессе после коммита, без воркера
+TASKS_EAGER = _env_bool("TASKS_EAGER", False)
+TASKS_CONCURRENCY = int(os.getenv("TASKS_CONCURRENCY", "4"))
+TASKS_MAX_ATTEMPTS = int(os.getenv("TASKS_MAX_ATTEMPTS", "5"))
+# задержка повтора: TASKS_RETRY_DELAY * 2^(попытка-1), не больше TASKS_RETRY_MAX_DELAY секунд
+TASKS_RETRY_DELAY = int(os.getenv("TASKS_RETRY_DELAY", "10"))
+TASKS_RETRY_MAX_DELAY = int(os.getenv("TASKS_RETRY_MAX_DELAY", "3600"))
+TASKS_POLL_INTERVAL = float(os.getenv("TASKS_POLL_INTERVAL", "1"))
+# задача в статусе running без heartbeat воркера (раз в четверть срока) дольше этого срока считается брошенной
+TASKS_LOCK_TIMEOUT = int(os.getenv("TASKS_LOCK_TIMEOUT", "600"))
+# проверять каждую загрузку полной расшифровкой (фоновой задачей)
+VERIFY_UPLOADS = _env_bool("VERIFY_UPLOADS", False)
+# /metrics (Prometheus) требует Authorization: Bearer <токен>, если задан; nginx наружу его не проксирует
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
 MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE_MB", "100")) * 1024 * 1024
+# сколько файлов можно загрузить, удалить или упаковать в архив одним запросом
+BULK_MAX_FILES = int(os.getenv("BULK_MAX_FILES", "1000"))
+# поэтапная загрузка (/api/uploads/): лимит на файл, размер куска и время жизни брошенных сессий
+MAX_UPLOAD_SESSION_SIZE = int(os.getenv("MAX_UPLOAD_SESSION_SIZE_MB", "10240")) * 1024 * 1024
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE_MB", "8")) * 1024 * 1024
+UPLOAD_SESSION_TTL_HOURS = int(os.getenv("UPLOAD_SESSION_TTL_HOURS", "24"))
+# лимит хранилища на пользователя по умолчанию (0 — без ограничений), см. User.storage_quota
+USER_STORAGE_QUOTA = int(os.getenv("USER_STORAGE_QUOTA_MB", "0")) * 1024 * 1024
+# дедупликация: одинаковое содержимое хранится одним блобом со счётчиком ссылок
+DEDUP_ENABLED = _env_bool("DEDUP_ENABLED", False)
 
 ENCRYPTION_KEY = os.getenv("ENCRYPTION_KEY", "dev-key-please-change")
+# размер сегмента шифрования: память на поток при загрузке/скачивании ограничена им
+ENCRYPTION_SEGMENT_SIZE = int(os.getenv("ENCRYPTION_SEGMENT_KB", "64")) * 1024
+# сжатие перед шифрованием: auto (zstd, если установлен zstandard, иначе zlib) | zstd | zlib | off;
+# уже сжатые типы и файлы, начало которых сжимается хуже MIN_RATIO, пишутся как есть
+STORAGE_COMPRESSION = os.getenv("STORAGE_COMPRESSION", "auto").lower()
+STORAGE_COMPRESSION_MIN_RATIO = float(os.getenv("STORAGE_COMPRESSION_MIN_RATIO", "0.9"))
+# кэш расшифрованных сегментов горячих файлов в памяти процесса (0 — выключен);
+# файлы крупнее READ_CACHE_MAX_FILE_MB не кэшируются
+READ_CACHE_BYTES = int(os.getenv("READ_CACHE_MB", "0")) * 1024 * 1024
+READ_CACHE_MAX_FILE = int(os.getenv("READ_CACHE_MAX_FILE_MB", "32")) * 1024 * 1024
+# параллельное шифрование сегментов одного файла: 1 — inline; pool: thread | process
+ENCRYPTION_WORKERS = int(os.getenv("ENCRYPTION_WORKERS", "1"))
+ENCRYPTION_POOL = os.getenv("ENCRYPTION_POOL", "thread").lower()
 
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
 LOG_DIR = BASE_DIR / "logs"
@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+from django.utils.module_loading import autodiscover_modules
+
+class TasksConfig(AppConfig):
+    default_auto_field = "django.db.models.BigAutoField"
+    name = "app.tasks"
+    def ready(self):
+        # регистрируем задачи из <app>/tasks.py, чтобы воркер знал их по имени
+        autodiscover_modules("tasks")
@@ -0,0 +1,22 @@
+import signal
+from django.core.management.base import BaseCommand
+from app.tasks.queue import Worker
+
+class Command(BaseCommand):
+    help = "Воркер фоновых задач (письма, удаление файлов из хранилища, проверка загрузок)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=None,
+                            help="Сколько задач выполнять одновременно (по умолчанию TASKS_CONCURRENCY)")
+        parser.add_argument("--poll", type=float, default=None, help="Интервал опроса очереди, сек")
+        parser.add_argument("--once", action="store_true", help="Выполнить готовые задачи и выйти")
+
+    def handle(self, *args, **opts):
+        worker = Worker(concurrency=opts["concurrency"], poll_interval=opts["poll"])
+        if not opts["once"]:
+            # SIGTERM от docker stop: дожидаемся начатых задач и выходим
+            signal.signal(signal.SIGTERM, lambda *_: worker.stop())
+            signal.signal(signal.SIGINT, lambda *_: worker.stop())
+            self.stdout.write(f"Worker {worker.worker_id}: concurrency {worker.concurrency}")
+        processed = worker.run(once=opts["once"])
+        self.stdout.write(self.style.SUCCESS(f"Done. Processed tasks: {processed}"))
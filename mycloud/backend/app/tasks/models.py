@@ -0,0 +1,26 @@
+from django.db import models
+
+
+class Task(models.Model):
+    """Отложенная задача: имя зарегистрированной функции и JSON-аргументы (см. app.tasks.queue)."""
+    QUEUED, RUNNING, FAILED = "queued", "running", "failed"
+    STATUS_CHOICES = ((QUEUED, "В очереди"), (RUNNING, "Выполняется"), (FAILED, "Ошибка"))
+
+    name = models.CharField(max_length=200)
+    args = models.JSONField(default=list)
+    kwargs = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_after = models.DateTimeField()
+    locked_at = models.DateTimeField(blank=True, null=True)
+    locked_by = models.CharField(max_length=100, blank=True, default="")
+    last_error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["run_after", "id"]
+        indexes = [models.Index(fields=["status", "run_after"], name="task_status_run_after_idx")]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
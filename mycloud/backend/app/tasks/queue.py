@@ -0,0 +1,237 @@
+"""
+Фоновые задачи в БД: письма, удаление файлов из хранилища, проверка загруженного.
+
+Задача — функция, помеченная @task; .delay(*args, **kwargs) кладёт строку Task
+в текущую транзакцию (откат запроса отменяет и задачу). Воркер
+(manage.py run_tasks) забирает готовые строки, выполняет их в пуле из
+TASKS_CONCURRENCY потоков и удаляет. При ошибке задача откладывается с
+экспоненциальной задержкой TASKS_RETRY_DELAY * 2^n (не больше TASKS_RETRY_MAX_DELAY),
+после max_attempts попыток остаётся в статусе failed с текстом ошибки.
+
+Пока задача выполняется, воркер раз в TASKS_LOCK_TIMEOUT / 4 продлевает её
+locked_at (heartbeat): в очередь повторно уходят только задачи умершего
+воркера, а не просто долгие. Итог (удаление или повтор) записывается, только
+если строка всё ещё закреплена за этим воркером.
+
+TASKS_EAGER=true — без воркера: задача выполняется в процессе после коммита
+(тесты, разработка).
+"""
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from app.common.metrics import registry
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+STALE_CHECK_INTERVAL = 60
+
+
+def task(fn=None, *, name=None, max_attempts=None):
+    """Регистрирует функцию как задачу; аргументы должны сериализоваться в JSON."""
+    def wrap(fn):
+        task_name = name or f"{fn.__module__}.{fn.__name__}"
+        _registry[task_name] = (fn, max_attempts)
+        fn.task_name = task_name
+        fn.delay = lambda *args, **kwargs: enqueue(task_name, args, kwargs)
+        return fn
+    return wrap(fn) if fn is not None else wrap
+
+
+def enqueue(name, args=(), kwargs=None, countdown=0):
+    if name not in _registry:
+        raise LookupError(f"Неизвестная задача {name}")
+    kwargs = kwargs or {}
+    fn, max_attempts = _registry[name]
+    if getattr(settings, "TASKS_EAGER", False):
+        transaction.on_commit(lambda: _run_eager(name, fn, args, kwargs))
+        return None
+    return Task.objects.create(
+        name=name,
+        args=list(args),
+        kwargs=kwargs,
+        max_attempts=max_attempts or getattr(settings, "TASKS_MAX_ATTEMPTS", 5),
+        run_after=timezone.now() + timedelta(seconds=countdown),
+    )
+
+
+def _run_eager(name, fn, args, kwargs):
+    try:
+        fn(*args, **kwargs)
+    except Exception:
+        logger.exception("Задача %s завершилась ошибкой", name)
+
+
+def backoff(attempts):
+    """Задержка перед попыткой attempts + 1: экспонента с разбросом ±20%, чтобы повторы не шли пачкой."""
+    base = getattr(settings, "TASKS_RETRY_DELAY", 10)
+    delay = min(base * 2 ** max(0, attempts - 1), getattr(settings, "TASKS_RETRY_MAX_DELAY", 3600))
+    return delay * random.uniform(0.8, 1.2)
+
+
+def claim(worker_id, limit):
+    """Забирает до limit готовых задач: на Postgres SKIP LOCKED, условный UPDATE — на всех БД."""
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            Task.objects.select_for_update(skip_locked=True)
+            .filter(status=Task.QUEUED, run_after__lte=now)
+            .values_list("pk", flat=True)[:limit]
+        )
+        if not ids:
+            return []
+        Task.objects.filter(pk__in=ids, status=Task.QUEUED).update(
+            status=Task.RUNNING, locked_at=now, locked_by=worker_id,
+        )
+    return list(Task.objects.filter(pk__in=ids, status=Task.RUNNING, locked_by=worker_id))
+
+
+def lock_timeout():
+    return getattr(settings, "TASKS_LOCK_TIMEOUT", 600)
+
+
+def heartbeat(worker_id, ids):
+    """Продлевает блокировку выполняющихся задач воркера; возвращает число продлённых."""
+    if not ids:
+        return 0
+    return Task.objects.filter(pk__in=list(ids), status=Task.RUNNING, locked_by=worker_id).update(
+        locked_at=timezone.now(),
+    )
+
+
+def requeue_stale():
+    """Задачи упавшего воркера (без heartbeat дольше TASKS_LOCK_TIMEOUT) возвращаются в очередь как неудачная попытка."""
+    cutoff = timezone.now() - timedelta(seconds=lock_timeout())
+    stale = Task.objects.filter(status=Task.RUNNING, locked_at__lt=cutoff)
+    count = stale.update(status=Task.QUEUED, locked_at=None, locked_by="", attempts=F("attempts") + 1,
+                         last_error="Воркер не завершил задачу за TASKS_LOCK_TIMEOUT")
+    if count:
+        Task.objects.filter(status=Task.QUEUED, attempts__gte=F("max_attempts")).update(status=Task.FAILED)
+    return count
+
+
+def execute(task_obj):
+    """
+    Выполняет одну задачу. Успех — строка удаляется; ошибка — повтор по backoff или failed.
+    Если задачу тем временем вернули в очередь или забрал другой воркер, строку не трогаем.
+    """
+    entry = _registry.get(task_obj.name)
+    owned = Task.objects.filter(pk=task_obj.pk, status=Task.RUNNING, locked_by=task_obj.locked_by)
+    try:
+        if entry is None:
+            raise LookupError(f"Неизвестная задача {task_obj.name}")
+        entry[0](*task_obj.args, **task_obj.kwargs)
+    except Exception:
+        attempts = task_obj.attempts + 1
+        final = entry is None or attempts >= task_obj.max_attempts
+        logger.warning("Задача %s #%s: попытка %s не удалась%s", task_obj.name, task_obj.pk, attempts,
+                       "" if not final else ", больше не повторяем", exc_info=True)
+        owned.update(
+            status=Task.FAILED if final else Task.QUEUED,
+            attempts=attempts,
+            run_after=timezone.now() + timedelta(seconds=0 if final else backoff(attempts)),
+            locked_at=None,
+            locked_by="",
+            last_error=traceback.format_exc()[-4000:],
+        )
+        return False
+    owned.delete()
+    return True
+
+
+class Worker:
+    """Цикл воркера: не больше concurrency задач одновременно, опрос очереди раз в poll_interval."""
+
+    def __init__(self, concurrency=None, poll_interval=None):
+        self.concurrency = max(1, concurrency or getattr(settings, "TASKS_CONCURRENCY", 4))
+        self.poll_interval = poll_interval or getattr(settings, "TASKS_POLL_INTERVAL", 1.0)
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._busy = 0
+        self._running = set()
+        self._last_beat = time.monotonic()
+        self.processed = 0
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def _execute(self, task_obj):
+        try:
+            execute(task_obj)
+        finally:
+            close_old_connections()
+            with self._lock:
+                self._busy -= 1
+                self._running.discard(task_obj.pk)
+                self.processed += 1
+            self._wake.set()
+
+    def _heartbeat(self):
+        if time.monotonic() - self._last_beat < lock_timeout() / 4:
+            return
+        with self._lock:
+            ids = set(self._running)
+        heartbeat(self.worker_id, ids)
+        self._last_beat = time.monotonic()
+
+    def run(self, once=False):
+        """once=True — выполнить всё, что готово сейчас, и выйти."""
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="task") as pool:
+            requeue_stale()
+            last_requeue = time.monotonic()
+            while not self._stop.is_set():
+                self._wake.clear()
+                with self._lock:
+                    free = self.concurrency - self._busy
+                claimed = claim(self.worker_id, free) if free > 0 else []
+                for task_obj in claimed:
+                    with self._lock:
+                        self._busy += 1
+                        self._running.add(task_obj.pk)
+                    pool.submit(self._execute, task_obj)
+                self._heartbeat()
+                close_old_connections()
+                if claimed:
+                    continue
+                with self._lock:
+                    idle = self._busy == 0
+                if once and idle:
+                    break
+                self._wake.wait(self.poll_interval)
+                if time.monotonic() - last_requeue > STALE_CHECK_INTERVAL:
+                    requeue_stale()
+                    last_requeue = time.monotonic()
+            # остановка: дожидаемся начатых задач, продолжая продлевать их блокировку
+            while self._busy:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                self._heartbeat()
+            close_old_connections()
+        return self.processed
+
+
+@registry.collector
+def _queue_stats():
+    counts = dict.fromkeys((Task.QUEUED, Task.RUNNING, Task.FAILED), 0)
+    try:
+        for row in Task.objects.order_by().values("status").annotate(n=Count("id")):
+            counts[row["status"]] = row["n"]
+    except Exception:
+        return []
+    return [(f"mycloud_tasks_{status}", "gauge", f"Задачи в статусе {status}", n) for status, n in counts.items()]
@@ -2,11 +2,15 @@ from django.contrib import admin
 from django.urls import path, include
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
 
+from app.common.views import healthz, metrics_view
+
 urlpatterns = [
     path('dj-admin/', admin.site.urls),
     path('api/', include('app.users.urls')),
     path('api/', include('app.files.urls')),
     path('api/', include('app.links.urls')),
+    path('healthz', healthz, name="healthz"),
+    path('metrics', metrics_view, name="metrics"),
 ]
 
 urlpatterns += [
@@ -3,3 +3,5 @@ from django.apps import AppConfig
 class UsersConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "app.users"
+    def ready(self):
+        import app.users.signals
@@ -1,6 +1,96 @@
+"""
+JWT-аутентификация без SELECT по users на каждый запрос.
+
+Пользователь берётся из кэша процесса (AUTH_USER_CACHE_TTL) как снимок
+полей, нужных для проверки прав: id, имя, роли, is_active. Остальные поля
+(счётчики и квота, пароль) отложены и догружаются одним запросом при первом
+обращении — проверка квоты никогда не видит устаревших чисел. Сохранение
+пользователя (смена роли, блокировка, пароль) сбрасывает запись в этом
+процессе, в соседних она живёт не дольше TTL.
+
+AUTH_TRUST_TOKEN_CLAIMS=true — снимок берётся прямо из access-токена
+(claims ниже, их выписывает ClaimsRefreshToken), без БД и кэша. Изменения
+пользователя тогда вступают в силу с новым access-токеном; в процессе, где
+пользователя сохранили, старые токены сразу уходят на проверку по БД.
+"""
+import time
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import gettext_lazy as _
 from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from app.common.cache import TTLCache
+
+SNAPSHOT_FIELDS = ("id", "username", "email", "role", "is_active", "is_staff", "is_superuser", "date_joined")
+CLAIMS = ("username", "is_staff", "is_superuser")
+
+_users = TTLCache(
+    maxsize=getattr(settings, "AUTH_USER_CACHE_SIZE", 10000),
+    ttl=getattr(settings, "AUTH_USER_CACHE_TTL", 30),
+)
+# id -> время последнего изменения: токены, выписанные раньше, не принимаются на веру
+_changed = TTLCache(
+    maxsize=getattr(settings, "AUTH_USER_CACHE_SIZE", 10000),
+    ttl=int(api_settings.ACCESS_TOKEN_LIFETIME.total_seconds()),
+)
+
+
+def trust_claims():
+    return getattr(settings, "AUTH_TRUST_TOKEN_CLAIMS", False)
+
+
+def user_claims(user):
+    return {name: getattr(user, name) for name in CLAIMS}
+
+
+def snapshot(values):
+    """Экземпляр User из значений SNAPSHOT_FIELDS (или их части); прочие поля отложены."""
+    names = [f.attname for f in get_user_model()._meta.concrete_fields if f.attname in values]
+    user = get_user_model().from_db(DEFAULT_DB_ALIAS, names, [values[n] for n in names])
+    user._auth_snapshot = True
+    return user
+
 
-class CookieJWTAuthentication(JWTAuthentication):
+def invalidate_user(user_id):
+    _users.delete(str(user_id))
+    _changed.set(str(user_id), time.time())
+
+
+def clear():
+    _users.clear()
+    _changed.clear()
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        if api_settings.CHECK_REVOKE_TOKEN:
+            return super().get_user(validated_token)  # сверка хэша пароля требует свежей строки
+        try:
+            user_id = str(validated_token[api_settings.USER_ID_CLAIM])
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        if trust_claims() and all(c in validated_token for c in CLAIMS):
+            changed = _changed.get(user_id)
+            if changed is None or validated_token.get("iat", 0) > changed:
+                return snapshot({"id": int(user_id), "is_active": True,
+                                 **{c: validated_token[c] for c in CLAIMS}})
+
+        values = _users.get(user_id)
+        if values is None:
+            user = super().get_user(validated_token)
+            _users.set(user_id, {name: getattr(user, name) for name in SNAPSHOT_FIELDS})
+            return user
+        if not values["is_active"]:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        return snapshot(values)
+
+
+class CookieJWTAuthentication(CachedJWTAuthentication):
     def authenticate(self, request):
         header = self.get_header(request)
         if header is not None:
@@ -12,3 +102,27 @@ class CookieJWTAuthentication(JWTAuthentication):
 
         validated_token = self.get_validated_token(raw_token)
         return self.get_user(validated_token), validated_token
+
+
+class ClaimsRefreshToken(RefreshToken):
+    """Каждый выписанный access-токен несёт текущие CLAIMS пользователя (refresh — нет)."""
+    user = None
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token.user = user
+        return token
+
+    @property
+    def access_token(self):
+        access = super().access_token
+        user = self.user
+        if user is None:
+            user = get_user_model().objects.filter(
+                **{api_settings.USER_ID_FIELD: self.payload.get(api_settings.USER_ID_CLAIM)}
+            ).first()
+        if user is not None:
+            for name, value in user_claims(user).items():
+                access[name] = value
+        return access
@@ -0,0 +1,35 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum
+from app.files.models import File
+
+User = get_user_model()
+
+class Command(BaseCommand):
+    help = "Сверить счётчики files_count/files_total_size пользователей с таблицей файлов"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **opts):
+        actual = {
+            row["user_id"]: (row["n"], row["total"] or 0)
+            for row in File.objects.order_by().values("user_id").annotate(n=Count("id"), total=Sum("size"))
+        }
+        fixed = 0
+        for u in User.objects.only("id", "username", "files_count", "files_total_size").iterator():
+            count, size = actual.get(u.id, (0, 0))
+            if (u.files_count, u.files_total_size) == (count, size):
+                continue
+            self.stdout.write(self.style.WARNING(
+                f"Drift: {u.id} {u.username} {u.files_count}/{u.files_total_size} -> {count}/{size}"
+            ))
+            if not opts["dry_run"]:
+                # пересчёт под блокировкой строки пользователя, чтобы не затереть параллельную загрузку
+                with transaction.atomic():
+                    User.objects.select_for_update().filter(pk=u.pk).first()
+                    agg = File.objects.filter(user_id=u.pk).aggregate(n=Count("id"), total=Sum("size"))
+                    User.objects.filter(pk=u.pk).update(files_count=agg["n"], files_total_size=agg["total"] or 0)
+            fixed += 1
+        self.stdout.write(self.style.SUCCESS(f"Done. Drifted users: {fixed}"))
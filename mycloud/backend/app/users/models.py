@@ -1,6 +1,27 @@
+from django.conf import settings
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 
 class User(AbstractUser):
     ROLE_CHOICES = (("user", "User"), ("admin", "Admin"))
     role = models.CharField(max_length=20, choices=ROLE_CHOICES, default="user")
+
+    # денормализованные счётчики: обновляются сигналами File в той же транзакции,
+    # сверяются командой reconcile_usage
+    files_count = models.PositiveIntegerField(default=0)
+    files_total_size = models.BigIntegerField(default=0)
+    storage_quota = models.BigIntegerField(blank=True, null=True, help_text="Байт; пусто — общий лимит USER_STORAGE_QUOTA")
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        # снимок из кэша аутентификации: первое же отложенное поле догружает остальные тем же запросом
+        if getattr(self, "_auth_snapshot", False) and fields is not None:
+            deferred = self.get_deferred_fields()
+            if set(fields) <= deferred:
+                fields = deferred
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+
+    def quota_bytes(self):
+        """Лимит хранилища в байтах; 0 — без ограничений."""
+        if self.storage_quota is not None:
+            return self.storage_quota
+        return getattr(settings, "USER_STORAGE_QUOTA", 0)
@@ -0,0 +1,38 @@
+import logging
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.tokens import default_token_generator
+from django.core.mail import send_mail
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+from app.tasks.queue import task
+
+logger = logging.getLogger(__name__)
+
+
+@task
+def send_email(subject, message, recipient_list):
+    """Ошибка SMTP поднимается наружу — очередь повторит отправку с задержкой."""
+    send_mail(subject, message, getattr(settings, "DEFAULT_FROM_EMAIL", None), recipient_list, fail_silently=False)
+    logger.info("Email '%s' sent to %s", subject, ", ".join(recipient_list))
+
+
+def reset_link(user, base_url):
+    uid = urlsafe_base64_encode(force_bytes(user.pk))
+    token = default_token_generator.make_token(user)
+    if getattr(settings, "FRONTEND_RESET_URL", ""):
+        return f"{settings.FRONTEND_RESET_URL}?uid={uid}&token={token}"
+    return f"{base_url.rstrip('/')}/api/auth/password/reset-confirm/?uid={uid}&token={token}"
+
+
+@task
+def send_password_reset(user_id, base_url):
+    """
+    Токен и ссылка собираются здесь, а не в запросе: в аргументах задачи
+    (строка Task, в том числе failed) остаются только id и адрес сайта.
+    """
+    user = get_user_model().objects.filter(pk=user_id, is_active=True).first()
+    if user is None or not user.email:
+        return
+    link = reset_link(user, base_url)
+    send_email("Сброс пароля — MyCloud", f"Для сброса пароля перейдите по ссылке: {link}", [user.email])
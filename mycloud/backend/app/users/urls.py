@@ -13,6 +13,7 @@ from .views import (
     change_password,
     AdminUserViewSet,
 )
+from .serializers import ClaimsTokenObtainPairSerializer, ClaimsTokenRefreshSerializer
 
 @extend_schema_view(
     post=extend_schema(
@@ -22,7 +23,7 @@ from .views import (
     )
 )
 class JWTObtainPairView(TokenObtainPairView):
-    pass
+    serializer_class = ClaimsTokenObtainPairSerializer
 
 @extend_schema_view(
     post=extend_schema(
@@ -32,7 +33,7 @@ class JWTObtainPairView(TokenObtainPairView):
     )
 )
 class JWTRefreshView(TokenRefreshView):
-    pass
+    serializer_class = ClaimsTokenRefreshSerializer
 
 router = DefaultRouter()
 router.register(r"admin/users", AdminUserViewSet, basename="admin-users")
@@ -9,15 +9,11 @@ from .serializers import (
     PasswordResetRequestSerializer,
     PasswordResetConfirmSerializer,
 )
+from .tasks import send_password_reset
 from django.contrib.auth.tokens import default_token_generator
-from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
-from django.utils.encoding import force_bytes
-from django.core.mail import send_mail
-from django.conf import settings
-from django.db.models import Count, Sum
+from django.utils.http import urlsafe_base64_decode
 import string
 import secrets
-import threading
 import logging
 
 logger = logging.getLogger(__name__)
@@ -27,11 +23,7 @@ User = get_user_model()
 class AdminUserViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAdminUser]
     serializer_class = UserSerializer
-    queryset = (
-        User.objects.all()
-        .annotate(files_count=Count("files", distinct=True), files_total_size=Sum("files__size"))
-        .order_by("-id")
-    )
+    queryset = User.objects.all().order_by("-id")
     http_method_names = ["get", "delete", "patch", "post"]
 
     def partial_update(self, request, *args, **kwargs):
@@ -66,26 +58,7 @@ class AdminUserViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=["post"])
     def send_reset_link(self, request, pk=None):
         user = self.get_object()
-        uid = urlsafe_base64_encode(force_bytes(user.pk))
-        token = default_token_generator.make_token(user)
-        if getattr(settings, "FRONTEND_RESET_URL", ""):
-            link = f"{settings.FRONTEND_RESET_URL}?uid={uid}&token={token}"
-        else:
-            link = request.build_absolute_uri(f"/api/auth/password/reset-confirm/?uid={uid}&token={token}")
-
-        subject = "Сброс пароля — MyCloud"
-        message = f"Для сброса пароля перейдите по ссылке: {link}"
-        from_email = getattr(settings, "DEFAULT_FROM_EMAIL", None)
-        recipient_list = [user.email]
-
-        def _send():
-            try:
-                send_mail(subject, message, from_email, recipient_list, fail_silently=False)
-                logger.info("Reset link email sent to %s", user.email)
-            except Exception as e:
-                logger.error("Failed to send reset email to %s: %s", user.email, e, exc_info=True)
-
-        threading.Thread(target=_send, daemon=True).start()
+        send_password_reset.delay(user.pk, request.build_absolute_uri("/"))
         return Response({"detail": "Ссылка на сброс отправляется"}, status=status.HTTP_202_ACCEPTED)
 
 
@@ -134,7 +107,7 @@ def change_password(request):
     if not user.check_password(old_password):
         return Response({"old_password": ["Неверный текущий пароль."]}, status=status.HTTP_400_BAD_REQUEST)
     user.set_password(new_password)
-    user.save()
+    user.save(update_fields=["password"])
     return Response({"detail": "password_changed"})
 
 
@@ -149,24 +122,8 @@ def password_reset_request(request):
     except User.DoesNotExist:
         return Response({"detail": "Если email зарегистрирован, письмо отправлено"}, status=status.HTTP_200_OK)
 
-    uid = urlsafe_base64_encode(force_bytes(user.pk))
-    token = default_token_generator.make_token(user)
-    if getattr(settings, "FRONTEND_RESET_URL", ""):
-        link = f"{settings.FRONTEND_RESET_URL}?uid={uid}&token={token}"
-    else:
-        link = request.build_absolute_uri(f"/api/auth/password/reset-confirm/?uid={uid}&token={token}")
-
-    try:
-        send_mail(
-            subject="Сброс пароля — MyCloud",
-            message=f"Для сброса пароля перейдите по ссылке: {link}",
-            from_email=getattr(settings, "DEFAULT_FROM_EMAIL", None),
-            recipient_list=[email],
-            fail_silently=False,
-        )
-        logger.info("Self-service reset email sent to %s", email)
-    except Exception as e:
-        logger.error("Self-service reset email failed for %s: %s", email, e, exc_info=True)
+    # письмо уходит из очереди задач: ответ не ждёт SMTP и не зависит от его ошибок
+    send_password_reset.delay(user.pk, request.build_absolute_uri("/"))
     return Response({"detail": "Если email зарегистрирован, письмо отправлено"}, status=status.HTTP_200_OK)
 
 
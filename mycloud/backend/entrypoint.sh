@@ -33,7 +33,14 @@ if [ "$DJANGO_SUPERUSER_USERNAME" ] && [ "$DJANGO_SUPERUSER_PASSWORD" ]; then
     --email "${DJANGO_SUPERUSER_EMAIL:-admin@example.com}" || true
 fi
 
-exec gunicorn app.wsgi:application \
+if [ "${SERVER_MODE:-wsgi}" = "asgi" ]; then
+  # async-вьюхи скачивания: тысячи медленных клиентов на нескольких процессах
+  set -- app.asgi:application --worker-class uvicorn.workers.UvicornWorker
+else
+  set -- app.wsgi:application
+fi
+
+exec gunicorn "$@" \
   --bind 0.0.0.0:8000 \
   --workers "${GUNICORN_WORKERS:-1}" \
   --threads "${GUNICORN_THREADS:-1}" \
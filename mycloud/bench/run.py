@@ -0,0 +1,394 @@
+"""
+Бенчмарки горячих путей MyCloud: загрузка и скачивание (МБ/с, пиковый RSS) по
+размерам файла, задержка списка файлов от их числа, частота запросов к публичной
+ссылке, задержка админского списка пользователей от размера таблицы.
+
+Запросы идут через настоящий WSGIHandler (все middleware, DRF, хранилище),
+без сети; тело загрузки читается из временного файла, поэтому 1 ГБ не
+держится в памяти самим бенчмарком.
+
+    python bench/run.py --output result.json
+    python bench/run.py --only upload,download --sizes 1K,1M,64M
+    BENCH_DB=postgres POSTGRES_HOST=localhost python bench/run.py
+    python bench/run.py compare base.json result.json --tolerance 0.15
+
+Результат — JSON: meta (версия, БД, настройки шифрования) и список results,
+у каждого bench, params и метрики. compare сравнивает два таких файла
+и завершается с кодом 1 при регрессии больше допуска.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+sys.path[:0] = [str(HERE.parent / "backend"), str(HERE.parent)]
+
+CHUNK = 1024 * 1024
+DEFAULT_SIZES = "1K,64K,1M,16M,128M,1G"
+DEFAULT_FILE_COUNTS = "100,1000,10000"
+DEFAULT_USER_COUNTS = "100,1000,10000"
+
+# метрика -> True, если больше — лучше
+DIRECTIONS = {"mb_s": True, "rps": True, "p50_ms": False, "p95_ms": False, "peak_rss_mb": False}
+
+
+def parse_size(text):
+    text = text.strip().upper()
+    units = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+    if text[-1:] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
+def human(n):
+    for unit, size in (("G", 1 << 30), ("M", 1 << 20), ("K", 1 << 10)):
+        if n >= size and n % size == 0:
+            return f"{n // size}{unit}"
+    return str(n)
+
+
+class RssSampler:
+    """Пиковый RSS процесса за время блока: опрос /proc/self/statm в фоне (на Linux)."""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = self.start = 0
+        self._stop = threading.Event()
+        self._page = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+    def _rss(self):
+        try:
+            with open("/proc/self/statm") as fh:
+                return int(fh.read().split()[1]) * self._page
+        except OSError:
+            import resource
+            rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return rss if sys.platform == "darwin" else rss * 1024
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, self._rss())
+
+    def __enter__(self):
+        self.start = self.peak = self._rss()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self._rss())
+
+    def result(self):
+        return {"peak_rss_mb": round(self.peak / 2**20, 1), "rss_growth_mb": round((self.peak - self.start) / 2**20, 1)}
+
+
+def latency(samples):
+    samples = sorted(samples)
+    return {
+        "n": len(samples),
+        "mean_ms": round(statistics.fmean(samples) * 1000, 3),
+        "p50_ms": round(samples[len(samples) // 2] * 1000, 3),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 3),
+    }
+
+
+class Client:
+    """Вызов WSGIHandler напрямую; тело ответа вычитывается и считается, но не копится."""
+
+    def __init__(self):
+        from django.core.handlers.wsgi import WSGIHandler
+        self.handler = WSGIHandler()
+        self.token = None
+
+    def request(self, method, path, body=None, length=0, content_type="", query=""):
+        environ = {
+            "REQUEST_METHOD": method, "PATH_INFO": path, "QUERY_STRING": query, "SCRIPT_NAME": "",
+            "SERVER_NAME": "localhost", "SERVER_PORT": "80", "HTTP_HOST": "localhost",
+            "SERVER_PROTOCOL": "HTTP/1.1", "wsgi.url_scheme": "http", "wsgi.version": (1, 0),
+            "wsgi.input": body or io.BytesIO(), "wsgi.errors": sys.stderr,
+            "wsgi.multithread": False, "wsgi.multiprocess": False, "wsgi.run_once": False,
+            "CONTENT_LENGTH": str(length), "CONTENT_TYPE": content_type,
+        }
+        if self.token:
+            environ["HTTP_AUTHORIZATION"] = f"Bearer {self.token}"
+        status = []
+        response = self.handler(environ, lambda s, headers, exc_info=None: status.append(int(s.split()[0])))
+        received, parts = 0, []
+        try:
+            for chunk in response:
+                received += len(chunk)
+                if received <= CHUNK:
+                    parts.append(chunk)
+        finally:
+            response.close()
+        return status[0], received, b"".join(parts)
+
+    def get(self, path, query=""):
+        return self.request("GET", path, query=query)
+
+    def json(self, method, path, data):
+        raw = json.dumps(data).encode()
+        status, _n, body = self.request(method, path, io.BytesIO(raw), len(raw), "application/json")
+        return status, json.loads(body or b"null")
+
+
+def write_multipart(path, size, content, boundary="benchboundary7MA4YWxk"):
+    """Тело multipart/form-data с файлом размера size, пишется на диск кусками."""
+    pattern = b"The quick brown fox jumps over the lazy dog. " * (CHUNK // 45 + 1)
+    with open(path, "wb") as fh:
+        fh.write(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="bench.bin"\r\n'
+            f"Content-Type: application/octet-stream\r\n\r\n".encode()
+        )
+        left = size
+        while left:
+            n = min(CHUNK, left)
+            fh.write(os.urandom(n) if content == "random" else pattern[:n])
+            left -= n
+        fh.write(f"\r\n--{boundary}--\r\n".encode())
+        return fh.tell(), f"multipart/form-data; boundary={boundary}"
+
+
+def make_user(username, staff=False):
+    from django.contrib.auth import get_user_model
+    from rest_framework_simplejwt.tokens import AccessToken
+    user = get_user_model().objects.create_user(username=username, email=f"{username}@bench.local",
+                                                password="Bench-pass1!", is_staff=staff)
+    return user, str(AccessToken.for_user(user))
+
+
+def bench_transfer(client, root, sizes, content, repeat):
+    """Загрузка и скачивание целиком для каждого размера: лучшая из repeat попыток."""
+    results = []
+    for size in sizes:
+        body_path = os.path.join(root, "upload.body")
+        length, ctype = write_multipart(body_path, size, content)
+        best_up, file_id = None, None
+        for _ in range(repeat):
+            with open(body_path, "rb") as body, RssSampler() as rss:
+                started = time.perf_counter()
+                status, _n, data = client.request("POST", "/api/files/", body, length, ctype)
+                elapsed = time.perf_counter() - started
+            if status != 201:
+                raise RuntimeError(f"upload {human(size)}: HTTP {status} {data[:200]!r}")
+            file_id = json.loads(data)["id"]
+            if best_up is None or elapsed < best_up[0]:
+                best_up = (elapsed, rss.result())
+        os.remove(body_path)
+        results.append({"bench": "upload", "params": {"size": human(size), "content": content},
+                        "seconds": round(best_up[0], 4), "mb_s": round(size / 2**20 / best_up[0], 2), **best_up[1]})
+
+        best_down = None
+        for _ in range(repeat):
+            with RssSampler() as rss:
+                started = time.perf_counter()
+                status, received, _ = client.get(f"/api/files/{file_id}/download/")
+                elapsed = time.perf_counter() - started
+            if status != 200 or received != size:
+                raise RuntimeError(f"download {human(size)}: HTTP {status}, {received} байт")
+            if best_down is None or elapsed < best_down[0]:
+                best_down = (elapsed, rss.result())
+        results.append({"bench": "download", "params": {"size": human(size), "content": content},
+                        "seconds": round(best_down[0], 4), "mb_s": round(size / 2**20 / best_down[0], 2), **best_down[1]})
+        print(f"  {human(size):>5}: upload {results[-2]['mb_s']} MB/s, download {results[-1]['mb_s']} MB/s",
+              file=sys.stderr)
+    return results
+
+
+def bench_listing(client, user, counts, repeat):
+    """GET /api/files/ целиком и первая страница keyset-пагинации при N файлах пользователя."""
+    from app.files.models import File
+    results, have = [], File.objects.filter(user=user).count()
+    for count in counts:
+        File.objects.bulk_create(
+            [File(user=user, original_name=f"file-{i:07d}.txt", file=f"bench/{i}", size=i, stored_size=i)
+             for i in range(have, count)],
+            batch_size=2000,
+        )
+        have = max(have, count)
+        for name, query in (("list_all", ""), ("list_page", "limit=100")):
+            samples = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                status, received, _ = client.get("/api/files/", query)
+                samples.append(time.perf_counter() - started)
+                assert status == 200, status
+            results.append({"bench": name, "params": {"files": count}, "response_bytes": received, **latency(samples)})
+        print(f"  {count:>6} files: list_all p50 {results[-2]['p50_ms']} ms, "
+              f"page p50 {results[-1]['p50_ms']} ms", file=sys.stderr)
+    return results
+
+
+def bench_public_link(client, file_id, duration):
+    """Частота запросов к публичной ссылке на файл 1 КБ (последовательно, один поток)."""
+    status, link = client.json("POST", "/api/links/", {"file_id": file_id})
+    assert status == 201, link
+    token, saved = link["token"], client.token
+    client.token = None
+    samples, deadline = [], time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        status, _n, _ = client.get(f"/api/public/{token}/")
+        samples.append(time.perf_counter() - started)
+        assert status == 200, status
+    client.token = saved
+    total = sum(samples)
+    print(f"  public link: {len(samples) / total:.0f} req/s", file=sys.stderr)
+    return [{"bench": "public_link", "params": {"size": "1K"}, "rps": round(len(samples) / total, 1), **latency(samples)}]
+
+
+def bench_admin_users(client, counts, repeat):
+    from django.contrib.auth import get_user_model
+    User = get_user_model()
+    results, have = [], User.objects.count()
+    for count in counts:
+        User.objects.bulk_create(
+            [User(username=f"bench{i:07d}", email=f"bench{i}@bench.local", password="!") for i in range(have, count)],
+            batch_size=2000,
+        )
+        have = max(have, count)
+        samples = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            status, received, _ = client.get("/api/admin/users/")
+            samples.append(time.perf_counter() - started)
+            assert status == 200, status
+        results.append({"bench": "admin_users", "params": {"users": count}, "response_bytes": received, **latency(samples)})
+        print(f"  {count:>6} users: p50 {results[-1]['p50_ms']} ms", file=sys.stderr)
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def meta(args):
+    from django.conf import settings
+    from django.db import connection
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "database": connection.vendor,
+        "storage_backend": getattr(settings, "STORAGE_BACKEND", "local"),
+        "encryption_workers": getattr(settings, "ENCRYPTION_WORKERS", 1),
+        "encryption_pool": getattr(settings, "ENCRYPTION_POOL", "thread"),
+        "compression": getattr(settings, "STORAGE_COMPRESSION", "auto"),
+        "download_read_ahead": getattr(settings, "DOWNLOAD_READ_AHEAD", 0),
+        "download_buffer_size": getattr(settings, "DOWNLOAD_BUFFER_SIZE", 0),
+        "repeat": args.repeat,
+    }
+
+
+def run(args):
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "bench.settings")
+    import django
+    django.setup()
+    from django.conf import settings
+    from django.db import connection
+
+    only = set(args.only.split(",")) if args.only else {"upload", "download", "listing", "public_link", "admin_users"}
+    test_db = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    results = []
+    try:
+        client = Client()
+        _user, client.token = make_user("benchowner")
+        if only & {"upload", "download"}:
+            print("transfer:", file=sys.stderr)
+            sizes = [parse_size(s) for s in args.sizes.split(",")]
+            results += [r for r in bench_transfer(client, settings.BENCH_ROOT, sizes, args.content, args.repeat)
+                        if r["bench"] in only]
+        if "public_link" in only:
+            body = os.path.join(settings.BENCH_ROOT, "small.body")
+            length, ctype = write_multipart(body, 1024, "random")
+            with open(body, "rb") as fh:
+                file_id = json.loads(client.request("POST", "/api/files/", fh, length, ctype)[2])["id"]
+            results += bench_public_link(client, file_id, args.duration)
+        if "listing" in only:
+            print("listing:", file=sys.stderr)
+            lister, client.token = make_user("benchlister")
+            results += bench_listing(client, lister, [int(c) for c in args.files.split(",")], args.repeat_latency)
+        if "admin_users" in only:
+            print("admin users:", file=sys.stderr)
+            _admin, client.token = make_user("benchadmin", staff=True)
+            results += bench_admin_users(client, [int(c) for c in args.users.split(",")], args.repeat_latency)
+        report = {"meta": meta(args), "results": results}
+    finally:
+        connection.creation.destroy_test_db(test_db, verbosity=0)
+        if not args.keep:
+            shutil.rmtree(settings.BENCH_ROOT, ignore_errors=True)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+
+
+def _key(result):
+    return result["bench"], tuple(sorted(result["params"].items()))
+
+
+def compare(args):
+    base = {_key(r): r for r in json.loads(Path(args.base).read_text(encoding="utf-8"))["results"]}
+    new = {_key(r): r for r in json.loads(Path(args.new).read_text(encoding="utf-8"))["results"]}
+    regressions = 0
+    for key in sorted(base.keys() & new.keys()):
+        for metric, higher_better in DIRECTIONS.items():
+            old, cur = base[key].get(metric), new[key].get(metric)
+            if not old or cur is None:
+                continue
+            change = (cur - old) / old
+            worse = -change if higher_better else change
+            flag = "REGRESSION" if worse > args.tolerance else ""
+            regressions += bool(flag)
+            params = ",".join(f"{k}={v}" for k, v in key[1])
+            print(f"{key[0]:<12} {params:<28} {metric:<12} {old:>12} -> {cur:<12} {change:+.1%} {flag}")
+    return 1 if regressions else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    sub = parser.add_subparsers(dest="command")
+    cmp_parser = sub.add_parser("compare", help="сравнить два JSON-отчёта")
+    cmp_parser.add_argument("base")
+    cmp_parser.add_argument("new")
+    cmp_parser.add_argument("--tolerance", type=float, default=0.15, help="допустимое ухудшение, доля (0.15 = 15%%)")
+
+    parser.add_argument("--output", "-o", help="куда записать JSON (по умолчанию stdout)")
+    parser.add_argument("--only", help="upload,download,listing,public_link,admin_users")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help=f"размеры файлов (по умолчанию {DEFAULT_SIZES})")
+    parser.add_argument("--content", choices=("random", "text"), default="random",
+                        help="random — несжимаемые данные, text — сжимаемые (см. STORAGE_COMPRESSION)")
+    parser.add_argument("--files", default=DEFAULT_FILE_COUNTS, help="число файлов для замера списка")
+    parser.add_argument("--users", default=DEFAULT_USER_COUNTS, help="число пользователей для админского списка")
+    parser.add_argument("--repeat", type=int, default=3, help="попыток загрузки/скачивания, берётся лучшая")
+    parser.add_argument("--repeat-latency", type=int, default=20, help="запросов на точку для задержек")
+    parser.add_argument("--duration", type=float, default=3.0, help="секунд на замер публичной ссылки")
+    parser.add_argument("--keep", action="store_true", help="не удалять BENCH_ROOT (БД и файлы)")
+    args = parser.parse_args(argv)
+    if args.command == "compare":
+        return compare(args)
+    run(args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,50 @@
+"""
+Настройки для бенчмарков (bench/run.py): боевые app.settings, но своя БД и
+временный MEDIA_ROOT. BENCH_DB=sqlite (по умолчанию, файл во временном каталоге)
+или postgres — тогда берутся POSTGRES_* и создаётся отдельная база test_<имя>.
+"""
+import os
+import tempfile
+
+from app.settings import *  # noqa: F401,F403
+
+BENCH_ROOT = os.getenv("BENCH_ROOT") or tempfile.mkdtemp(prefix="mycloud-bench-")
+
+if os.getenv("BENCH_DB", "sqlite") == "sqlite":
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": os.path.join(BENCH_ROOT, "bench.sqlite3"),
+            "TEST": {"NAME": os.path.join(BENCH_ROOT, "bench.sqlite3")},
+        }
+    }
+
+MEDIA_ROOT = os.path.join(BENCH_ROOT, "media")
+FILE_UPLOAD_TEMP_DIR = os.path.join(BENCH_ROOT, "upload-tmp")
+os.makedirs(FILE_UPLOAD_TEMP_DIR, exist_ok=True)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local")
+ALLOWED_HOSTS = ["*"]
+DEBUG = False
+
+# лимиты боевой конфигурации мешают прогонам до 1 ГБ
+MAX_UPLOAD_SIZE = 1 << 40
+USER_STORAGE_QUOTA = 0
+# повторная загрузка того же тела иначе мерила бы дедупликацию, а не шифрование
+DEDUP_ENABLED = False
+# счётчик скачиваний пишется в запросе: его цена входит в замер, а не остаётся
+# в буфере до сброса после удаления тестовой БД
+COUNTER_FLUSH_INTERVAL = 0
+PASSWORD_HASHERS = ["django.contrib.auth.hashers.MD5PasswordHasher"]
+
+
+class _NoMigrations(dict):
+    """Как pytest --nomigrations: таблицы создаются по моделям (миграции в репозитории не хранятся)."""
+
+    def __contains__(self, item):
+        return True
+
+    def __getitem__(self, item):
+        return None
+
+
+MIGRATION_MODULES = _NoMigrations()
@@ -11,6 +11,9 @@ User = get_user_model()
 def _settings_overrides(settings, tmp_path):
     settings.MEDIA_ROOT = tmp_path / "media"
     settings.ENCRYPTION_KEY = os.environ.get("ENCRYPTION_KEY", "test-secret-key-please-change")
+    settings.TASKS_EAGER = True
+    # без фонового потока сброса счётчиков: он писал бы в БД мимо транзакции теста
+    settings.COUNTER_FLUSH_INTERVAL = 0
     return settings
 
 @pytest.fixture
@@ -0,0 +1,61 @@
+import pytest
+from asgiref.sync import async_to_sync
+from django.test import AsyncRequestFactory
+from rest_framework_simplejwt.tokens import AccessToken
+from app.files import async_views
+from app.files.models import File
+
+
+async def _consume(resp):
+    return b"".join([chunk async for chunk in resp.streaming_content])
+
+
+@pytest.mark.django_db
+def test_async_download_streams_with_range(user, admin, uploaded_file_obj, small_file_bytes):
+    fid = uploaded_file_obj["id"]
+    rf = AsyncRequestFactory()
+
+    async def run():
+        token = str(AccessToken.for_user(user))
+        resp = await async_views.download(rf.get("/", headers={"Authorization": f"Bearer {token}"}), fid)
+        assert resp.status_code == 200 and resp.is_async
+        assert await _consume(resp) == small_file_bytes
+
+        req = rf.get("/", headers={"Authorization": f"Bearer {token}", "Range": "bytes=7-"})
+        resp = await async_views.download(req, fid)
+        assert resp.status_code == 206
+        assert await _consume(resp) == small_file_bytes[7:]
+
+        other = str(AccessToken.for_user(admin))
+        resp = await async_views.download(rf.get("/", headers={"Authorization": f"Bearer {other}"}), fid)
+        assert resp.status_code == 404
+        resp = await async_views.admin_download(rf.get("/", headers={"Authorization": f"Bearer {other}"}), fid)
+        assert resp.status_code == 200
+        await _consume(resp)
+
+        resp = await async_views.download(rf.get("/"), fid)
+        assert resp.status_code == 401
+
+    async_to_sync(run)()
+    assert File.objects.get(pk=fid).download_count == 2
+
+
+@pytest.mark.django_db(transaction=True)
+def test_archive_streams_asynchronously_under_asgi(user):
+    import io
+    import zipfile
+    from django.core.files.base import ContentFile
+    from django.test import AsyncClient
+
+    obj = File(user=user, original_name="a.txt", size=5)
+    obj.file.save("a", ContentFile(b"alpha"), save=False)
+    obj.save()
+
+    async def run():
+        client = AsyncClient()
+        await client.aforce_login(user)
+        resp = await client.post("/api/files/archive/", {"ids": [obj.pk]}, content_type="application/json")
+        assert resp.status_code == 200 and resp.is_async
+        return await _consume(resp)
+
+    assert zipfile.ZipFile(io.BytesIO(async_to_sync(run)())).read("a.txt") == b"alpha"
@@ -35,3 +35,61 @@ def test_register_bad_password(api):
     r = api.post("/api/auth/register/", payload, format="json")
     assert r.status_code == 400
     assert "password" in r.json()
+
+def _bearer(api, username):
+    r = api.post("/api/token/", {"username": username, "password": "P@ssw0rd!"}, format="json")
+    assert r.status_code == 200, r.content
+    api.credentials(HTTP_AUTHORIZATION=f"Bearer {r.json()['access']}")
+    return r.json()
+
+def _user_queries(api, url):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    with CaptureQueriesContext(connection) as ctx:
+        r = api.get(url)
+    # поиск пользователя, а не JOIN владельца в списке файлов
+    return r, [q["sql"] for q in ctx.captured_queries if 'FROM "users_user"' in q["sql"]]
+
+@pytest.mark.django_db
+def test_jwt_user_cached_and_invalidated(api, user, admin):
+    from app.users import authentication
+    authentication.clear()
+    _bearer(api, "johnsmith")
+    assert _user_queries(api, "/api/files/")[1]
+    r, queries = _user_queries(api, "/api/files/")
+    assert r.status_code == 200 and not queries
+    r, queries = _user_queries(api, "/api/auth/me/")
+    assert r.json()["files_count"] == 0 and len(queries) == 1  # отложенные поля — одним запросом
+    assert api.get("/api/admin/users/").status_code == 403
+
+    staff = type(api)()
+    staff.force_login(admin)
+    assert staff.post(f"/api/admin/users/{user.pk}/toggle_staff/").status_code == 200
+    assert api.get("/api/admin/users/").status_code == 200
+
+    user.refresh_from_db()
+    user.is_active = False
+    user.save(update_fields=["is_active"])
+    assert api.get("/api/files/").status_code == 401
+
+@pytest.mark.django_db
+def test_jwt_trusted_claims(api, user, admin, settings):
+    from app.users import authentication
+    authentication.clear()
+    settings.AUTH_TRUST_TOKEN_CLAIMS = True
+    tokens = _bearer(api, "johnsmith")
+    r, queries = _user_queries(api, "/api/files/")
+    assert r.status_code == 200 and not queries
+    assert api.get("/api/admin/users/").status_code == 403
+
+    user.is_staff = True
+    user.save(update_fields=["is_staff"])
+    assert api.get("/api/admin/users/").status_code == 200  # старый токен после изменения — через БД
+
+    from rest_framework_simplejwt.tokens import AccessToken
+    access = api.post("/api/token/refresh/", {"refresh": tokens["refresh"]}, format="json").json()["access"]
+    assert AccessToken(access)["is_staff"] is True
+    api.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+    authentication.clear()
+    r, queries = _user_queries(api, "/api/files/")
+    assert r.status_code == 200 and not queries
@@ -0,0 +1,53 @@
+import io
+import zipfile
+import pytest
+from django.core.files.uploadedfile import SimpleUploadedFile
+from app.files.models import File, Blob
+
+
+def _upload_many(api, payloads):
+    files = [SimpleUploadedFile(name, data) for name, data in payloads]
+    return api.post("/api/files/bulk-upload/", {"files": files, "description": "batch"}, format="multipart")
+
+
+@pytest.mark.django_db
+def test_bulk_upload_and_archive(api, user):
+    api.force_login(user)
+    payloads = [("a.txt", b"alpha"), ("b.bin", b"\x00" * 70000), ("a.txt", b"second a")]
+    r = _upload_many(api, payloads)
+    assert r.status_code == 201, r.content
+    ids = [f["id"] for f in r.json()]
+    assert len(ids) == 3
+    user.refresh_from_db()
+    assert user.files_count == 3
+
+    r = api.post("/api/files/archive/", {"ids": ids}, format="json")
+    assert r.status_code == 200
+    assert r["Content-Type"] == "application/zip"
+    zf = zipfile.ZipFile(io.BytesIO(b"".join(r.streaming_content)))
+    assert sorted(zf.namelist()) == ["a (1).txt", "a.txt", "b.bin"]
+    assert {zf.read("a.txt"), zf.read("a (1).txt")} == {b"alpha", b"second a"}
+    assert zf.read("b.bin") == b"\x00" * 70000
+    assert zf.testzip() is None
+
+
+@pytest.mark.django_db
+def test_bulk_delete_only_own_files(api, user, admin, settings):
+    settings.DEDUP_ENABLED = True
+    api.force_login(admin)
+    foreign = _upload_many(api, [("x.txt", b"shared")]).json()[0]["id"]
+    api.force_login(user)
+    ids = [f["id"] for f in _upload_many(api, [("x.txt", b"shared"), ("y.txt", b"shared"), ("z.txt", b"own")]).json()]
+    assert Blob.objects.get(digest=File.objects.get(pk=foreign).digest).refcount == 3
+
+    r = api.post("/api/files/bulk-delete/", {"ids": ids + [foreign]}, format="json")
+    assert r.status_code == 200
+    assert r.json() == {"deleted": 3}
+    assert list(File.objects.values_list("pk", flat=True)) == [foreign]
+    blob = Blob.objects.get()
+    assert blob.refcount == 1
+    assert File.objects.get(pk=foreign).file.storage.exists(blob.storage_name)
+    user.refresh_from_db()
+    assert (user.files_count, user.files_total_size) == (0, 0)
+
+    assert api.post("/api/files/bulk-delete/", {"ids": []}, format="json").status_code == 400
@@ -0,0 +1,78 @@
+import os
+import pytest
+from django.core.files.uploadedfile import SimpleUploadedFile
+from app.files.models import Blob, File
+
+
+@pytest.fixture
+def dedup(settings):
+    settings.DEDUP_ENABLED = True
+
+
+def _upload(api, data, name="same.bin"):
+    r = api.post("/api/files/", {"file": SimpleUploadedFile(name, data)}, format="multipart")
+    assert r.status_code == 201, r.content
+    return r.json()["id"]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_duplicates_share_one_blob(api, user, admin, dedup):
+    data = os.urandom(100 * 1024)
+    api.force_login(user)
+    a = _upload(api, data)
+    api.force_login(admin)
+    b = _upload(api, data, "copy.bin")
+
+    blob = Blob.objects.get()
+    assert blob.refcount == 2
+    assert File.objects.get(pk=a).file.name == File.objects.get(pk=b).file.name
+    storage = File._meta.get_field("file").storage
+    assert storage.exists(blob.storage_name)
+
+    assert api.delete(f"/api/files/{b}/").status_code == 204
+    assert Blob.objects.get().refcount == 1
+    assert storage.exists(blob.storage_name)
+
+    api.force_login(user)
+    r = api.get(f"/api/files/{a}/download/")
+    assert b"".join(r.streaming_content) == data
+    assert api.delete(f"/api/files/{a}/").status_code == 204
+    assert not Blob.objects.exists()
+    assert not storage.exists(blob.storage_name)
+
+
+@pytest.mark.django_db
+def test_chunked_upload_adopted_after_commit(api, user, dedup, settings, django_capture_on_commit_callbacks):
+    settings.UPLOAD_CHUNK_SIZE = 64 * 1024
+    data = os.urandom(100 * 1024)
+    api.force_login(user)
+    _upload(api, data)
+    blob = Blob.objects.get()
+
+    s = api.post("/api/uploads/", {"name": "big.bin", "size": len(data)}, format="json").json()
+    cs = s["chunk_size"]
+    for i in range(s["chunk_count"]):
+        r = api.generic("PUT", f"/api/uploads/{s['id']}/chunks/{i}/", data[i * cs:(i + 1) * cs],
+                        content_type="application/octet-stream")
+        assert r.status_code == 200
+    with django_capture_on_commit_callbacks() as callbacks:
+        r = api.post(f"/api/uploads/{s['id']}/commit/")
+    assert r.status_code == 201, r.content
+    file_id = r.json()["id"]
+
+    # ссылки уже закэшировали File с исходным именем и без дайджеста
+    from app.links import cache
+    token = api.post("/api/links/", {"file_id": file_id}, format="json").json()["token"]
+    assert cache.resolve(token).file.digest == ""
+    assert cache.resolve_file(file_id).digest == ""
+    with django_capture_on_commit_callbacks(execute=True):
+        for callback in callbacks:
+            callback()
+
+    obj = File.objects.get(pk=file_id)
+    assert obj.blob_id == blob.pk and obj.file.name == blob.storage_name
+    assert cache.resolve(token).file.file.name == blob.storage_name
+    assert cache.resolve_file(file_id).digest == obj.digest != ""
+    assert Blob.objects.get().refcount == 2
+    r = api.get(f"/api/files/{obj.pk}/download/")
+    assert b"".join(r.streaming_content) == data
@@ -25,6 +25,8 @@ def test_upload_and_list(api, user, small_file_bytes):
     up = r.json()
     assert up["original_name"] == "hello.txt"
     assert up["size"] == len(small_file_bytes)
+    obj = File.objects.get(pk=up["id"])
+    assert up["stored_size"] == obj.file.storage.size(obj.file.name)
 
     # list
     r = api.get("/api/files/")
@@ -60,3 +62,305 @@ def test_delete(api, user, uploaded_file_obj):
     r = api.get("/api/files/")
     assert r.status_code == 200
     assert r.json() == []
+
+@pytest.fixture
+def big_file(api, user):
+    import os
+    from django.core.files.uploadedfile import SimpleUploadedFile
+    data = os.urandom(200 * 1024 + 7)
+    api.force_login(user)
+    r = api.post("/api/files/", {"file": SimpleUploadedFile("big.bin", data)}, format="multipart")
+    assert r.status_code == 201, r.content
+    return r.json()["id"], data
+
+@pytest.mark.django_db
+def test_download_single_range(api, big_file):
+    fid, data = big_file
+    r = api.get(f"/api/files/{fid}/download/", HTTP_RANGE="bytes=100000-100099")
+    assert r.status_code == 206
+    assert r["Content-Range"] == f"bytes 100000-100099/{len(data)}"
+    assert b"".join(r.streaming_content) == data[100000:100100]
+
+    r = api.get(f"/api/files/{fid}/download/", HTTP_RANGE="bytes=-10")
+    assert b"".join(r.streaming_content) == data[-10:]
+
+    r = api.get(f"/api/files/{fid}/download/", HTTP_RANGE=f"bytes={len(data)}-")
+    assert r.status_code == 416
+
+@pytest.mark.django_db
+def test_download_multi_range_and_if_range(api, big_file):
+    fid, data = big_file
+    r = api.get(f"/api/files/{fid}/download/", HTTP_RANGE="bytes=0-9,70000-70009")
+    assert r.status_code == 206
+    assert r["Content-Type"].startswith("multipart/byteranges")
+    body = b"".join(r.streaming_content)
+    assert int(r["Content-Length"]) == len(body)
+    assert data[:10] in body and data[70000:70010] in body
+
+    r = api.get(f"/api/files/{fid}/download/", HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE='"stale"')
+    assert r.status_code == 200
+    r = api.get(f"/api/files/{fid}/download/", HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE=r["Last-Modified"])
+    assert r.status_code == 206
+    r = api.get(f"/api/files/{fid}/download/", HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE=r["ETag"])
+    assert r.status_code == 206
+
+@pytest.mark.django_db
+def test_conditional_download_skips_storage(api, user, uploaded_file_obj, small_file_bytes, monkeypatch):
+    from app.files import blobs
+    api.force_login(user)
+    fid = uploaded_file_obj["id"]
+    obj = File.objects.get(pk=fid)
+    assert obj.digest == blobs.content_digest([small_file_bytes])
+
+    r = api.get(f"/api/files/{fid}/download/")
+    etag, modified = r["ETag"], r["Last-Modified"]
+    assert etag == f'"{obj.digest}"'
+    assert r["Cache-Control"] == "private, no-cache"
+
+    def boom(*args, **kwargs):
+        raise AssertionError("storage must not be touched")
+    monkeypatch.setattr(type(obj.file.storage), "exists", boom)
+    monkeypatch.setattr(type(obj.file.storage), "open_decrypted", boom)
+    r = api.get(f"/api/files/{fid}/download/", HTTP_IF_NONE_MATCH=etag)
+    assert r.status_code == 304
+    assert r["ETag"] == etag
+    assert api.get(f"/api/files/{fid}/download/", HTTP_IF_MODIFIED_SINCE=modified).status_code == 304
+    assert File.objects.get(pk=fid).download_count == 1
+
+@pytest.mark.django_db
+def test_authenticated_api_not_stored_but_downloads_revalidate(api, user, uploaded_file_obj):
+    from asgiref.sync import async_to_sync
+    from django.http import JsonResponse
+    from django.test import AsyncRequestFactory
+    from app.common.middleware import NoStoreForAuth
+    api.force_login(user)
+    r = api.get("/api/files/")
+    assert r["Cache-Control"].startswith("no-store") and r["Pragma"] == "no-cache"
+    assert "Authorization" in r["Vary"]
+    r = api.get(f"/api/files/{uploaded_file_obj['id']}/download/")
+    assert r["Cache-Control"] == "private, no-cache"
+    api.logout()
+    assert "no-store" not in api.get("/api/files/").get("Cache-Control", "")
+
+    async def view(request):
+        return JsonResponse({})
+    request = AsyncRequestFactory().get("/api/files/1/download/")
+    request.user = user
+    resp = async_to_sync(NoStoreForAuth(view))(request)
+    assert resp["Cache-Control"].startswith("no-store")
+
+@pytest.mark.django_db
+def test_list_keyset_pagination_and_filters(api, user):
+    from django.core.files.uploadedfile import SimpleUploadedFile
+    api.force_login(user)
+    for i in range(5):
+        r = api.post("/api/files/", {"file": SimpleUploadedFile(f"doc{i}.txt", b"x" * (i + 1))}, format="multipart")
+        assert r.status_code == 201
+
+    seen, url = [], "/api/files/?limit=2&ordering=size"
+    while url:
+        r = api.get(url)
+        assert r.status_code == 200
+        page = r.json()
+        seen += [f["size"] for f in page["results"]]
+        url = page["next"]
+    assert seen == [1, 2, 3, 4, 5]
+
+    from app.common.pagination import KeysetPagination
+    for value in ("x", "2020-13-45", None, [1]):
+        cursor = KeysetPagination._encode(value, 1)
+        assert api.get(f"/api/files/?ordering=size&cursor={cursor}").status_code == 400
+        assert api.get(f"/api/files/?ordering=uploaded_at&cursor={cursor}").status_code == 400
+
+    # владелец в FileSerializer подгружается тем же запросом: число запросов не зависит от страницы
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    counts = []
+    for limit in (1, 5):
+        with CaptureQueriesContext(connection) as ctx:
+            assert api.get(f"/api/files/?limit={limit}").status_code == 200
+        counts.append(len(ctx))
+    assert counts[0] == counts[1]
+
+    r = api.get("/api/files/?size_min=2&size_max=3&name_prefix=doc")
+    assert sorted(f["size"] for f in r.json()) == [2, 3]
+    assert api.get("/api/files/?ordering=password").status_code == 400
+
+@pytest.mark.django_db
+def test_download_offloaded_to_proxy(api, user, uploaded_file_obj, small_file_bytes, settings, tmp_path):
+    import os
+    settings.DOWNLOAD_DELIVERY = "x-accel"
+    settings.DOWNLOAD_CACHE_ROOT = str(tmp_path / "cache")
+    api.force_login(user)
+    fid = uploaded_file_obj["id"]
+
+    # промах: отдаём потоком сами и попутно кладём копию в кэш
+    r = api.get(f"/api/files/{fid}/download/")
+    assert r.status_code == 200 and "X-Accel-Redirect" not in r
+    assert b"".join(r.streaming_content) == small_file_bytes
+
+    r = api.get(f"/api/files/{fid}/download/")
+    assert r.status_code == 200
+    target = r["X-Accel-Redirect"]
+    assert target.startswith("/protected/")
+    cached = os.path.join(settings.DOWNLOAD_CACHE_ROOT, target[len("/protected/"):])
+    with open(cached, "rb") as fh:
+        assert fh.read() == small_file_bytes
+    assert File.objects.get(pk=fid).download_count == 2
+
+    api.delete(f"/api/files/{fid}/")
+    assert not os.path.exists(cached)
+
+
+@pytest.mark.django_db
+def test_offload_cache_skips_files_over_budget(api, user, settings, tmp_path):
+    import os
+    from django.core.files.uploadedfile import SimpleUploadedFile
+    from app.files import delivery
+    settings.DOWNLOAD_DELIVERY = "x-accel"
+    settings.DOWNLOAD_CACHE_ROOT = str(tmp_path / "cache")
+    settings.DOWNLOAD_CACHE_MAX_BYTES = 1000
+    delivery.index.clear()
+    api.force_login(user)
+    ids = [api.post("/api/files/", {"file": SimpleUploadedFile(f"{n}.bin", os.urandom(n))},
+                    format="multipart").json()["id"] for n in (600, 700, 5000)]
+
+    for fid in ids:
+        r = api.get(f"/api/files/{fid}/download/")
+        b"".join(r.streaming_content)
+    # 600 вытеснен 700-м, 5000 не влезает в бюджет и не кэшируется вовсе
+    assert [("X-Accel-Redirect" in api.get(f"/api/files/{fid}/download/")) for fid in ids] == [False, True, False]
+    assert not [f for f in _stored_files(settings.DOWNLOAD_CACHE_ROOT) if f.startswith(".part-")]
+
+def _stored_files(root):
+    import os
+    return [f for _, _, names in os.walk(root) for f in names]
+
+@pytest.mark.django_db
+def test_upload_encrypted_while_streaming(api, user, settings, tmp_path):
+    import os
+    from django.core.files.uploadedfile import SimpleUploadedFile
+    from app.files import blobs
+    settings.FILE_UPLOAD_TEMP_DIR = str(tmp_path / "upload-tmp")
+    os.makedirs(settings.FILE_UPLOAD_TEMP_DIR)
+    data = os.urandom(2 * 1024 * 1024 + 5)
+    api.force_login(user)
+    r = api.post("/api/files/", {"file": SimpleUploadedFile("big.bin", data)}, format="multipart")
+    assert r.status_code == 201, r.content
+    assert os.listdir(settings.FILE_UPLOAD_TEMP_DIR) == []
+    obj = File.objects.get(pk=r.json()["id"])
+    assert obj.digest == blobs.content_digest([data])
+    r = api.get(f"/api/files/{obj.pk}/download/")
+    assert b"".join(r.streaming_content) == data
+
+@pytest.mark.django_db
+def test_upload_over_limit_aborted_midstream(api, user, settings):
+    import os
+    from django.core.files.uploadedfile import SimpleUploadedFile
+    settings.MAX_UPLOAD_SIZE = 1024 * 1024 + 100
+    api.force_login(user)
+    r = api.post("/api/files/", {"file": SimpleUploadedFile("big.bin", os.urandom(3 * 1024 * 1024))}, format="multipart")
+    assert r.status_code == 400
+    assert "file" in r.json()["detail"]
+    assert File.objects.count() == 0
+    assert _stored_files(settings.MEDIA_ROOT) == []
+
+@pytest.mark.django_db
+def test_rejected_upload_removes_written_files(api, user, settings, django_capture_on_commit_callbacks):
+    from django.core.files.uploadedfile import SimpleUploadedFile
+    settings.BULK_MAX_FILES = 1
+    api.force_login(user)
+    files = [SimpleUploadedFile(f"{i}.txt", b"x" * 10) for i in range(2)]
+    with django_capture_on_commit_callbacks(execute=True):
+        r = api.post("/api/files/bulk-upload/", {"files": files}, format="multipart")
+    assert r.status_code == 400
+    assert _stored_files(settings.MEDIA_ROOT) == []
+
+@pytest.mark.django_db
+def test_download_read_ahead(api, big_file, settings):
+    settings.DOWNLOAD_READ_AHEAD = 2
+    settings.DOWNLOAD_BUFFER_SIZE = 16 * 1024
+    fid, data = big_file
+    r = api.get(f"/api/files/{fid}/download/")
+    assert b"".join(r.streaming_content) == data
+    r = api.get(f"/api/files/{fid}/download/", HTTP_RANGE="bytes=1000-150000")
+    assert b"".join(r.streaming_content) == data[1000:150001]
+    r = api.get(f"/api/files/{fid}/download/", HTTP_RANGE="bytes=0-9,70000-170000")
+    body = b"".join(r.streaming_content)
+    assert int(r["Content-Length"]) == len(body)
+    assert data[70000:170001] in body
+
+def test_read_ahead_stops_reader_and_reraises():
+    import threading
+    from app.files.downloads import read_ahead
+    closed = threading.Event()
+
+    def endless():
+        try:
+            while True:
+                yield b"x"
+        finally:
+            closed.set()
+
+    it = read_ahead(endless(), 2)
+    assert next(it) == b"x"
+    it.close()
+    assert closed.wait(5)
+
+    def broken():
+        yield b"a"
+        raise OSError("disk")
+
+    it = read_ahead(broken(), 4)
+    assert next(it) == b"a"
+    with pytest.raises(OSError):
+        next(it)
+
+@pytest.mark.django_db
+def test_search_names_and_descriptions(api, user, admin):
+    from django.core.files.uploadedfile import SimpleUploadedFile
+    api.force_login(user)
+    ids = {}
+    for name, description in [("Quarterly report 2024.pdf", "финансы за квартал"),
+                              ("holiday_photo.jpg", ""),
+                              ("report-draft.docx", None)]:
+        data = {"file": SimpleUploadedFile(name, b"x")}
+        if description is not None:
+            data["description"] = description
+        r = api.post("/api/files/", data, format="multipart")
+        ids[name] = r.json()["id"]
+
+    names = lambda r: [f["original_name"] for f in r.json()]
+    r = api.get("/api/files/search/?q=quarterly report")
+    assert r.status_code == 200
+    assert names(r) == ["Quarterly report 2024.pdf", "report-draft.docx"]
+    assert names(api.get("/api/files/search/?q=финанс")) == ["Quarterly report 2024.pdf"]
+    assert names(api.get("/api/files/search/?q=report&limit=1")) == ["report-draft.docx"]
+    assert api.get("/api/files/search/?q=x").status_code == 400
+
+    api.patch(f"/api/files/{ids['holiday_photo.jpg']}/", {"description": "море"}, format="json")
+    assert names(api.get("/api/files/search/?q=море")) == ["holiday_photo.jpg"]
+
+    api.force_login(admin)
+    assert api.get("/api/files/search/?q=report").json() == []
+    r = api.get(f"/api/admin/files/search/?q=report&user={user.pk}")
+    assert sorted(names(r)) == ["Quarterly report 2024.pdf", "report-draft.docx"]
+    assert r.json()[0]["user"]["username"] == "johnsmith"
+
+def test_postgres_search_uses_indexed_expression():
+    from unittest import mock
+    from app.files import search
+    from app.files.models import File
+
+    quote = search.connection.ops.quote_name
+    conn = mock.MagicMock(vendor="postgresql", ops=search.connection.ops)
+    execute = conn.cursor.return_value.__enter__.return_value.execute
+    with mock.patch.object(search, "connections", {"default": conn}):
+        search.install_indexes()
+    indexes = " ".join(c.args[0] for c in execute.call_args_list)
+    assert search._vector(quote("original_name"), quote("description")) in indexes
+
+    # запрос — тем же выражением (планировщик сверяет его с индексом), слова — префиксами
+    sql, params = search._search_postgres(File.objects.all(), "Финанс отчёт_2024").query.sql_with_params()
+    assert search._vector(*search._columns()) in sql
+    assert "финанс:* | отчёт:* | 2024:*" in params
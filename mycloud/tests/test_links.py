@@ -15,3 +15,168 @@ def test_create_link_and_public_download(api, user, uploaded_file_obj):
     assert r.status_code == 200
     assert int(r.get("Content-Length") or 0) == uploaded_file_obj["size"]
     assert "attachment; filename" in (r.get("Content-Disposition") or "")
+    assert r["Cache-Control"].startswith("public, max-age=")
+
+@pytest.mark.django_db
+def test_public_link_resolution_cached(api, user, uploaded_file_obj, django_assert_num_queries):
+    from app.links import cache
+    cache.clear()
+    api.force_login(user)
+    token = api.post("/api/links/", {"file_id": uploaded_file_obj["id"]}, format="json").json()["token"]
+
+    with django_assert_num_queries(1):
+        assert cache.resolve(token).file_id == uploaded_file_obj["id"]
+        assert cache.resolve(token) is not None
+    with django_assert_num_queries(1):
+        assert cache.resolve("nope") is None
+        assert cache.resolve("nope") is None
+
+    api.delete(f"/api/files/{uploaded_file_obj['id']}/")
+    assert cache.resolve(token) is None
+    api.logout()
+    assert api.get(f"/api/public/{token}/").status_code == 404
+
+@pytest.mark.django_db
+def test_public_link_expiry_and_download_limit(api, user, uploaded_file_obj):
+    from datetime import timedelta
+    from django.utils import timezone
+    from app.links.models import Link
+    api.force_login(user)
+    r = api.post("/api/links/", {"file_id": uploaded_file_obj["id"], "max_downloads": 2}, format="json")
+    assert r.status_code == 201, r.content
+    url = r.json()["url"]
+    api.logout()
+
+    r1 = api.get(url)
+    assert r1.status_code == 200
+    assert r1["Cache-Control"] == "private, no-cache"
+    assert api.get(url, HTTP_IF_NONE_MATCH=r1["ETag"]).status_code == 304
+    assert api.get(url).status_code == 200
+    assert api.get(url).status_code == 410
+    assert Link.objects.get(token=r.json()["token"]).download_count == 2
+
+    api.force_login(user)
+    r = api.post("/api/links/", {"file_id": uploaded_file_obj["id"], "expires_in": 60}, format="json")
+    link = Link.objects.get(token=r.json()["token"])
+    assert api.get(r.json()["url"]).status_code == 200
+    link.expires_at = timezone.now() - timedelta(seconds=1)
+    link.save()
+    assert api.get(r.json()["url"]).status_code == 410
+
+    r = api.post("/api/links/", {"file_id": uploaded_file_obj["id"], "expires_at": "2000-01-01T00:00:00Z"},
+                 format="json")
+    assert r.status_code == 400
+
+@pytest.mark.django_db
+def test_download_hits_flushed_in_batches(api, user, uploaded_file_obj, settings):
+    from app.common.counters import hits
+    from app.files.models import File
+    from app.links.models import Link
+    hits.flush()
+    settings.COUNTER_FLUSH_INTERVAL = 3600
+    api.force_login(user)
+    fid = uploaded_file_obj["id"]
+    token = api.post("/api/links/", {"file_id": fid}, format="json").json()["token"]
+
+    for _ in range(3):
+        assert api.get(f"/api/files/{fid}/download/").status_code == 200
+        assert api.get(f"/api/public/{token}/").status_code == 200
+    assert File.objects.get(pk=fid).download_count == 0
+
+    # журнал общий для процессов: команда в отдельном процессе разбирает то, что сюда сбросил поток
+    from django.core.management import call_command
+    from app.files.models import PendingHit
+    assert hits.spill() == 2
+    assert PendingHit.objects.count() == 2
+    assert File.objects.get(pk=fid).download_count == 0
+    call_command("flush_counters")
+    assert not PendingHit.objects.exists()
+    f = File.objects.get(pk=fid)
+    assert f.download_count == 6
+    assert f.last_downloaded_at is not None
+    assert Link.objects.get(token=token).download_count == 3
+
+@pytest.mark.django_db
+def test_unbatched_hits_update_directly(user, uploaded_file_obj, django_assert_num_queries):
+    from app.common import counters
+    from app.files.models import File, PendingHit
+    fid = uploaded_file_obj["id"]
+    with django_assert_num_queries(1):
+        counters.hits.hit(File, fid)
+    assert not PendingHit.objects.exists()
+    assert File.objects.get(pk=fid).download_count == 1
+    # пустой буфер при выходе не трогает БД
+    with django_assert_num_queries(0):
+        counters._flush_on_exit()
+
+@pytest.mark.django_db
+def test_signed_link_needs_no_database(api, user, uploaded_file_obj, django_assert_num_queries):
+    from app.links import cache
+    from app.links.models import Link
+    cache.clear()
+    api.force_login(user)
+    r = api.post("/api/links/signed/", {"file_id": uploaded_file_obj["id"], "inline": True}, format="json")
+    assert r.status_code == 201, r.content
+    url = r.json()["url"]
+    assert url.startswith("/api/public/s/")
+    assert not Link.objects.exists()
+    api.logout()
+
+    r = api.get(url)
+    assert r.status_code == 200
+    assert b"".join(r.streaming_content) == b"hello, world!"
+    assert r["Content-Disposition"].startswith("inline")
+    # text/plain не из списка показываемых типов
+    assert r["Content-Type"] == "application/octet-stream"
+    assert r["Content-Security-Policy"] == "sandbox"
+    assert r["X-Content-Type-Options"] == "nosniff"
+    assert r["Cache-Control"].startswith("public, max-age=")
+    with django_assert_num_queries(0):
+        assert api.get(url, HTTP_IF_NONE_MATCH=r["ETag"]).status_code == 304
+
+    token = r.wsgi_request.resolver_match.kwargs["token"]
+    tampered = token[:-2] + ("AA" if token[-2:] != "AA" else "BB")
+    assert api.get(f"/api/public/s/{tampered}/").status_code == 404
+    assert api.get("/api/public/s/garbage/").status_code == 404
+
+@pytest.mark.django_db
+def test_signed_link_expiry_and_revocation(api, user, admin, uploaded_file_obj, settings):
+    from datetime import timedelta
+    from django.utils import timezone
+    from app.files.models import File
+    from app.links import cache, signing
+    cache.clear()
+    fid = uploaded_file_obj["id"]
+    api.force_login(admin)
+    assert api.post("/api/links/signed/", {"file_id": fid}, format="json").status_code == 201
+    api.force_login(user)
+    settings.SIGNED_LINK_MAX_TTL = 60
+    assert api.post("/api/links/signed/", {"file_id": fid, "expires_in": 61}, format="json").status_code == 400
+    url = api.post("/api/links/signed/", {"file_id": fid}, format="json").json()["url"]
+    assert "attachment" in api.get(url)["Content-Disposition"]
+
+    stale = signing.sign(File.objects.get(pk=fid), timezone.now() - timedelta(seconds=1))
+    assert api.get(f"/api/public/s/{stale}/").status_code == 410
+
+    assert api.post("/api/links/signed/revoke/", {"file_id": fid}, format="json").status_code == 204
+    assert api.get(url).status_code == 410
+    fresh = api.post("/api/links/signed/", {"file_id": fid}, format="json").json()["url"]
+    assert api.get(fresh).status_code == 200
+
+    other = type(user).objects.create_user(username="other", email="o@example.com", password="P@ssw0rd!")
+    api.force_login(other)
+    assert api.post("/api/links/signed/", {"file_id": fid}, format="json").status_code == 403
+    assert api.post("/api/links/signed/revoke/", {"file_id": fid}, format="json").status_code == 403
+
+
+@pytest.mark.parametrize("name,expected", [
+    ("photo.png", "image/png"),
+    ("doc.pdf", "application/pdf"),
+    ("clip.mp4", "video/mp4"),
+    ("logo.svg", "application/octet-stream"),
+    ("page.html", "application/octet-stream"),
+])
+def test_inline_content_type_allow_list(name, expected):
+    from app.files.downloads import content_type
+    from app.files.models import File
+    assert content_type(File(original_name=name), inline=True) == expected
@@ -0,0 +1,51 @@
+import pytest
+from app.common import metrics
+
+
+def _value(text, prefix):
+    for line in text.splitlines():
+        if line.startswith(prefix):
+            return float(line.rsplit(" ", 1)[1])
+    return 0.0
+
+
+@pytest.mark.django_db
+def test_healthz(client):
+    resp = client.get("/healthz")
+    assert resp.status_code == 200
+    assert resp.json() == {"status": "ok", "database": "ok", "storage": "ok"}
+
+
+@pytest.mark.django_db
+def test_metrics_records_requests_streams_and_storage(client, api, uploaded_file_obj, small_file_bytes):
+    before = metrics.registry.render()
+    resp = api.get(f"/api/files/{uploaded_file_obj['id']}/download/")
+    assert b"".join(resp.streaming_content) == small_file_bytes
+
+    text = client.get("/metrics").content.decode()
+    assert 'mycloud_http_requests_total{view="files-download",method="GET",status="200"}' in text
+    assert 'mycloud_http_request_duration_seconds_bucket{view="files-download",method="GET",le="+Inf"}' in text
+    sent = 'mycloud_http_response_bytes_total{view="files-download"}'
+    assert _value(text, sent) - _value(before, sent) == len(small_file_bytes)
+    flight = 'mycloud_http_streams_in_flight{view="files-download"}'
+    assert _value(text, flight) == _value(before, flight)  # поток закрыт — снова не в полёте
+    assert _value(text, 'mycloud_http_request_db_queries_count{view="files-download"}') >= 1
+    assert _value(text, 'mycloud_http_request_db_queries_sum{view="files-download"}') >= 1
+    for op in ("encrypt", "decrypt", "read", "write"):
+        assert _value(text, f'mycloud_storage_seconds_total{{op="{op}"}}') > 0
+    assert "mycloud_download_hits_pending" in text
+
+    # оборванный клиентом поток: прочитан кусок, ответ закрыт
+    resp = api.get(f"/api/files/{uploaded_file_obj['id']}/download/")
+    next(iter(resp.streaming_content))
+    assert _value(metrics.registry.render(), flight) == _value(before, flight) + 1
+    resp.close()
+    assert _value(metrics.registry.render(), flight) == _value(before, flight)
+
+
+@pytest.mark.django_db
+def test_metrics_token(client, settings):
+    settings.METRICS_TOKEN = "s3cret"
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer nope"}).status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer s3cret"}).status_code == 200
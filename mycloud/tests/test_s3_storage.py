@@ -0,0 +1,63 @@
+import io
+import os
+import pytest
+from django.core.files.base import ContentFile
+
+moto = pytest.importorskip("moto")
+boto3 = pytest.importorskip("boto3")
+
+from app.core.s3 import S3Storage, MIN_PART_SIZE
+from app.core.storage import EncryptedStorage, HEADER
+
+
+@pytest.fixture
+def s3(settings, monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "test")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "test")
+    settings.S3_REGION = "us-east-1"
+    settings.S3_READ_AHEAD = 4096
+    settings.ENCRYPTION_SEGMENT_SIZE = 1024
+    with moto.mock_aws():
+        boto3.client("s3", region_name="us-east-1").create_bucket(Bucket="test-bucket")
+        yield S3Storage(bucket="test-bucket", prefix="media", workers=3)
+
+
+def test_encrypted_roundtrip_over_s3(s3):
+    storage = EncryptedStorage(s3)
+    data = os.urandom(2 * MIN_PART_SIZE + 12345)
+    name = storage.save("u/1/file", ContentFile(data))
+    raw = s3.client.get_object(Bucket="test-bucket", Key="media/u/1/file")["Body"].read()
+    assert raw[:4] == HEADER.pack(b"\x89MCE", 1, 1024, b"\0" * 16)[:4]
+    assert data[:1024] not in raw
+
+    f = storage.open_decrypted(name)
+    assert f.size == len(data)
+    f.seek(MIN_PART_SIZE - 10)
+    assert f.read(20) == data[MIN_PART_SIZE - 10:MIN_PART_SIZE + 10]
+    assert b"".join(f.chunks(256 * 1024)) == data
+    storage.verify(name)
+
+    assert storage.listdir("u") == (["1"], [])
+    assert list(storage.walk()) == ["u/1/file"]
+    storage.delete(name)
+    assert storage.open_decrypted(name) is None
+
+
+def test_resumable_upload_parts_composed(s3):
+    storage = EncryptedStorage(s3)
+    data = os.urandom(5000)
+    name = storage.begin_upload("u/2/big")
+    chunk = 2048
+    for offset in (4096, 0, 2048):
+        piece = data[offset:offset + chunk]
+        storage.write_chunk(name, offset, io.BytesIO(piece), len(piece), len(data))
+    assert len(s3.listdir(f"{name}.parts")[1]) == 3
+
+    storage.finish_upload(name)
+    assert s3.listdir(f"{name}.parts")[1] == []
+    assert storage.open_decrypted(name).read() == data
+
+    other = storage.begin_upload("u/2/aborted")
+    storage.write_chunk(other, 0, io.BytesIO(b"x" * 10), 10, 10)
+    storage.abort_upload(other)
+    assert list(storage.walk("u/2")) == ["u/2/big"]
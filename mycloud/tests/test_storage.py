@@ -0,0 +1,149 @@
+import os
+import pytest
+from django.core.files.base import ContentFile
+from app.core.storage import EncryptedFileSystemStorage, CorruptedFileError, HEADER
+
+
+@pytest.fixture
+def storage(settings, tmp_path):
+    settings.ENCRYPTION_SEGMENT_SIZE = 1024
+    settings.STORAGE_COMPRESSION = "off"  # проверки ниже завязаны на раскладку формата v1
+    return EncryptedFileSystemStorage(location=tmp_path / "blobs")
+
+
+@pytest.mark.parametrize("size", [0, 1, 1024, 1025, 5000])
+def test_segmented_roundtrip(storage, size):
+    data = os.urandom(size)
+    name = storage.save("a/b", ContentFile(data))
+
+    with open(storage.path(name), "rb") as fh:
+        raw = fh.read()
+    assert size < 1024 or data[:1024] not in raw
+
+    f = storage.open_decrypted(name)
+    assert f.size == size
+    assert f.read() == data
+    f.seek(1000)
+    assert f.read(100) == data[1000:1100]
+    f.close()
+
+
+def test_legacy_fernet_blob_readable(storage):
+    token = storage.fernet.encrypt(b"old format")
+    os.makedirs(storage.location, exist_ok=True)
+    with open(storage.path("legacy"), "wb") as fh:
+        fh.write(token)
+    assert storage.open_decrypted("legacy").read() == b"old format"
+
+
+def test_tampered_segment_rejected(storage):
+    name = storage.save("t", ContentFile(b"x" * 3000))
+    path = storage.path(name)
+    with open(path, "r+b") as fh:
+        fh.seek(HEADER.size + 1500)
+        b = fh.read(1)
+        fh.seek(-1, 1)
+        fh.write(bytes([b[0] ^ 1]))
+
+    f = storage.open_decrypted(name)
+    assert f.read(1000) == b"x" * 1000
+    with pytest.raises(CorruptedFileError):
+        f.read()
+
+
+def test_truncated_file_rejected(storage):
+    name = storage.save("t", ContentFile(b"y" * 3000))
+    path = storage.path(name)
+    os.truncate(path, HEADER.size + 2 * (1024 + 16))
+    with pytest.raises(CorruptedFileError):
+        storage.open_decrypted(name).read()
+
+
+@pytest.mark.parametrize("pool", ["thread", "process"])
+def test_parallel_pipeline_keeps_order(storage, settings, pool):
+    from app.core import storage as storage_mod
+    settings.ENCRYPTION_WORKERS = 3
+    settings.ENCRYPTION_POOL = pool
+    storage_mod._pool = None
+    try:
+        data = os.urandom(20 * 1024 + 5)
+        name = storage.save("p", ContentFile(data))
+        f = storage.open_decrypted(name)
+        assert b"".join(f.chunks(3000)) == data
+        f.seek(15000)
+        assert f.read(10) == data[15000:15010]
+    finally:
+        storage_mod._pool.shutdown()
+        storage_mod._pool = None
+
+
+def test_read_cache_serves_hot_segments(storage, settings, monkeypatch):
+    from app.core import readcache
+    settings.READ_CACHE_BYTES = 4096
+    settings.READ_CACHE_MAX_FILE = 1 << 20
+    cache = readcache.get_cache()
+    cache.clear()
+    data = os.urandom(3000)
+    name = storage.save("hot", ContentFile(data))
+    assert storage.open_decrypted(name).read() == data
+    assert cache.stats()["entries"] == 3
+
+    def no_decrypt(*args, **kwargs):
+        raise AssertionError("cached segment decrypted again")
+    monkeypatch.setattr("app.core.storage.open_segment", no_decrypt)
+    f = storage.open_decrypted(name)
+    f.seek(1500)
+    assert f.read() == data[1500:]
+    assert cache.stats()["hits"] >= 2
+    monkeypatch.undo()
+
+    other = storage.save("cold", ContentFile(os.urandom(3000)))
+    storage.open_decrypted(other).read()
+    assert cache.stats()["bytes"] <= 4096 and cache.stats()["evictions"] > 0
+
+    storage.delete(other)
+    assert all(key[0] != other for key in cache._data)
+
+
+@pytest.mark.parametrize("mode", ["zlib", "zstd"])
+def test_compressed_roundtrip_with_random_access(storage, settings, mode):
+    if mode == "zstd":
+        pytest.importorskip("zstandard")
+    settings.STORAGE_COMPRESSION = mode
+    data = b"".join(b"%06d,user%d,ok\n" % (i, i % 7) for i in range(2000))
+    name = storage.save("log.csv", ContentFile(data, name="log.csv"))
+    with open(storage.path(name), "rb") as fh:
+        raw = fh.read()
+    assert raw[4] in (2, 3)
+    assert len(raw) < len(data) / 2
+
+    f = storage.open_decrypted(name)
+    assert f.size == len(data)
+    f.seek(20000)
+    assert f.read(3000) == data[20000:23000]
+    assert f.read() == data[23000:]
+    storage.verify(name)
+
+    with open(storage.path(name), "r+b") as fh:
+        fh.seek(-10, os.SEEK_END)
+        fh.write(b"\x00")
+    with pytest.raises(CorruptedFileError):
+        storage.open_decrypted(name)
+
+
+def test_incompressible_content_stored_plain(storage, settings):
+    settings.STORAGE_COMPRESSION = "auto"
+    text = b"hello " * 1000
+    assert open(storage.path(storage.save("a.jpg", ContentFile(text, name="a.jpg"))), "rb").read()[4] == 1
+    assert open(storage.path(storage.save("r", ContentFile(os.urandom(5000), name="r.bin"))), "rb").read()[4] == 1
+    assert open(storage.path(storage.save("t", ContentFile(text, name="t.txt"))), "rb").read()[4] != 1
+
+
+def test_failed_stream_write_removes_own_file_only(storage):
+    existing = storage.save("dup.bin", ContentFile(b"keep me"))
+    writer = storage.open_writer("dup.bin")
+    assert writer.name != existing
+    writer.write(b"x" * 5000)
+    writer.abort()
+    assert storage.open_decrypted(existing).read() == b"keep me"
+    assert sorted(storage.listdir("")[1]) == [existing]
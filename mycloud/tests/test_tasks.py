@@ -0,0 +1,100 @@
+from datetime import timedelta
+import pytest
+from django.core import mail
+from django.utils import timezone
+from app.files.models import File
+from app.tasks import queue
+from app.tasks.models import Task
+
+calls = []
+
+
+@queue.task(name="tests.flaky", max_attempts=2)
+def flaky(value):
+    calls.append(value)
+    raise RuntimeError("boom")
+
+
+@pytest.fixture
+def queued(settings):
+    settings.TASKS_EAGER = False
+    calls.clear()
+    return settings
+
+
+def _run_ready():
+    return [queue.execute(t) for t in queue.claim("test-worker", 100)]
+
+
+@pytest.mark.django_db
+def test_reset_email_is_queued_not_sent_inline(api, user, queued):
+    r = api.post("/api/auth/password/reset-request/", {"email": user.email}, format="json")
+    assert r.status_code == 200
+    assert mail.outbox == []
+    task = Task.objects.get()
+    assert task.name == "app.users.tasks.send_password_reset" and task.args[0] == user.pk
+    assert "token" not in str(task.args)  # ссылка со сбросом не хранится в очереди
+
+    assert _run_ready() == [True]
+    assert len(mail.outbox) == 1 and "uid=" in mail.outbox[0].body
+    assert mail.outbox[0].to == [user.email]
+    assert "http://testserver/api/auth/password/reset-confirm/" in mail.outbox[0].body
+    assert not Task.objects.exists()
+
+
+@pytest.mark.django_db
+def test_retry_with_backoff_then_failed(queued):
+    queued.TASKS_RETRY_DELAY = 10
+    flaky.delay(7)
+    assert _run_ready() == [False]
+    task = Task.objects.get()
+    assert (task.status, task.attempts) == (Task.QUEUED, 1)
+    assert task.run_after > timezone.now() + timedelta(seconds=7)
+    assert _run_ready() == []  # ещё не время
+
+    Task.objects.update(run_after=timezone.now())
+    assert _run_ready() == [False]
+    task.refresh_from_db()
+    assert (task.status, task.attempts) == (Task.FAILED, 2)
+    assert "boom" in task.last_error
+    assert calls == [7, 7]
+
+
+@pytest.mark.django_db
+def test_stale_running_task_is_requeued(queued):
+    flaky.delay(1)
+    assert len(queue.claim("dead-worker", 10)) == 1
+    Task.objects.update(locked_at=timezone.now() - timedelta(hours=1))
+    assert queue.requeue_stale() == 1
+    task = Task.objects.get()
+    assert (task.status, task.attempts, task.locked_by) == (Task.QUEUED, 1, "")
+
+
+@pytest.mark.django_db
+def test_requeued_task_not_finished_by_old_worker(queued):
+    flaky.delay(1)
+    [mine] = queue.claim("slow-worker", 10)
+    assert queue.heartbeat("slow-worker", [mine.pk]) == 1
+    assert queue.heartbeat("other-worker", [mine.pk]) == 0
+
+    # блокировка истекла, задачу забрал другой воркер — итог первого её не трогает
+    Task.objects.update(locked_at=timezone.now() - timedelta(hours=1))
+    queue.requeue_stale()
+    Task.objects.update(run_after=timezone.now())
+    assert len(queue.claim("new-worker", 10)) == 1
+    assert queue.execute(mine) is False
+    task = Task.objects.get()
+    assert (task.status, task.locked_by, task.attempts) == (Task.RUNNING, "new-worker", 1)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_worker_deletes_file_in_background(api, user, uploaded_file_obj, settings):
+    settings.TASKS_EAGER = False
+    obj = File.objects.get(pk=uploaded_file_obj["id"])
+    storage, name = obj.file.storage, obj.file.name
+    assert api.delete(f"/api/files/{obj.pk}/").status_code == 204
+    assert storage.exists(name)  # запрос не ждал хранилище
+
+    assert queue.Worker(concurrency=2, poll_interval=0.01).run(once=True) == 1
+    assert not storage.exists(name)
+    assert not Task.objects.exists()
@@ -0,0 +1,116 @@
+import os
+import pytest
+from datetime import timedelta
+from django.core.management import call_command
+from django.utils import timezone
+from app.files.models import File, UploadSession
+
+
+@pytest.fixture
+def chunked(settings):
+    settings.UPLOAD_CHUNK_SIZE = 64 * 1024
+
+
+def _put(api, sid, index, data):
+    return api.generic("PUT", f"/api/uploads/{sid}/chunks/{index}/", data,
+                       content_type="application/octet-stream")
+
+
+@pytest.mark.django_db
+def test_chunked_upload_out_of_order(api, user, chunked, django_capture_on_commit_callbacks):
+    api.force_login(user)
+    data = os.urandom(150 * 1024)
+    r = api.post("/api/uploads/", {"name": "video.bin", "size": len(data)}, format="json")
+    assert r.status_code == 201, r.content
+    s = r.json()
+    cs = s["chunk_size"]
+    assert s["chunk_count"] == 3
+
+    assert _put(api, s["id"], 2, data[2 * cs:]).status_code == 200
+    assert _put(api, s["id"], 2, os.urandom(len(data) - 2 * cs)).status_code == 409
+    r = api.post(f"/api/uploads/{s['id']}/commit/")
+    assert r.status_code == 409
+    assert r.json()["missing"] == [0, 1]
+
+    assert _put(api, s["id"], 0, data[:cs - 1]).status_code == 400
+    assert _put(api, s["id"], 0, data[:cs]).status_code == 200
+    r = api.get(f"/api/uploads/{s['id']}/")
+    assert r.json()["missing"] == [1]
+    assert _put(api, s["id"], 1, data[cs:2 * cs]).status_code == 200
+
+    UploadSession.objects.filter(pk=s["id"]).update(committing=True)
+    assert _put(api, s["id"], 1, data[cs:2 * cs]).status_code == 404
+    assert api.post(f"/api/uploads/{s['id']}/commit/").status_code == 404
+    UploadSession.objects.filter(pk=s["id"]).update(committing=False)
+
+    with django_capture_on_commit_callbacks() as callbacks:
+        r = api.post(f"/api/uploads/{s['id']}/commit/")
+    assert r.status_code == 201, r.content
+    assert not UploadSession.objects.exists()
+    file_id = r.json()["id"]
+
+    assert _put(api, s["id"], 0, data[:cs]).status_code == 404
+
+    # дайджест считает задача после коммита, до неё ETag слабый
+    assert api.get(f"/api/files/{file_id}/download/")["ETag"].startswith("W/")
+    for callback in callbacks:
+        callback()
+    r = api.get(f"/api/files/{file_id}/download/")
+    assert b"".join(r.streaming_content) == data
+    from app.files.blobs import content_digest
+    assert r["ETag"] == f'"{content_digest([data])}"'
+
+
+@pytest.mark.django_db
+def test_chunk_in_flight_blocks_rewrite_and_commit(api, user, chunked):
+    api.force_login(user)
+    sid = api.post("/api/uploads/", {"name": "a", "size": 10}, format="json").json()["id"]
+    # кусок 0 сейчас пишет другой запрос
+    UploadSession.objects.filter(pk=sid).update(pending=[0])
+    assert _put(api, sid, 0, b"x" * 10).status_code == 409
+    r = api.post(f"/api/uploads/{sid}/commit/")
+    assert r.status_code == 409
+    assert r.json()["pending"] == [0]
+
+    UploadSession.objects.filter(pk=sid).update(pending=[])
+    assert _put(api, sid, 0, b"x" * 9).status_code == 400
+    assert UploadSession.objects.get(pk=sid).pending == []
+    r = api.generic("PUT", f"/api/uploads/{sid}/chunks/0/", b"x" * 5,
+                    content_type="application/octet-stream", HTTP_CONTENT_LENGTH="10")
+    assert r.status_code == 400
+    session = UploadSession.objects.get(pk=sid)
+    assert session.pending == [] and session.received == []
+    assert _put(api, sid, 0, b"x" * 10).status_code == 200
+    assert api.post(f"/api/uploads/{sid}/commit/").status_code == 201
+
+
+@pytest.mark.django_db
+def test_commit_rechecks_quota(api, user, chunked):
+    user.storage_quota = 100
+    user.save()
+    api.force_login(user)
+    sids = [api.post("/api/uploads/", {"name": n, "size": 60}, format="json").json()["id"] for n in "ab"]
+    for sid in sids:
+        assert _put(api, sid, 0, b"x" * 60).status_code == 200
+    assert api.post(f"/api/uploads/{sids[0]}/commit/").status_code == 201
+    r = api.post(f"/api/uploads/{sids[1]}/commit/")
+    assert r.status_code == 400
+    assert File.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_abort_and_cleanup(api, user, chunked):
+    api.force_login(user)
+    r = api.post("/api/uploads/", {"name": "a", "size": 10}, format="json")
+    sid = r.json()["id"]
+    name = UploadSession.objects.get(pk=sid).storage_name
+    assert api.delete(f"/api/uploads/{sid}/").status_code == 204
+    assert not File._meta.get_field("file").storage.exists(name)
+
+    r = api.post("/api/uploads/", {"name": "b", "size": 10}, format="json")
+    busy = api.post("/api/uploads/", {"name": "c", "size": 10}, format="json").json()["id"]
+    UploadSession.objects.filter(pk=busy).update(committing=True)
+    UploadSession.objects.update(updated_at=timezone.now() - timedelta(days=2))
+    call_command("cleanup_uploads", "--hours", "1")
+    assert list(UploadSession.objects.values_list("pk", flat=True)) == [UploadSession.objects.get(pk=busy).pk]
+    assert File._meta.get_field("file").storage.exists(UploadSession.objects.get(pk=busy).storage_name)
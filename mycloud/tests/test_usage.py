@@ -0,0 +1,33 @@
+import pytest
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+
+
+@pytest.mark.django_db
+def test_counters_follow_uploads_and_deletes(api, user, uploaded_file_obj):
+    user.refresh_from_db()
+    assert (user.files_count, user.files_total_size) == (1, uploaded_file_obj["size"])
+
+    api.force_login(user)
+    api.delete(f"/api/files/{uploaded_file_obj['id']}/")
+    user.refresh_from_db()
+    assert (user.files_count, user.files_total_size) == (0, 0)
+
+
+@pytest.mark.django_db
+def test_quota_enforced(api, user):
+    user.storage_quota = 10
+    user.save()
+    api.force_login(user)
+    r = api.post("/api/files/", {"file": SimpleUploadedFile("a.txt", b"x" * 8)}, format="multipart")
+    assert r.status_code == 201
+    r = api.post("/api/files/", {"file": SimpleUploadedFile("b.txt", b"x" * 8)}, format="multipart")
+    assert r.status_code == 400
+
+
+@pytest.mark.django_db
+def test_reconcile_usage(user, uploaded_file_obj):
+    type(user).objects.filter(pk=user.pk).update(files_count=7, files_total_size=0)
+    call_command("reconcile_usage")
+    user.refresh_from_db()
+    assert (user.files_count, user.files_total_size) == (1, uploaded_file_obj["size"])